@@ -0,0 +1,176 @@
+# applog.py
+# ────────────────────────────────────────────────────────────────────
+# Логирование без записи на диск в потоке asyncio:
+# • логгер пишет только в очередь (QueueHandler); файл, консоль и
+#   кольцевой буфер обслуживает фоновый поток (QueueListener)
+# • ротация файла по размеру и по возрасту — что наступит раньше
+# • сэмплирование горячих строк по категориям («1 из N»), решение
+#   принимается до создания LogRecord
+# • кольцевой буфер последних событий для админского /logs
+# • у каждого процесса свой файл: дочерние процессы (воркеры, раннер
+#   цикла) пишут в файл с суффиксом имени процесса, а не делят один
+#   файл с ротацией на всех
+# Настройки (env):
+#   LOG_MAX_BYTES  (5 MB)   LOG_BACKUPS (5)   LOG_ROTATE_SEC (86400; 0 — выкл.)
+#   LOG_RING (500)          LOG_SAMPLE ("forward=20,ice=20")
+# ────────────────────────────────────────────────────────────────────
+
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def process_log_file(log_file: str) -> str:
+    """
+    Файл лога для текущего процесса: главный пишет в log_file, дочерний —
+    в «имя.<процесс>.log» (SignalWorker-0 -> securecall_webrtc.signalworker-0.log).
+    Имя процесса стабильно при перезапуске воркера, pid — нет.
+    """
+    # parent_process() в spawn-ребёнке ещё None, пока импортируется главный
+    # модуль, а имя процесса уже выставлено
+    name = multiprocessing.current_process().name
+    if name == "MainProcess":
+        return log_file
+    root, ext = os.path.splitext(log_file)
+    tag = "".join(c if c.isalnum() or c in "-_" else "-" for c in name.lower()) or str(os.getpid())
+    return f"{root}.{tag}{ext or '.log'}"
+
+
+class SizeTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler, который ротирует ещё и раз в max_age секунд."""
+
+    def __init__(self, filename: str, max_bytes: int, backups: int, max_age: float):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+        self.max_age = max_age
+        self._opened = time.time()
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.max_age > 0 and time.time() - self._opened >= self.max_age:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self._opened = time.time()
+
+
+class RingBufferHandler(logging.Handler):
+    """Последние N событий в памяти (для /logs)."""
+
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.records: deque = deque(maxlen=max(1, capacity))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append({
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        })
+
+    def recent(self, n: Optional[int] = None, level: int = logging.NOTSET) -> List[dict]:
+        items = [r for r in self.records if logging.getLevelName(r["level"]) >= level] if level else list(self.records)
+        return items[-n:] if n else items
+
+
+class Sampler:
+    """
+    «1 из N» по категории. Вызывается до log.info(...), так что
+    пропущенная строка не стоит ни форматирования, ни LogRecord.
+    """
+
+    def __init__(self, logger: logging.Logger, rates: Dict[str, int]):
+        self.logger = logger
+        self.rates = rates
+        self.seen: Dict[str, int] = {}
+        self.suppressed: Dict[str, int] = {}
+
+    def __call__(self, cat: str, level: int = logging.INFO) -> bool:
+        if not self.logger.isEnabledFor(level):
+            return False
+        n = self.seen.get(cat, 0)
+        self.seen[cat] = n + 1
+        rate = self.rates.get(cat, 1)
+        if rate <= 1 or n % rate == 0:
+            return True
+        self.suppressed[cat] = self.suppressed.get(cat, 0) + 1
+        return False
+
+
+def parse_rates(spec: str) -> Dict[str, int]:
+    """'forward=20,ice=5' -> {'forward': 20, 'ice': 5}"""
+    rates: Dict[str, int] = {}
+    for part in spec.split(","):
+        k, _, v = part.partition("=")
+        if k.strip() and v.strip().isdigit():
+            rates[k.strip()] = max(1, int(v))
+    return rates
+
+
+class AsyncLog:
+    """Связка: логгер → очередь → фоновый поток с обработчиками."""
+
+    def __init__(self, logger: logging.Logger, log_file: str, level: int):
+        self.logger = logger
+        self.queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        fmt = logging.Formatter(FORMAT)
+
+        self.path = process_log_file(log_file)
+        self.file = SizeTimeRotatingFileHandler(
+            self.path,
+            max_bytes=_env_int("LOG_MAX_BYTES", 5 * 1024 * 1024),
+            backups=_env_int("LOG_BACKUPS", 5),
+            max_age=_env_int("LOG_ROTATE_SEC", 86400),
+        )
+        self.file.setFormatter(fmt)
+        stream = logging.StreamHandler()
+        stream.setFormatter(fmt)
+        self.ring = RingBufferHandler(_env_int("LOG_RING", 500))
+
+        self.listener = logging.handlers.QueueListener(
+            self.queue, self.file, stream, self.ring, respect_handler_level=True
+        )
+        logger.setLevel(level)
+        logger.addHandler(logging.handlers.QueueHandler(self.queue))
+        self.sample = Sampler(logger, parse_rates(os.environ.get("LOG_SAMPLE", "forward=20,ice=20")))
+
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        # дописывает очередь и останавливает поток (повторный вызов безопасен)
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.queue.qsize(),
+            "ring": len(self.ring.records),
+            "sampled": dict(self.sample.rates),
+            "suppressed": dict(self.sample.suppressed),
+        }
+
+
+__all__ = [
+    "AsyncLog",
+    "RingBufferHandler",
+    "Sampler",
+    "SizeTimeRotatingFileHandler",
+    "parse_rates",
+    "process_log_file",
+]
@@ -0,0 +1,179 @@
+# assets.py
+# ────────────────────────────────────────────────────────────────────
+# Кэш статики в памяти (собирается один раз при старте сервера):
+# • каждый файл держим как есть + gzip + brotli (если есть модуль brotli)
+# • сильный ETag по SHA-256 содержимого, 304 без обращения к диску
+# • index.html ссылается на ресурсы с ?v=<хэш>: такие URL отдаём как
+#   immutable на год; без ?v= — no-cache с ревалидацией по ETag
+# • JS собирается в один bundle.<хэш>.js (bundle.py) и index.html
+#   переписывается на него; исходные /app.js и /js/* остаются доступны,
+#   а с bundle=False (DEBUG=1) index.html грузит их как раньше
+# • заголовки ответа собраны заранее, на запрос только выбор варианта
+# ────────────────────────────────────────────────────────────────────
+
+import gzip
+import hashlib
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from aiohttp import web
+
+from bundle import build_bundle
+
+try:  # необязательная зависимость
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover
+    brotli = None
+
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+
+MIN_COMPRESS_SIZE = 512  # мелочь не сжимаем
+
+_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".json": "application/json",
+}
+
+
+def _content_type(path: Path) -> str:
+    return _TYPES.get(path.suffix.lower()) or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+
+class Asset:
+    __slots__ = ("name", "etag", "version", "variants", "content_type", "immutable", "headers", "headers_304")
+
+    def __init__(self, name: str, data: bytes, content_type: str, immutable: bool = False):
+        self.name = name
+        self.immutable = immutable  # хэш уже в имени файла
+        digest = hashlib.sha256(data).hexdigest()
+        self.etag = f'"{digest[:32]}"'
+        self.version = digest[:12]
+        self.content_type = content_type
+        # encoding -> body; "identity" есть всегда
+        self.variants: Dict[str, bytes] = {"identity": data}
+        if len(data) >= MIN_COMPRESS_SIZE:
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz) < len(data):
+                self.variants["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                if len(br) < len(data):
+                    self.variants["br"] = br
+        # готовые заголовки: (versioned, encoding) -> 200, versioned -> 304
+        self.headers: Dict[Tuple[bool, str], Dict[str, str]] = {}
+        self.headers_304: Dict[bool, Dict[str, str]] = {}
+        for versioned in (False, True):
+            base = {
+                "ETag": self.etag,
+                "Cache-Control": CACHE_IMMUTABLE if versioned or immutable else CACHE_REVALIDATE,
+                "Vary": "Accept-Encoding",
+            }
+            self.headers_304[versioned] = base
+            for enc in self.variants:
+                h = dict(base)
+                if enc != "identity":
+                    h["Content-Encoding"] = enc
+                h["Content-Type"] = content_type
+                self.headers[(versioned, enc)] = h
+
+
+class AssetCache:
+    """Набор Asset'ов по URL-пути ("/", "/style.css", "/js/rtc.js", ...)."""
+
+    def __init__(self, static_dir: Path, bundle: bool = True):
+        self.static_dir = Path(static_dir)
+        self.bundle = bundle
+        self.bundle_url: Optional[str] = None
+        self._assets: Dict[str, Asset] = {}
+        self.hits = 0
+        self.not_modified = 0
+
+    def add(self, url: str, data: bytes, content_type: str, immutable: bool = False) -> Asset:
+        asset = Asset(url, data, content_type, immutable)
+        self._assets[url] = asset
+        return asset
+
+    def add_file(self, url: str, rel: str) -> Optional[Asset]:
+        path = self.static_dir / rel
+        if not path.is_file():
+            return None
+        return self.add(url, path.read_bytes(), _content_type(path))
+
+    def build(self) -> "AssetCache":
+        self._assets.clear()
+        for name in ("style.css", "icon.svg", "app.js"):
+            self.add_file("/" + name, name)
+        js_dir = self.static_dir / "js"
+        if js_dir.is_dir():
+            for p in sorted(js_dir.glob("*.js")):
+                self.add_file("/js/" + p.name, "js/" + p.name)
+        self.bundle_url = None
+        if self.bundle:
+            res = build_bundle(self.static_dir)
+            if res is not None:
+                name, data = res
+                self.bundle_url = "/" + name
+                self.add(self.bundle_url, data, _TYPES[".js"], immutable=True)
+        self._build_index()
+        return self
+
+    def _build_index(self) -> None:
+        """index.html последним: подставляем ?v=<хэш> в ссылки на ресурсы."""
+        path = self.static_dir / "index.html"
+        if not path.is_file():
+            return
+        html = path.read_text(encoding="utf-8")
+        if self.bundle_url:
+            html = html.replace('"/app.js"', f'"{self.bundle_url}"')
+        for url in ("/style.css", "/icon.svg", "/app.js"):
+            a = self._assets.get(url)
+            if a is not None:
+                html = html.replace(f'"{url}"', f'"{url}?v={a.version}"')
+        self.add("/", html.encode("utf-8"), _content_type(path))
+
+    def get(self, url: str) -> Optional[Asset]:
+        return self._assets.get(url)
+
+    def urls(self):
+        return list(self._assets)
+
+    def respond(self, request: web.Request, url: str) -> web.StreamResponse:
+        asset = self._assets.get(url)
+        if asset is None:
+            raise web.HTTPNotFound()
+
+        versioned = asset.immutable or request.query.get("v") == asset.version
+
+        inm = request.headers.get("If-None-Match")
+        if inm and (inm == asset.etag or asset.etag in inm):
+            self.not_modified += 1
+            return web.Response(status=304, headers=asset.headers_304[versioned])
+
+        ae = request.headers.get("Accept-Encoding", "")
+        variants = asset.variants
+        if "br" in variants and "br" in ae:
+            enc = "br"
+        elif "gzip" in variants and "gzip" in ae:
+            enc = "gzip"
+        else:
+            enc = "identity"
+        self.hits += 1
+        return web.Response(body=variants[enc], headers=asset.headers[(versioned, enc)])
+
+    def stats(self) -> dict:
+        return {
+            "assets": len(self._assets),
+            "bytes": sum(len(a.variants["identity"]) for a in self._assets.values()),
+            "hits": self.hits,
+            "not_modified": self.not_modified,
+            "brotli": brotli is not None,
+            "bundle": self.bundle_url,
+        }
+
+
+__all__ = ["Asset", "AssetCache"]
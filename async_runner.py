@@ -16,6 +16,22 @@ Usage:
 
     runner.stop()
 
+Loop implementation is chosen with ``loop="auto" | "uvloop" | "asyncio"``
+(default: the ``ASYNC_LOOP`` env var, else ``"auto"``). ``auto`` uses uvloop
+when it is installed and falls back to the stock asyncio loop otherwise.
+
+Loop health is sampled from inside the loop and can be read from any thread
+(e.g. the Tk side) with ``runner.stats()``:
+
+* lag sampler: every ``lag_interval`` seconds a timer measures how late it
+  fired; stalls above ``stall_threshold`` are counted. There is one sampler
+  per loop (``sample_loop_lag``): code running on the loop, such as the
+  server's metrics, subscribes to the same samples instead of timing its own;
+* slow-callback detector: when ``slow_callback`` is set (or ``ASYNC_SLOW_CB_MS``),
+  the loop runs in debug mode with ``slow_callback_duration`` at that value and
+  the "Executing ... took N seconds" warnings are collected. Debug mode has a
+  real cost, so this is off by default.
+
 Also supports context manager:
 
     with AsyncRunner() as runner:
@@ -26,16 +42,183 @@ Also supports context manager:
 from __future__ import annotations
 
 import asyncio
+import collections
 import concurrent.futures
+import logging
+import os
 import threading
+import time
 import traceback
-from typing import Any, Callable, Optional
+import weakref
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+try:  # optional: faster event loop (not available on Windows)
+    import uvloop  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    uvloop = None  # type: ignore
+
+LOOP_IMPLS = ("auto", "uvloop", "asyncio")
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    try:
+        return float(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def new_event_loop(impl: str = "auto") -> Tuple[asyncio.AbstractEventLoop, str]:
+    """Create a fresh event loop of the requested kind.
+
+    Returns ``(loop, name)`` where ``name`` is the implementation actually used
+    ("uvloop" or "asyncio"). Asking for uvloop when it is missing falls back to
+    asyncio rather than failing.
+    """
+    if impl not in LOOP_IMPLS:
+        raise ValueError(f"unknown loop implementation: {impl!r} (expected one of {LOOP_IMPLS})")
+    if impl != "asyncio" and uvloop is not None:
+        return uvloop.new_event_loop(), "uvloop"
+    return asyncio.new_event_loop(), "asyncio"
+
+
+class LoopStats:
+    """Loop-health counters written by the loop thread, read from any thread."""
+
+    def __init__(self, keep: int = 20) -> None:
+        self._lock = threading.Lock()
+        self.impl = ""
+        self.debug = False
+        self.samples = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.lag_sum = 0.0
+        self.stalls = 0
+        self.slow_callbacks = 0
+        self.recent_slow: Deque[Tuple[float, float, str]] = collections.deque(maxlen=keep)
+        self._listeners: list = []
+
+    def subscribe(self, fn: Callable[[float], None]) -> None:
+        """Call ``fn(lag_seconds)`` on the loop thread after every sample."""
+        if fn not in self._listeners:
+            self._listeners.append(fn)
+
+    def add_lag(self, lag: float, stall_threshold: float) -> None:
+        with self._lock:
+            self.samples += 1
+            self.lag_last = lag
+            self.lag_sum += lag
+            if lag > self.lag_max:
+                self.lag_max = lag
+            if lag >= stall_threshold:
+                self.stalls += 1
+        for fn in self._listeners:
+            try:
+                fn(lag)
+            except Exception:
+                logging.getLogger(__name__).exception("loop lag listener failed")
+
+    def add_slow(self, seconds: float, what: str) -> None:
+        with self._lock:
+            self.slow_callbacks += 1
+            self.recent_slow.append((time.time(), seconds, what))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self.samples
+            return {
+                "loop": self.impl,
+                "debug": self.debug,
+                "lag_samples": n,
+                "lag_last_ms": round(self.lag_last * 1000, 3),
+                "lag_avg_ms": round(self.lag_sum / n * 1000, 3) if n else 0.0,
+                "lag_max_ms": round(self.lag_max * 1000, 3),
+                "stalls": self.stalls,
+                "slow_callbacks": self.slow_callbacks,
+                "recent_slow": [
+                    {"ts": round(ts, 3), "ms": round(sec * 1000, 1), "what": what}
+                    for ts, sec, what in self.recent_slow
+                ],
+            }
+
+
+# One sampler per loop; whoever starts it first decides interval and threshold
+_SAMPLERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LoopStats]" = weakref.WeakKeyDictionary()
+
+
+def sample_loop_lag(
+    loop: asyncio.AbstractEventLoop,
+    interval: float = 0.5,
+    stall_threshold: float = 0.1,
+    stats: Optional[LoopStats] = None,
+) -> LoopStats:
+    """Start the lag sampler of ``loop`` (once) and return its stats.
+
+    The sampler is a plain call_later chain (no task): lag = how late the
+    timer fired. A second call for the same loop returns the running
+    sampler's stats. Call from the loop's thread.
+    """
+    running = _SAMPLERS.get(loop)
+    if running is not None:
+        return running
+    stats = stats if stats is not None else LoopStats()
+    _SAMPLERS[loop] = stats
+
+    def tick(due: float) -> None:
+        stats.add_lag(max(0.0, loop.time() - due), stall_threshold)
+        if not loop.is_closed():
+            loop.call_later(interval, tick, loop.time() + interval)
+
+    loop.call_later(interval, tick, loop.time() + interval)
+    return stats
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """Catches asyncio's debug-mode "Executing <handle> took N seconds" warnings.
+
+    Only records emitted from the runner's own loop thread are counted.
+    """
+
+    def __init__(self, stats: LoopStats, thread_id: int) -> None:
+        super().__init__(logging.WARNING)
+        self.stats = stats
+        self.thread_id = thread_id
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.thread != self.thread_id or not str(record.msg).startswith("Executing"):
+            return
+        args = record.args if isinstance(record.args, tuple) else ()
+        if len(args) >= 2 and isinstance(args[-1], (int, float)):
+            self.stats.add_slow(float(args[-1]), str(args[0])[:200])
 
 
 class AsyncRunner:
     """Run an asyncio loop in a dedicated thread."""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        loop: Optional[str] = None,
+        lag_interval: float = 0.5,
+        stall_threshold: float = 0.1,
+        slow_callback: Optional[float] = None,
+    ) -> None:
+        """
+        Args:
+            loop: "auto", "uvloop" or "asyncio" (default: ``ASYNC_LOOP`` env or "auto").
+            lag_interval: seconds between lag samples; 0 disables the sampler.
+            stall_threshold: lag (seconds) counted as a stall.
+            slow_callback: debug-mode slow-callback threshold in seconds
+                (default: ``ASYNC_SLOW_CB_MS`` env / 1000, else disabled).
+        """
+        self.loop_impl = (loop or os.environ.get("ASYNC_LOOP") or "auto").lower()
+        if self.loop_impl not in LOOP_IMPLS:
+            raise ValueError(f"unknown loop implementation: {self.loop_impl!r}")
+        self.lag_interval = lag_interval
+        self.stall_threshold = stall_threshold
+        if slow_callback is None:
+            ms = _env_float("ASYNC_SLOW_CB_MS", None)
+            slow_callback = ms / 1000.0 if ms else None
+        self.slow_callback = slow_callback
+        self._stats = LoopStats()
         self._loop: asyncio.AbstractEventLoop | None = None
         self._thread: threading.Thread | None = None
         self._ready_evt = threading.Event()
@@ -55,11 +238,23 @@ class AsyncRunner:
             self._stopped_evt.clear()
             self._exc_in_thread = None
 
+            self._stats = LoopStats()
+
             def target() -> None:
+                slow_handler = None
                 try:
-                    loop = asyncio.new_event_loop()
+                    loop, impl = new_event_loop(self.loop_impl)
+                    self._stats.impl = impl
+                    if self.slow_callback:
+                        loop.set_debug(True)
+                        loop.slow_callback_duration = self.slow_callback
+                        self._stats.debug = True
+                        slow_handler = _SlowCallbackHandler(self._stats, threading.get_ident())
+                        logging.getLogger("asyncio").addHandler(slow_handler)
                     self._loop = loop
                     asyncio.set_event_loop(loop)
+                    if self.lag_interval > 0:
+                        sample_loop_lag(loop, self.lag_interval, self.stall_threshold, self._stats)
                     self._ready_evt.set()
                     # Run forever until stop() posts loop.stop()
                     loop.run_forever()
@@ -72,6 +267,8 @@ class AsyncRunner:
                     self._exc_in_thread = e
                     traceback.print_exc()
                 finally:
+                    if slow_handler is not None:
+                        logging.getLogger("asyncio").removeHandler(slow_handler)
                     self._stopped_evt.set()
 
             self._thread = threading.Thread(target=target, name="AsyncLoop", daemon=True)
@@ -131,13 +328,27 @@ class AsyncRunner:
         Returns a concurrent.futures.Future (use .result() to wait).
         """
         loop = self._ensure_running_loop()
-        return asyncio.run_coroutine_threadsafe(loop.run_in_executor(None, lambda: func(*args, **kwargs)), loop)
+
+        # run_in_executor() returns a Future and must be called on the loop
+        # thread, so wrap it in a coroutine for run_coroutine_threadsafe().
+        async def _in_executor() -> Any:
+            return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+        return asyncio.run_coroutine_threadsafe(_in_executor(), loop)
 
     def run_coroutine(self, coro: "asyncio.coroutines.Coroutine[Any, Any, Any]", timeout: Optional[float] = None) -> Any:
         """Submit a coroutine and (optionally) wait for its result with a timeout."""
         fut = self.submit(coro)
         return fut.result(timeout=timeout)
 
+    # -------------------------- loop health --------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of loop health (thread-safe; cheap enough for a Tk ``after`` tick)."""
+        snap = self._stats.snapshot()
+        snap["running"] = self.is_running()
+        return snap
+
     # ---------------------------- helpers ----------------------------
 
     def is_running(self) -> bool:
@@ -191,4 +402,4 @@ class AsyncRunner:
 
 
 # Backwards compatible alias if someone imported AsyncLoopRunner, etc.
-__all__ = ["AsyncRunner"]
+__all__ = ["AsyncRunner", "LoopStats", "new_event_loop", "sample_loop_lag"]
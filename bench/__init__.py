@@ -0,0 +1 @@
+"""Benchmarks for the SecureCall signaling server (run from the repo root)."""
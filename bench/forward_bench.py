@@ -0,0 +1,68 @@
+"""Microbenchmark: relaying an addressed frame (offer with a large SDP).
+
+Compares the previous path (``dict(data)`` + ``from`` + ``json.dumps``) with
+the passthrough path (``wire.with_field`` on the original frame). Both
+include the inbound ``json.loads`` that the server performs on every frame.
+
+Usage:
+
+    python -m bench.forward_bench [--messages 20000] [--sdp-kb 8]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import wire
+
+
+def _frame(sdp_kb: int) -> str:
+    line = "a=candidate:1 1 udp 2122260223 192.168.1.2 54321 typ host generation 0\r\n"
+    sdp = "v=0\r\n" + line * (sdp_kb * 1024 // len(line))
+    return json.dumps({"type": "offer", "to": "f" * 32, "sdp": sdp, "sdpType": "offer", "ts": int(time.time() * 1000)})
+
+
+def run(messages: int = 20_000, sdp_kb: int = 8) -> dict:
+    raw = _frame(sdp_kb)
+    pid = "a" * 32
+
+    t0 = time.perf_counter()
+    for _ in range(messages):
+        data = json.loads(raw)
+        payload = dict(data)
+        payload["from"] = pid
+        json.dumps(payload)
+    legacy_us = (time.perf_counter() - t0) * 1e6 / messages
+
+    t0 = time.perf_counter()
+    for _ in range(messages):
+        json.loads(raw)
+        out = wire.with_field(raw, wire.JSON, "from", pid)
+    passthrough_us = (time.perf_counter() - t0) * 1e6 / messages
+
+    if json.loads(out)["from"] != pid:
+        raise SystemExit("passthrough frame lost the sender id")
+
+    return {
+        "messages": messages,
+        "frame_bytes": len(raw),
+        "legacy_us_per_msg": round(legacy_us, 2),
+        "passthrough_us_per_msg": round(passthrough_us, 2),
+        "speedup": round(legacy_us / passthrough_us, 2) if passthrough_us else None,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--messages", type=int, default=20_000)
+    ap.add_argument("--sdp-kb", type=int, default=8)
+    args = ap.parse_args()
+    res = run(args.messages, args.sdp_kb)
+    for k, v in res.items():
+        print(f"{k:>24}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""Headless load generator for the signaling server.
+
+Boots ``core.start_http_server`` in a child process and drives it with
+R rooms x P simulated peers. Every peer joins, sets a name, runs the
+offer/answer exchange with the peers already in the room, sends ICE
+(batched like the browser, or one frame per candidate with ``--ice-trickle``),
+exchanges E2E keys, sends ``chat-e2e-multi`` lines and, with ``--churn``,
+periodically leaves and rejoins.
+
+The server child applies bench-only bypasses that never exist in a normal
+run: ``REJECT_NON_BROWSER`` is turned off (the generator is not a browser)
+and the per-IP admission cap is lifted (every peer comes from 127.0.0.1).
+The anti-flood limiter stays on unless ``--unlimited`` is given; its burst
+covers a full-mesh join, so a joiner calls every peer back to back.
+
+Forward latency is measured end to end for ``offer``/``answer``/``key``:
+the sender stamps ``bench_t`` (``time.perf_counter()``, monotonic and shared
+between processes on the same host) and the receiver subtracts it.
+
+Usage:
+
+    python -m bench.loadgen [--rooms 10] [--peers 5] [--duration 20]
+                            [--format json|msgpack] [--churn 8] [--out run.json]
+
+The result is one JSON document (stdout, or ``--out``), suitable for
+diffing between releases.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import platform
+import random
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+import aiohttp
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+SDP_LINE = "a=candidate:1 1 udp 2122260223 192.168.1.2 54321 typ host generation 0\r\n"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _usage() -> dict:
+    if resource is None:
+        return {}
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss: KiB on Linux, bytes on macOS
+    rss_mb = ru.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {"cpu_user_s": ru.ru_utime, "cpu_sys_s": ru.ru_stime, "rss_max_mb": round(rss_mb, 1)}
+
+
+# ─── Server child ───────────────────────────────────────────────────
+def _server_main(port: int, max_peers: int, unlimited: bool, conn) -> None:
+    os.environ.setdefault("OUTBOX_MAX", "1024")
+    import core
+
+    core.HTTP_PORT = port
+    core.REJECT_NON_BROWSER = False            # bench-only: headless clients
+    core.ADMISSION.max_per_ip = 1 << 30        # bench-only: everyone is 127.0.0.1
+    if unlimited:
+        core.WS_LIMITER.rate = core.WS_LIMITER.burst = 1e9
+
+    async def run() -> None:
+        await core.start_http_server(max_peers=max_peers)
+        base = _usage()
+        conn.send("ready")
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        end = _usage()
+        conn.send({
+            "cpu_user_s": round(end.get("cpu_user_s", 0) - base.get("cpu_user_s", 0), 3),
+            "cpu_sys_s": round(end.get("cpu_sys_s", 0) - base.get("cpu_sys_s", 0), 3),
+            "rss_max_mb": end.get("rss_max_mb"),
+            "ws_rejected": core.WS_LIMITER.denied,
+            "replay_rejected": core.REPLAY_GUARD.rejected,
+            "outbox_disconnected": core.OUTBOX_STATS["disconnected"],
+        })
+
+    asyncio.run(run())
+
+
+# ─── Simulated peer ─────────────────────────────────────────────────
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.joins = 0
+        self.errors = 0
+        self.latency: Dict[str, List[float]] = {"offer": [], "answer": [], "key": []}
+
+
+class Peer:
+    def __init__(self, http: aiohttp.ClientSession, url: str, room: str, fmt: str, stats: Stats, args):
+        self.http = http
+        self.url = url
+        self.room = room
+        self.fmt = fmt
+        self.stats = stats
+        self.args = args
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.id = ""
+        self.others: set = set()
+        self._ts = 0
+        self._bg: set = set()
+        self._sdp = "v=0\r\n" + SDP_LINE * max(1, args.sdp_bytes // len(SDP_LINE))
+
+    def _next_ts(self) -> int:
+        self._ts = max(self._ts + 1, int(time.time() * 1000))
+        return self._ts
+
+    async def _send(self, obj: dict) -> None:
+        ws = self.ws
+        if ws is None or ws.closed:
+            return
+        if self.fmt == "msgpack":
+            await ws.send_bytes(msgpack.packb(obj, use_bin_type=True))
+        else:
+            await ws.send_str(json.dumps(obj))
+        self.stats.sent += 1
+
+    def _decode(self, msg) -> Optional[dict]:
+        if msg.type == aiohttp.WSMsgType.BINARY:
+            return msgpack.unpackb(msg.data, raw=False)
+        if msg.type == aiohttp.WSMsgType.TEXT:
+            return json.loads(msg.data)
+        return None
+
+    async def _ice(self, to: str) -> None:
+        cands = [{"candidate": f"candidate:{i} 1 udp 2122260223 10.0.0.{i} {50000 + i} typ host",
+                  "sdpMid": "0", "sdpMLineIndex": 0} for i in range(self.args.ice)]
+        if not self.args.ice_trickle:
+            # like static/js/rtc.js: one batched frame per gathering burst
+            await asyncio.sleep(0.025)
+            await self._send({"type": "ice", "to": to, "candidates": cands + [None], "ts": self._next_ts()})
+            return
+        for cand in cands:
+            await self._send({"type": "ice", "to": to, "candidate": cand, "ts": self._next_ts()})
+            await asyncio.sleep(0.005)
+        await self._send({"type": "ice", "to": to, "candidate": None, "ts": self._next_ts()})
+
+    async def _call(self, to: str) -> None:
+        await self._send({"type": "offer", "to": to, "sdp": self._sdp, "sdpType": "offer",
+                          "ts": self._next_ts(), "bench_t": time.perf_counter()})
+        await self._send({"type": "key", "to": to, "pub": os.urandom(65).hex(),
+                          "ts": self._next_ts(), "bench_t": time.perf_counter()})
+        await self._ice(to)
+
+    async def _on(self, m: dict) -> None:
+        typ = m.get("type")
+        now = time.perf_counter()
+        if "bench_t" in m and typ in self.stats.latency:
+            self.stats.latency[typ].append((now - m["bench_t"]) * 1000.0)
+        if typ == "roster-add":
+            self.others.add(m.get("id"))
+        elif typ == "roster-remove":
+            self.others.discard(m.get("id"))
+        elif typ == "offer":
+            # reply in the background so the receive loop keeps timestamps honest
+            t = asyncio.ensure_future(self._answer(m.get("from")))
+            self._bg.add(t)
+            t.add_done_callback(self._bg.discard)
+
+    async def _answer(self, frm: str) -> None:
+        await self._send({"type": "answer", "to": frm, "sdp": self._sdp, "sdpType": "answer",
+                          "ts": self._next_ts(), "bench_t": time.perf_counter()})
+        await self._ice(frm)
+
+    async def _chat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(random.expovariate(1.0 / self.args.chat_every))
+            targets = [p for p in self.others if p]
+            if not targets:
+                continue
+            items = [{"to": p, "iv": os.urandom(12).hex(), "ct": os.urandom(48).hex()} for p in targets]
+            await self._send({"type": "chat-e2e-multi", "items": items, "ts": self._next_ts()})
+
+    async def session(self, lifetime: float) -> None:
+        protocols = ["mp.token." + self.room] if self.fmt == "msgpack" else ["token." + self.room]
+        try:
+            self.ws = await self.http.ws_connect(self.url, protocols=protocols, max_msg_size=0)
+        except Exception:
+            self.stats.errors += 1
+            await asyncio.sleep(0.5)
+            return
+        tasks: List[asyncio.Task] = []
+        try:
+            hello = self._decode(await self.ws.receive(timeout=5))
+            if not hello or hello.get("type") != "hello":
+                self.stats.errors += 1
+                return
+            self.stats.joins += 1
+            self.id = hello["id"]
+            self.others = {p["id"] for p in hello.get("roster", []) if p["id"] != self.id}
+            await self._send({"type": "name", "name": f"bench-{self.id[:6]}"})
+
+            async def setup() -> None:
+                for pid in list(self.others):
+                    await self._call(pid)
+
+            tasks = [asyncio.ensure_future(setup()), asyncio.ensure_future(self._chat_loop())]
+            end = time.perf_counter() + lifetime
+            while True:
+                left = end - time.perf_counter()
+                if left <= 0:
+                    break
+                try:
+                    msg = await self.ws.receive(timeout=left)
+                except asyncio.TimeoutError:
+                    break
+                m = self._decode(msg)
+                if m is None:
+                    if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                        self.stats.errors += 1
+                        break
+                    continue
+                self.stats.received += 1
+                await self._on(m)
+        except Exception:
+            self.stats.errors += 1
+        finally:
+            for t in tasks + list(self._bg):
+                t.cancel()
+            await self.ws.close()
+
+    async def run(self, deadline: float) -> None:
+        while True:
+            left = deadline - time.perf_counter()
+            if left <= 0.5:
+                return
+            life = min(left, random.expovariate(1.0 / self.args.churn)) if self.args.churn else left
+            await self.session(life)
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * (len(values) - 1) + 0.5))], 3)
+
+
+def _summary(values: List[float]) -> dict:
+    return {"n": len(values), "p50_ms": _pct(values, 0.50), "p90_ms": _pct(values, 0.90),
+            "p99_ms": _pct(values, 0.99), "max_ms": round(max(values), 3) if values else None}
+
+
+async def _drive(port: int, args) -> dict:
+    stats = Stats()
+    url = f"http://127.0.0.1:{port}/ws"
+    conn = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=conn) as http:
+        peers = [Peer(http, url, f"bench-room-{r}", args.format, stats, args)
+                 for r in range(args.rooms) for _ in range(args.peers)]
+        t0 = time.perf_counter()
+        deadline = t0 + args.duration
+        # staggered joins, like people arriving
+        tasks = []
+        for p in peers:
+            tasks.append(asyncio.ensure_future(p.run(deadline)))
+            await asyncio.sleep(args.join_gap)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+
+    all_lat = [x for v in stats.latency.values() for x in v]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "joins": stats.joins,
+        "errors": stats.errors,
+        "frames_sent": stats.sent,
+        "frames_received": stats.received,
+        "throughput_recv_per_s": round(stats.received / elapsed, 1) if elapsed else None,
+        "forward_latency": dict({"all": _summary(all_lat)}, **{k: _summary(v) for k, v in stats.latency.items()}),
+    }
+
+
+def run(args) -> dict:
+    if args.format == "msgpack" and msgpack is None:
+        raise SystemExit("--format msgpack needs the msgpack module")
+    port = args.port or _free_port()
+    ctx = mp.get_context("spawn")
+    parent, child = ctx.Pipe()
+    proc = ctx.Process(target=_server_main, args=(port, args.peers, args.unlimited, child), daemon=True)
+    proc.start()
+    try:
+        if not parent.poll(30) or parent.recv() != "ready":
+            raise SystemExit("server did not start")
+        client = asyncio.run(_drive(port, args))
+        parent.send("stop")
+        server = parent.recv() if parent.poll(10) else {}
+    finally:
+        proc.terminate()
+        proc.join(timeout=5)
+
+    if server.get("cpu_user_s") is not None and client["elapsed_s"]:
+        server["cpu_pct"] = round(100.0 * (server["cpu_user_s"] + server["cpu_sys_s"]) / client["elapsed_s"], 1)
+    return {
+        "config": {k: getattr(args, k) for k in ("rooms", "peers", "duration", "format", "churn", "ice",
+                                                 "ice_trickle", "sdp_bytes", "chat_every", "unlimited")},
+        "env": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "client": client,
+        "server": server,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rooms", type=int, default=10)
+    ap.add_argument("--peers", type=int, default=5, help="peers per room (server caps rooms at 10)")
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds")
+    ap.add_argument("--format", choices=("json", "msgpack"), default="json")
+    ap.add_argument("--churn", type=float, default=0.0, help="mean peer lifetime in seconds (0 = no churn)")
+    ap.add_argument("--ice", type=int, default=6, help="ICE candidates per call")
+    ap.add_argument("--ice-trickle", action="store_true", help="one frame per candidate (pre-batching client)")
+    ap.add_argument("--sdp-bytes", type=int, default=3000)
+    ap.add_argument("--chat-every", type=float, default=2.0, help="mean seconds between chat lines per peer")
+    ap.add_argument("--join-gap", type=float, default=0.01, help="pause between peer joins")
+    ap.add_argument("--unlimited", action="store_true", help="disable the WS anti-flood limiter in the server")
+    ap.add_argument("--port", type=int, default=0)
+    ap.add_argument("--out", help="write the JSON result here instead of stdout")
+    args = ap.parse_args()
+
+    res = run(args)
+    doc = json.dumps(res, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(doc + "\n")
+    print(doc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""Microbenchmarks for the per-message hot path of the signaling server.
+
+Unit cases run in-process on an in-memory fake socket; the HTTP/WS cases go
+through ``core.build_app()`` on aiohttp's ``TestServer`` (loopback socket,
+full middleware chain, real frame writes).
+
+Cases:
+
+* ``validate_ts``            - anti-replay check for an addressed message
+* ``antiflood``              - single per-type token-bucket charge
+* ``dispatch_offer``         - ``core._dispatch`` of an offer (decode, table, relay)
+* ``dispatch_chat``          - ``core._dispatch`` of a room chat line
+* ``broadcast_N``            - ``core._broadcast`` to N = 2, 5, 10 sessions,
+                               until every writer task has sent its frame
+* ``http_healthz``           - GET /healthz through both middlewares
+* ``http_asset``             - GET /style.css (asset cache, gzip variant)
+* ``ws_forward``             - offer from one WS client to another, end to end
+
+Usage:
+
+    python -m bench.micro                      # run, compare with bench/baseline.json
+    python -m bench.micro --save               # run and store the baseline
+    python -m bench.micro --threshold 0.25     # allowed slowdown (default 25 %)
+    python -m bench.micro --only broadcast     # substring filter
+
+Each case is timed ``--repeat`` times; the median run is reported together
+with its noise (median absolute deviation, relative). The whole suite runs
+``--rounds`` times and every case keeps its fastest round, so a burst of
+interference on a shared host hits one round, not the result. Before and
+after each round a fixed pure-Python ``reference`` workload is timed (the
+fastest is kept). When it is slower than at baseline time (CPU steal,
+frequency scaling), results are scaled by reference(now) / reference(baseline)
+so that does not read as a regression; a faster host is compared unscaled, so
+a lucky reference run cannot make the gate stricter. A case fails (exit code
+1) when it is slower than its baseline by more than ``threshold + 3 * noise``,
+where noise is the larger of the run's, the baseline's and a floor (3 %, 10 %
+for the socket cases). Baselines are still machine-specific: re-save them on
+the machine that runs the comparison.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import core
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+class FakeWS:
+    """Stands in for web.WebSocketResponse: writes go nowhere."""
+
+    closed = False
+
+    async def send_str(self, data: str) -> None:
+        pass
+
+    async def send_bytes(self, data: bytes) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def ping(self) -> None:
+        pass
+
+
+def _room(n: int, key: str) -> Tuple[core.Room, List[core.PeerSession]]:
+    room = core.Room(key, max(n, 2))
+    sessions = []
+    for i in range(n):
+        sess = core.PeerSession(f"{key}-{i:02d}-" + "0" * 24, FakeWS(), "127.0.0.1")
+        sess.ice = core.IceCoalescer(sess, room)
+        room.peers[sess.pid] = sess
+        room.names[sess.pid] = f"user{i}"
+        sessions.append(sess)
+    return room, sessions
+
+
+def _drain(sessions: List[core.PeerSession]) -> None:
+    for s in sessions:
+        s.queue.clear()
+
+
+# ─── Cases ──────────────────────────────────────────────────────────
+# Each factory returns (callable for one op, is_async); a factory may be a
+# coroutine function when it needs the loop (server, writer tasks).
+# Cleanups registered by factories run after the case.
+Case = Tuple[Callable[[], object], bool]
+_CLEANUP: List[Callable[[], Awaitable[None]]] = []
+
+
+def case_reference() -> Case:
+    """Fixed pure-Python workload: the machine-speed yardstick."""
+    data = list(range(64))
+
+    def op():
+        d = {}
+        for i in data:
+            d[i & 15] = d.get(i & 15, 0) + i
+        return sorted(d.values())
+
+    return op, False
+
+
+def case_validate_ts() -> Case:
+    base = int(time.time() * 1000)
+    state = {"ts": base}
+
+    def op():
+        state["ts"] += 1
+        core.validate_ts("bench", "sender", state["ts"])
+
+    return op, False
+
+
+def case_antiflood() -> Case:
+    lim = core.TokenBucketLimiter(1e12, 1e12, max_keys=core.RL_MAX_KEYS, costs=core.WS_MSG_COST)
+
+    def op():
+        lim.allow("peer", lim.cost_of("offer"))
+
+    return op, False
+
+
+def _dispatch_case(build: Callable[[str, str], str]) -> Case:
+    room, sessions = _room(2, "dispatch")
+    sender, target = sessions
+    core.WS_LIMITER.rate = core.WS_LIMITER.burst = 1e12
+    state = {"ts": int(time.time() * 1000)}
+
+    async def op():
+        state["ts"] += 1
+        await core._dispatch(sender, room, build(target.pid, str(state["ts"])))
+        _drain(sessions)
+
+    return op, True
+
+
+def case_dispatch_offer() -> Case:
+    sdp = json.dumps("v=0\r\n" + "a=candidate:1 1 udp 2122260223 192.168.1.2 54321 typ host\r\n" * 40)
+    return _dispatch_case(
+        lambda to, ts: '{"type":"offer","to":"%s","sdp":%s,"sdpType":"offer","ts":%s}' % (to, sdp, ts))
+
+
+def case_dispatch_chat() -> Case:
+    return _dispatch_case(lambda to, ts: '{"type":"chat","text":"hello there"}')
+
+
+def case_broadcast(n: int) -> Callable[[], Awaitable[Case]]:
+    async def factory() -> Case:
+        room, sessions = _room(n, f"bcast{n}")
+        payload = {"type": "roster-update", "id": sessions[0].pid, "name": "alice", "seq": 1}
+        for s in sessions:
+            s.start()
+
+        async def op():
+            await core._broadcast(room, payload)
+            # the writer tasks pop and "send" the frames
+            while any(s.queue for s in sessions):
+                await asyncio.sleep(0)
+
+        async def cleanup():
+            for s in sessions:
+                await s.close()
+
+        _CLEANUP.append(cleanup)
+        return op, True
+
+    return factory
+
+
+async def _client() -> TestClient:
+    """core.build_app() on a loopback TestServer, with bench-only bypasses."""
+    core.HTTP_LIMITER.rate = core.HTTP_LIMITER.burst = 1e12
+    core.WS_LIMITER.rate = core.WS_LIMITER.burst = 1e12
+    core.REJECT_NON_BROWSER = False          # the client is not a browser
+    core.ADMISSION.max_per_ip = 1 << 30      # every client is 127.0.0.1
+    client = TestClient(TestServer(core.build_app(max_peers=10)))
+    await client.start_server()
+    _CLEANUP.append(client.close)
+    return client
+
+
+def case_http(path: str) -> Callable[[], Awaitable[Case]]:
+    async def factory() -> Case:
+        client = await _client()
+
+        async def op():
+            async with client.get(path, headers={"Accept-Encoding": "gzip"}) as resp:
+                await resp.read()
+
+        return op, True
+
+    return factory
+
+
+async def case_ws_forward() -> Case:
+    client = await _client()
+    a = await client.ws_connect("/ws", protocols=["token.bench-ws"])
+    b = await client.ws_connect("/ws", protocols=["token.bench-ws"])
+    await a.receive_json()                   # hello
+    b_id = (await b.receive_json())["id"]
+    await a.receive_json()                   # roster-add for b
+    sdp = "v=0\r\n" + "a=candidate:1 1 udp 2122260223 192.168.1.2 54321 typ host\r\n" * 40
+    state = {"ts": int(time.time() * 1000)}
+
+    async def op():
+        state["ts"] += 1
+        await a.send_json({"type": "offer", "to": b_id, "sdp": sdp, "sdpType": "offer", "ts": state["ts"]})
+        await b.receive()
+
+    async def cleanup():
+        await a.close()
+        await b.close()
+
+    _CLEANUP.append(cleanup)
+    return op, True
+
+
+CASES: Dict[str, Callable[[], object]] = {
+    "validate_ts": case_validate_ts,
+    "antiflood": case_antiflood,
+    "dispatch_offer": case_dispatch_offer,
+    "dispatch_chat": case_dispatch_chat,
+    "broadcast_2": case_broadcast(2),
+    "broadcast_5": case_broadcast(5),
+    "broadcast_10": case_broadcast(10),
+    "http_healthz": case_http("/healthz"),
+    "http_asset": case_http("/style.css"),
+    "ws_forward": case_ws_forward,
+}
+
+# socket round trips are ~100x slower than the in-process cases: fewer ops
+SLOW_CASES = {"http_healthz": 50, "http_asset": 50, "ws_forward": 50}
+
+# Run-to-run spread the within-run noise does not show (timings inside one
+# run are correlated); the socket cases drift with the kernel's loopback path
+NOISE_FLOOR = 0.03
+SOCKET_NOISE_FLOOR = 0.10
+
+
+# ─── Runner ─────────────────────────────────────────────────────────
+async def _time_async(op: Callable[[], Awaitable[None]], n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        await op()
+    return time.perf_counter() - t0
+
+
+def _time_sync(op: Callable[[], None], n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        op()
+    return time.perf_counter() - t0
+
+
+async def _run_case(factory: Callable[[], object], number: int, repeat: int) -> Tuple[float, float]:
+    """(median ns/op, relative noise) over `repeat` timing runs."""
+    made = factory()
+    op, is_async = await made if asyncio.iscoroutine(made) else made
+    timer = _time_async if is_async else _time_sync
+    try:
+        # warm up, then time with the GC off
+        res = timer(op, max(1, number // 10))
+        if is_async:
+            await res
+        runs = []
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                dt = await timer(op, number) if is_async else timer(op, number)
+                runs.append(dt * 1e9 / number)
+        finally:
+            gc.enable()
+    finally:
+        while _CLEANUP:
+            await _CLEANUP.pop()()
+    med = statistics.median(runs)
+    mad = statistics.median(abs(r - med) for r in runs)
+    return med, mad / med if med else 0.0
+
+
+async def run(number: int, repeat: int, only: Optional[str] = None,
+              rounds: int = 1) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """
+    ns/op and relative noise per case. The suite is run ``rounds`` times and
+    each case keeps its fastest round (interference only ever adds time);
+    "reference" is timed before and after every round.
+    """
+    results: Dict[str, float] = {}
+    noise: Dict[str, float] = {}
+
+    def keep(name: str, ns: float, rel: float) -> None:
+        if name not in results or ns < results[name]:
+            results[name] = round(ns, 1)
+            noise[name] = round(rel, 4)
+
+    for _ in range(max(1, rounds)):
+        keep("reference", *await _run_case(case_reference, number, repeat))
+        for name, factory in CASES.items():
+            if only and only not in name:
+                continue
+            keep(name, *await _run_case(factory, max(1, number // SLOW_CASES.get(name, 1)), repeat))
+        keep("reference", *await _run_case(case_reference, number, repeat))
+    results["reference"] = results.pop("reference")  # listed last
+    noise["reference"] = noise.pop("reference")
+    return results, noise
+
+
+def compare(results: Dict[str, float], noise: Dict[str, float], baseline: dict,
+            threshold: float) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Slowdown per case and the names of cases slower than their
+    noise-aware limit. Cases are scaled by the reference workload only
+    when the host runs slower than at baseline time.
+    """
+    base_ns = baseline.get("ns_per_op", {})
+    base_noise = baseline.get("noise", {})
+    scale = 1.0
+    if base_ns.get("reference") and results.get("reference"):
+        scale = max(1.0, results["reference"] / base_ns["reference"])
+    slowdown: Dict[str, float] = {}
+    failed: List[str] = []
+    for name, ns in results.items():
+        ref = base_ns.get(name)
+        if not ref or name == "reference":
+            continue
+        slowdown[name] = ns / scale / ref - 1.0
+        floor = SOCKET_NOISE_FLOOR if name in SLOW_CASES else NOISE_FLOOR
+        rel = max(noise.get(name, 0.0), base_noise.get(name, 0.0), floor)
+        if slowdown[name] > threshold + 3.0 * rel:
+            failed.append(name)
+    return slowdown, failed
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--number", type=int, default=20_000, help="ops per timing run")
+    ap.add_argument("--repeat", type=int, default=7, help="timing runs per case (the median is kept)")
+    ap.add_argument("--rounds", type=int, default=3, help="passes over the suite (the fastest is kept)")
+    ap.add_argument("--threshold", type=float, default=0.25,
+                    help="allowed slowdown vs. baseline, on top of 3x the measured noise")
+    ap.add_argument("--baseline", default=str(BASELINE))
+    ap.add_argument("--only", help="run cases whose name contains this string")
+    ap.add_argument("--save", action="store_true", help="store results as the new baseline")
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = ap.parse_args()
+
+    core.log.setLevel("ERROR")
+    results, noise = asyncio.run(run(args.number, args.repeat, args.only, args.rounds))
+
+    path = Path(args.baseline)
+    baseline = json.loads(path.read_text(encoding="utf-8")) if path.is_file() else {}
+    slowdown, failed = compare(results, noise, baseline, args.threshold)
+
+    if args.json:
+        print(json.dumps({"ns_per_op": results, "noise": noise, "slowdown": slowdown, "failed": failed}, indent=2))
+    else:
+        for name, ns in results.items():
+            delta = f"{slowdown[name] * 100:+6.1f} %" if name in slowdown else "     n/a"
+            mark = "  FAIL" if name in failed else ""
+            print(f"{name:>22}: {ns:>10.1f} ns/op  ±{noise[name] * 100:4.1f} %  {delta}{mark}")
+
+    if args.save:
+        doc = {
+            "env": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "ns_per_op": dict(baseline.get("ns_per_op", {}), **results),
+            "noise": dict(baseline.get("noise", {}), **noise),
+        }
+        for key in ("ns_per_op", "noise"):  # drop cases that no longer exist
+            doc[key] = {k: v for k, v in doc[key].items() if k in CASES or k == "reference"}
+        path.write_text(json.dumps(doc, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline saved to {path}")
+    elif failed:
+        print(f"regression above {args.threshold:.0%}: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
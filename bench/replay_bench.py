@@ -0,0 +1,89 @@
+"""Microbenchmark: ReplayGuard.check vs. the previous validate_ts implementation.
+
+The legacy version scanned a 64-entry deque with ``any(abs(t - x) < 1e-6 ...)``
+for every addressed message and allocated state through nested defaultdicts.
+
+Usage:
+
+    python -m bench.replay_bench [--messages 200000] [--senders 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from collections import defaultdict, deque
+
+from replay import ReplayGuard
+
+TS_SKEW_SEC = 20
+REPLAY_WINDOW = 64
+
+
+def make_legacy():
+    """Return a closure equivalent to the old core.validate_ts."""
+    guard = defaultdict(lambda: defaultdict(lambda: {"last": 0, "recent": deque(maxlen=REPLAY_WINDOW)}))
+
+    def validate_ts(room: str, sender_id: str, ts) -> bool:
+        try:
+            t_client = float(ts) / (1000.0 if ts > 10_000_000_000 else 1.0)
+        except Exception:
+            return False
+        now = time.time()
+        if abs(now - t_client) > TS_SKEW_SEC:
+            return False
+        st = guard[room][sender_id]
+        if t_client <= st["last"]:
+            return False
+        if st["recent"] and any(abs(t_client - x) < 1e-6 for x in st["recent"]):
+            return False
+        st["last"] = t_client
+        st["recent"].append(t_client)
+        return True
+
+    return validate_ts
+
+
+def _workload(messages: int, senders: int):
+    base = int(time.time() * 1000)
+    ids = [f"peer{i:02d}" for i in range(senders)]
+    return [(ids[i % senders], base + i // senders + 1) for i in range(messages)]
+
+
+def run(messages: int = 200_000, senders: int = 10) -> dict:
+    work = _workload(messages, senders)
+
+    legacy = make_legacy()
+    t0 = time.perf_counter()
+    ok_legacy = sum(1 for sid, ts in work if legacy("room", sid, ts))
+    legacy_ns = (time.perf_counter() - t0) * 1e9 / messages
+
+    guard = ReplayGuard(skew=TS_SKEW_SEC, window=REPLAY_WINDOW)
+    t0 = time.perf_counter()
+    ok_guard = sum(1 for sid, ts in work if guard.check("room", sid, ts))
+    guard_ns = (time.perf_counter() - t0) * 1e9 / messages
+
+    if ok_legacy != ok_guard:
+        raise SystemExit(f"accept mismatch: legacy={ok_legacy} guard={ok_guard}")
+
+    return {
+        "messages": messages,
+        "senders": senders,
+        "legacy_ns_per_msg": round(legacy_ns, 1),
+        "guard_ns_per_msg": round(guard_ns, 1),
+        "speedup": round(legacy_ns / guard_ns, 2) if guard_ns else None,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--messages", type=int, default=200_000)
+    ap.add_argument("--senders", type=int, default=10)
+    args = ap.parse_args()
+    res = run(args.messages, args.senders)
+    for k, v in res.items():
+        print(f"{k:>20}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# bundle.py
+# ────────────────────────────────────────────────────────────────────
+# Сборка фронтенда в один файл: static/app.js + static/js/*.js
+# → bundle.<хэш>.js (один запрос вместо пяти; важно через туннель,
+# где каждый запрос стоит RTT).
+# • порядок модулей — из import'ов app.js, зависимости — из import { … }
+# • каждый модуль в своей области видимости (имена вроде myId есть и в
+#   chat.js, и в rtc.js), экспорт — через возвращаемый объект
+# • консервативная минификация: комментарии и отступы; переводы строк
+#   сохраняются, чтобы не зависеть от ASI
+# Вызывается из assets.AssetCache при старте; вручную:
+#   python bundle.py [--out DIR]
+# ────────────────────────────────────────────────────────────────────
+
+import argparse
+import hashlib
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_SIDE_IMPORT_RE = re.compile(r'^\s*import\s+["\']([^"\']+)["\'];?\s*$', re.M)
+_NAMED_IMPORT_RE = re.compile(r'^\s*import\s*\{([^}]*)\}\s*from\s*["\']([^"\']+)["\'];?\s*$', re.M)
+_EXPORT_RE = re.compile(r"^export\s+((?:async\s+)?function\*?|const|let|var|class)\s+([A-Za-z_$][\w$]*)", re.M)
+_USE_STRICT_RE = re.compile(r'^\s*["\']use strict["\'];?\s*$', re.M)
+
+# после этих символов «/» открывает регулярку, а не деление
+_REGEX_PREFIX = set("(,=:[!&|?{};+-*%<>~^") | {""}
+
+
+def minify_js(src: str) -> str:
+    """Убирает комментарии, отступы и пустые строки; строки/шаблоны/регулярки не трогает."""
+    out: List[str] = []
+    i, n = 0, len(src)
+    last_sig = ""          # последний значимый (не пробельный) символ
+    tpl_depth: List[int] = []  # глубина { } внутри ${ } шаблонных строк
+
+    def copy_quoted(q: str, j: int) -> int:
+        # j указывает на открывающую кавычку
+        k = j + 1
+        while k < n:
+            c = src[k]
+            if c == "\\":
+                k += 2
+                continue
+            if c == q:
+                return k + 1
+            if q == "`" and c == "$" and k + 1 < n and src[k + 1] == "{":
+                return k + 2  # вход в ${ … }, дальше обычный код
+            k += 1
+        return n
+
+    while i < n:
+        c = src[i]
+        nxt = src[i + 1] if i + 1 < n else ""
+
+        if c == "/" and nxt == "/":
+            j = src.find("\n", i)
+            i = n if j < 0 else j
+            continue
+        if c == "/" and nxt == "*":
+            j = src.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+            out.append(" ")
+            continue
+        if c in "\"'`":
+            j = copy_quoted(c, i)
+            out.append(src[i:j])
+            if c == "`" and src[i:j].endswith("${"):
+                tpl_depth.append(0)
+            last_sig = c
+            i = j
+            continue
+        if c == "/" and last_sig in _REGEX_PREFIX:
+            j, in_class = i + 1, False
+            while j < n and src[j] != "\n":
+                ch = src[j]
+                if ch == "\\":
+                    j += 2
+                    continue
+                if ch == "[":
+                    in_class = True
+                elif ch == "]":
+                    in_class = False
+                elif ch == "/" and not in_class:
+                    break
+                j += 1
+            j += 1
+            while j < n and (src[j].isalnum()):
+                j += 1
+            out.append(src[i:j])
+            last_sig = "/"
+            i = j
+            continue
+        if tpl_depth:
+            if c == "{":
+                tpl_depth[-1] += 1
+            elif c == "}":
+                if tpl_depth[-1] == 0:
+                    # конец ${ … } — продолжаем шаблонную строку
+                    tpl_depth.pop()
+                    j = copy_quoted("`", i)
+                    out.append(src[i:j])
+                    if src[i:j].endswith("${"):
+                        tpl_depth.append(0)
+                    last_sig = "`"
+                    i = j
+                    continue
+                tpl_depth[-1] -= 1
+        out.append(c)
+        if not c.isspace():
+            last_sig = c if not (c.isalnum() or c in "_$") else "a"
+        i += 1
+
+    lines = (ln.strip() for ln in "".join(out).splitlines())
+    return "\n".join(ln for ln in lines if ln) + "\n"
+
+
+def _module_body(src: str) -> Tuple[str, List[Tuple[List[str], str]], List[str]]:
+    """Возвращает (тело без import/export, [(имена, откуда)], экспортируемые имена)."""
+    imports = [([x.strip() for x in names.split(",") if x.strip()], spec) for names, spec in _NAMED_IMPORT_RE.findall(src)]
+    exports = [m.group(2) for m in _EXPORT_RE.finditer(src)]
+    body = _NAMED_IMPORT_RE.sub("", src)
+    body = _SIDE_IMPORT_RE.sub("", body)
+    body = _USE_STRICT_RE.sub("", body)
+    body = re.sub(r"^export\s+", "", body, flags=re.M)
+    return body, imports, exports
+
+
+def _resolve(base: Path, spec: str) -> Path:
+    return (base.parent / spec).resolve()
+
+
+def build_bundle(static_dir: Path, entry: str = "app.js", minify: bool = True) -> Optional[Tuple[str, bytes]]:
+    """
+    Собирает бандл из entry и его импортов. Возвращает (имя файла, байты)
+    или None, если entry нет.
+    """
+    static_dir = Path(static_dir).resolve()
+    entry_path = static_dir / entry
+    if not entry_path.is_file():
+        return None
+
+    order: List[Path] = []
+    seen: Dict[Path, bool] = {}
+
+    def visit(path: Path) -> None:
+        if path in seen:
+            return
+        seen[path] = True
+        src = path.read_text(encoding="utf-8")
+        for _names, spec in _NAMED_IMPORT_RE.findall(src):
+            visit(_resolve(path, spec))
+        for spec in _SIDE_IMPORT_RE.findall(src):
+            visit(_resolve(path, spec))
+        order.append(path)
+
+    visit(entry_path)
+
+    var_of = {p: f"__m{i}" for i, p in enumerate(order)}
+    parts = ['"use strict";']
+    for path in order:
+        body, imports, exports = _module_body(path.read_text(encoding="utf-8"))
+        if not body.strip() and not exports:
+            continue
+        head = "".join(
+            f"const {{ {', '.join(names)} }} = {var_of[_resolve(path, spec)]};\n" for names, spec in imports
+        )
+        tail = f"\nreturn {{ {', '.join(exports)} }};" if exports else ""
+        rel = path.relative_to(static_dir).as_posix()
+        parts.append(f"/* {rel} */\nconst {var_of[path]} = (() => {{\n{head}{body}{tail}\n}})();")
+
+    code = "\n".join(parts) + "\n"
+    if minify:
+        code = minify_js(code)
+    data = code.encode("utf-8")
+    name = f"bundle.{hashlib.sha256(data).hexdigest()[:12]}.js"
+    return name, data
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Build the single-file frontend bundle")
+    ap.add_argument("--static", default=str(Path(__file__).resolve().parent / "static"))
+    ap.add_argument("--out", help="directory to write the bundle into")
+    ap.add_argument("--no-minify", action="store_true")
+    args = ap.parse_args()
+
+    res = build_bundle(Path(args.static), minify=not args.no_minify)
+    if res is None:
+        raise SystemExit("entry app.js not found")
+    name, data = res
+    if args.out:
+        out = Path(args.out) / name
+        out.write_bytes(data)
+        print(out)
+    else:
+        print(f"{name}: {len(data)} bytes")
+
+
+__all__ = ["build_bundle", "minify_js"]
+
+
+if __name__ == "__main__":
+    main()
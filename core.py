@@ -2,7 +2,9 @@
 # ────────────────────────────────────────────────────────────────────
 # WebRTC сигналинг-сервер (групповые звонки mesh до 10 пиров)
 # • HTTP: (/, /style.css, /icon.svg, /js/*) + WS сигналинг на /ws
+# • Реестр комнат по токену: у каждой комнаты свой ростер и вместимость
 # • UDP discovery для локальной сети (хост/гость)
+# • Формат кадров: JSON или MessagePack, выбор через WS subprotocol (wire.py)
 # • Безопасность: whitelist Origin, токен через WS subprotocol, антифлуд,
 #   чистые логи (без SDP/ICE/токенов/чат-текста), строгие security headers.
 # Запуск: импортируйте start_http_server() из main.py
@@ -20,38 +22,94 @@ from pathlib import Path
 from typing import Dict, Optional
 
 import time
-from collections import defaultdict, deque
+from collections import deque
 from aiohttp import web
 
-from aiohttp import web
+from applog import AsyncLog
+from assets import AssetCache
+from async_runner import sample_loop_lag
+import discovery
+from discovery import DISCOVERY_MSG, DISCOVERY_PORT
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry
+from ratelimit import TokenBucketLimiter
+from replay import ReplayGuard
+import wire
 
 # ─── Константы ──────────────────────────────────────────────────────
 HTTP_PORT = 8790
 
-DISCOVERY_PORT = 37020
-DISCOVERY_MSG = b"SECURECALL_WEBRTC_DISCOVER_V2"
-
 LOG_FILE = "securecall_webrtc.log"
 
 # Лимиты / безопасность
 MAX_MSG_SIZE = 64 * 1024  # 64 KB для WS
-MAX_MSGS_PER_SEC = 20     # антифлуд per-peer
+MAX_MSGS_PER_SEC = 20     # антифлуд per-peer (скорость пополнения ведра)
+# Стоимость сообщений в токенах антифлуда (по умолчанию 1)
+WS_MSG_COST = {"offer": 4.0, "answer": 4.0, "key": 2.0, "name": 2.0, "chat": 2.0, "chat-e2e-multi": 2.0}
 MAX_CHAT_LEN = 500
 MAX_NAME_LEN = 64
+# Поля E2E-чата (iv, ct): base64-строка в JSON или bytes в msgpack
+MAX_E2E_IV_LEN = 64            # AES-GCM IV — 12 байт (16 символов base64)
+MAX_E2E_CT_LEN = MAX_MSG_SIZE  # одиночный chat-e2e ограничен только размером кадра
 MAX_PEERS: int = 10        # лимит участников комнаты
 
+# Исходящая очередь на пира: размер и политика при переполнении.
+# Политика — цепочка шагов через запятую, применяются по порядку:
+#   coalesce-roster — неотправленные кадры ростера (снимок и дельты
+#                     roster-add/update/remove) сливаются в один свежий снимок;
+#   drop-ice        — выкидываем самый старый ice из очереди;
+#   disconnect      — отключаем медленного получателя.
+# Без disconnect переполненная очередь отбрасывает новый кадр (счётчик dropped_new).
+OUTBOX_MAX = int(os.environ.get("OUTBOX_MAX", "256"))
+OUTBOX_POLICY = tuple(
+    x.strip() for x in os.environ.get("OUTBOX_POLICY", "coalesce-roster,drop-ice,disconnect").split(",") if x.strip()
+)
+
+# Склейка ICE в релее: окно накопления (мс; 0 — без задержки) и
+# лимит кандидатов во входящем пакетном кадре
+ICE_COALESCE_MS = int(os.environ.get("ICE_COALESCE_MS", "20"))
+ICE_BATCH_MAX = 32
+
+# Допуск WS до апгрейда (читаются один раз при старте)
+MAX_WS_PER_IP = int(os.environ.get("MAX_WS_PER_IP", "3"))        # коннектов с одного IP
+MAX_WS_TOTAL = int(os.environ.get("MAX_WS_TOTAL", "10000"))      # коннектов на процесс
+# Сколько пиров хост реально тянет (медиа идёт P2P, но сигналинг и TURN —
+# нет); объявляется в discovery как capacity, по нему считается занятость
+HOST_CAPACITY = int(os.environ.get("HOST_CAPACITY", "100"))
+
 REJECT_NON_BROWSER: bool = True  # пускать только браузеры
 
 TS_SKEW_SEC = 20           # <= 20 секунд допускаем
 # Глубина памяти по ts для защиты от повторной доставки
 REPLAY_WINDOW = 64         # сколько последних ts держим на отправителя
+REPLAY_IDLE_SEC = 300      # состояние молчащих отправителей чистится периодически
 
 RL_MAX_REQ = int(os.environ.get("RL_MAX_REQ", "30"))          # запросов
 RL_WINDOW_SEC = int(os.environ.get("RL_WINDOW_SEC", "60"))    # в секундах
-_http_rl = defaultdict(lambda: deque())  # ip -> deque[timestamps]
+RL_MAX_KEYS = int(os.environ.get("RL_MAX_KEYS", "10000"))     # потолок отслеживаемых IP/пиров
+
+# Общий token-bucket ограничитель: HTTP по IP, WS по peer id
+HTTP_LIMITER = TokenBucketLimiter(RL_MAX_REQ / RL_WINDOW_SEC, RL_MAX_REQ, max_keys=RL_MAX_KEYS)
+WS_LIMITER = TokenBucketLimiter(MAX_MSGS_PER_SEC, MAX_MSGS_PER_SEC, max_keys=RL_MAX_KEYS, costs=WS_MSG_COST)
 
-# replay_guard[room_token][sender_id] = {"last": int, "recent": deque([...])}
-replay_guard = defaultdict(lambda: defaultdict(lambda: {"last": 0, "recent": deque(maxlen=REPLAY_WINDOW)}))
+
+def _ws_burst(max_peers: int) -> float:
+    """
+    Ёмкость ведра антифлуда: вход в полную комнату (full mesh) — имя и
+    offer + key + пакет ice каждому из max_peers-1 пиров — одним всплеском.
+    """
+    cost = WS_LIMITER.cost_of
+    per_peer = cost("offer") + cost("key") + cost("ice")
+    return max(float(MAX_MSGS_PER_SEC), (max_peers - 1) * per_peer + cost("name"))
+
+
+WS_LIMITER.burst = _ws_burst(MAX_PEERS)
+
+# Anti-replay: состояние по комнате и отправителю, O(1) проверка повтора
+REPLAY_GUARD = ReplayGuard(skew=TS_SKEW_SEC, window=REPLAY_WINDOW, idle_ttl=REPLAY_IDLE_SEC)
+
+# WS heartbeat: свой ping раз в HEARTBEAT_SEC (ради замера RTT);
+# нет pong до следующего ping — соединение закрываем
+HEARTBEAT_SEC = 20.0
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -61,18 +119,33 @@ STATIC_DIR = BASE_DIR / "static"
 ALLOWED_ORIGINS = [o.strip() for o in os.environ.get("ALLOWED_ORIGINS", "").split(",") if o.strip()]
 # Токен комнаты; пусто => режим без проверки токена
 ROOM_TOKEN = os.environ.get("ROOM_TOKEN", "")
+# В продакшене принимаем WS только по WSS/HTTPS
+PROD = os.environ.get("PROD") == "1"
+
+# ─── Метрики (/metrics, формат Prometheus) ─────────────────────────
+METRICS = Registry()
+M_WS_IN = METRICS.counter("securecall_ws_messages_in_total", "WS messages received, by type", ("type",))
+M_WS_OUT = METRICS.counter("securecall_ws_messages_out_total", "WS frames written to peers, by type", ("type",))
+M_FORWARD = METRICS.histogram(
+    "securecall_forward_latency_seconds", "Addressed message: receipt to write on the recipient socket")
+M_BROADCAST = METRICS.histogram("securecall_broadcast_seconds", "Room broadcast fan-out time")
+M_LOOP_LAG = METRICS.histogram("securecall_event_loop_lag_seconds", "Event loop scheduling lag")
+M_HEARTBEAT = METRICS.histogram("securecall_ws_heartbeat_rtt_seconds", "WS ping/pong round-trip time")
+M_HEARTBEAT_TIMEOUTS = METRICS.counter("securecall_ws_heartbeat_timeouts_total", "Peers dropped for a missed pong")
 
 # ─── Логгер ─────────────────────────────────────────────────────────
+# Запись в файл/консоль — в фоновом потоке (applog.py): цикл событий
+# только кладёт запись в очередь. Горячие строки — через _log_sampled().
 log = logging.getLogger("SecureCallWebRTC")
+LOGQ: Optional[AsyncLog] = None
 if not log.handlers:
     # В проде по умолчанию WARNING, включите DEBUG=1 для подробных логов
-    log.setLevel(logging.INFO if os.environ.get("DEBUG") == "1" else logging.WARNING)
-    fh = logging.FileHandler(LOG_FILE, encoding="utf-8")
-    fh.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
-    log.addHandler(fh)
-    sh = logging.StreamHandler()
-    sh.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
-    log.addHandler(sh)
+    LOGQ = AsyncLog(log, LOG_FILE, logging.INFO if os.environ.get("DEBUG") == "1" else logging.WARNING)
+
+
+def _log_sampled(cat: str) -> bool:
+    """True — эту строку категории cat стоит записать (с учётом уровня и LOG_SAMPLE)."""
+    return LOGQ.sample(cat) if LOGQ is not None else log.isEnabledFor(logging.INFO)
 
 # ─── Утилиты ────────────────────────────────────────────────────────
 def get_local_ip() -> str:
@@ -108,163 +181,912 @@ def validate_ts(room: str, sender_id: str, ts: int) -> bool:
       - монотонно возрастает для данного sender_id внутри комнаты
       - не повторяется в недавнем окне (anti-replay)
     """
-    try:
-        t_client = float(ts) / (1000.0 if ts > 10_000_000_000 else 1.0)  # поддержим ms и sec
-    except Exception:
-        return False
+    return REPLAY_GUARD.check(room, sender_id, ts)
 
-    now = time.time()
-    if abs(now - t_client) > TS_SKEW_SEC:
-        return False
 
-    st = replay_guard[room][sender_id]
-    # жёсткая монотония: новый ts должен быть > последнего
-    if t_client <= st["last"]:
-        return False
+# Ссылки на фоновые задачи сервера (иначе их может собрать GC)
+_BACKGROUND: set = set()
 
-    # защита от повторов: точное совпадение ts в окне
-    if st["recent"] and any(abs(t_client - x) < 1e-6 for x in st["recent"]):
-        return False
 
-    st["last"] = t_client
-    st["recent"].append(t_client)
-    return True
+async def _replay_sweeper(interval: float = 60.0):
+    """Фоновая зачистка anti-replay от отправителей, которые давно молчат."""
+    while True:
+        await asyncio.sleep(interval)
+        removed = REPLAY_GUARD.sweep()
+        if removed:
+            log.info("[WS] replay guard swept %d idle senders", removed)
+
+
+# Сглаженный (EWMA) лаг цикла, мс — уходит в ответ discovery
+LOOP_LAG_MS = 0.0
+
+
+def _on_loop_lag(lag: float) -> None:
+    """
+    Замер лага цикла от общего сэмплера (async_runner.sample_loop_lag — тот
+    же, что читает GUI через runner.stats()): гистограмма + EWMA для discovery.
+    """
+    global LOOP_LAG_MS
+    M_LOOP_LAG.observe(lag)
+    LOOP_LAG_MS = 0.8 * LOOP_LAG_MS + 0.2 * lag * 1000.0
 
 
 # ─── UDP discovery ─────────────────────────────────────────────────
-async def udp_discover(timeout=1.0, attempts=3):
-    for _ in range(attempts):
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        s.settimeout(timeout)
-        try:
-            s.sendto(DISCOVERY_MSG, ("255.255.255.255", DISCOVERY_PORT))
-            data, addr = s.recvfrom(4096)
-            try:
-                info = json.loads(data.decode("utf-8"))
-            except Exception:
-                info = None
-            if isinstance(info, dict) and info.get("role") == "host":
-                info["host"] = addr[0]
-                return info
-        except Exception:
-            pass
-        finally:
-            try: s.close()
-            except Exception: pass
-    return None
+# Реализация на asyncio — discovery.py; здесь обёртки со старыми именами.
+UDP_RESPONDER: Optional[discovery.DiscoveryResponder] = None
+
+
+async def udp_discover_all(timeout=1.0, attempts=3, refresh=False):
+    """Все хосты в сети за окно timeout (кэшируется, см. discovery.py)."""
+    return await discovery.discover(timeout, attempts, refresh=refresh)
+
+
+async def udp_discover(timeout=1.0, attempts=3, prefer=discovery.DISCOVERY_PREFER):
+    """Лучший хост: наименее загруженный ("load") или ближайший ("rtt")."""
+    hosts = discovery.rank(await discovery.discover(timeout, attempts), prefer)
+    return hosts[0] if hosts else None
 
-def start_udp_responder():
-    import threading
-    def run():
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        try:
-            s.bind(("0.0.0.0", DISCOVERY_PORT))
-        except Exception as e:
-            log.warning("[UDP] bind failed: %s", e)
-            return
-        log.info("[UDP] discovery responder on %s", DISCOVERY_PORT)
-        while True:
-            try:
-                data, addr = s.recvfrom(4096)
-                if data == DISCOVERY_MSG:
-                    resp = json.dumps({"role": "host", "port": HTTP_PORT}).encode("utf-8")
-                    s.sendto(resp, addr)
-            except Exception:
-                pass
-    t = threading.Thread(target=run, name="UDPResponder", daemon=True)
-    t.start()
+
+def _discovery_reply() -> dict:
+    """Текущая нагрузка хоста (снимается не чаще DISCOVERY_REFRESH)."""
+    return {
+        "role": "host",
+        "port": HTTP_PORT,
+        "peers": ROOMS.total_peers(),
+        "capacity": max(1, min(HOST_CAPACITY, ADMISSION.max_total)),
+        "room_capacity": MAX_PEERS,
+        "rooms": len(ROOMS),
+        "lag_ms": round(LOOP_LAG_MS, 2),
+    }
+
+
+async def start_udp_responder(load=True):
+    """
+    Ответчик discovery в текущем цикле событий (повторный вызов — no-op).
+    load=False — статический ответ без нагрузки (процесс без своих комнат).
+    """
+    global UDP_RESPONDER
+    if UDP_RESPONDER is None or UDP_RESPONDER.transport is None:
+        reply = _discovery_reply if load else {"role": "host", "port": HTTP_PORT}
+        UDP_RESPONDER = await discovery.start_responder(reply)
+    return UDP_RESPONDER
 
 # ─── HTTP и статик ─────────────────────────────────────────────────
+# Кэш статики строится один раз в start_http_server()
+ASSETS: Optional[AssetCache] = None
+
+
+def _asset(request, url: str):
+    if ASSETS is None:
+        raise web.HTTPServiceUnavailable()
+    return ASSETS.respond(request, url)
+
 async def http_index(request):
-    return web.FileResponse(STATIC_DIR / "index.html")
+    return _asset(request, "/")
 
 async def http_style(request):
-    return web.FileResponse(STATIC_DIR / "style.css")
+    return _asset(request, "/style.css")
 
 async def http_icon(request):
-    return web.FileResponse(STATIC_DIR / "icon.svg")
+    return _asset(request, "/icon.svg")
 
 async def http_app(request):
     # опциональный общий бандл; основные файлы лежат в /static/js/*
-    return web.FileResponse(STATIC_DIR / "app.js")
+    return _asset(request, "/app.js")
+
+async def http_js(request):
+    return _asset(request, "/js/" + request.match_info["name"])
+
+async def http_bundle(request):
+    # единый content-hashed бандл фронтенда (см. bundle.py)
+    return _asset(request, request.path)
 
 async def http_healthz(request):
     return web.Response(text="ok")
 
+def _is_admin(request) -> bool:
+    """Служебные эндпоинты: только при ADMIN_STATUS=1 и верном X-Status-Secret."""
+    if os.environ.get("ADMIN_STATUS") != "1":
+        return False
+    secret = os.environ.get("STATUS_SECRET", "")
+    return bool(secret) and request.headers.get("X-Status-Secret") == secret
+
 async def http_status(request):
     # простой статус-эндпоинт, можно защитить заголовком
-    if os.environ.get("ADMIN_STATUS") == "1":
-        secret = os.environ.get("STATUS_SECRET", "")
-        if secret and request.headers.get("X-Status-Secret") == secret:
-            return web.json_response({"peers": len(ROOM["peers"]), "capacity": MAX_PEERS, "ok": True})
+    if _is_admin(request):
+        return web.json_response({
+            "peers": ROOMS.total_peers(),
+            "rooms": len(ROOMS),
+            "capacity": MAX_PEERS,
+            "broadcast": BROADCAST_STATS,
+            "outbox": dict(OUTBOX_STATS, queued=ROOMS.queued()),
+            "admission": ADMISSION.snapshot(),
+            "ratelimit": {"ws": WS_LIMITER.stats(), "http": HTTP_LIMITER.stats()},
+            "replay": REPLAY_GUARD.stats(),
+            "assets": ASSETS.stats() if ASSETS else None,
+            "ice": ICE_STATS,
+            "wire": {"formats": list(wire.FORMATS), **wire.STATS},
+            "log": LOGQ.stats() if LOGQ else None,
+            "ok": True,
+        })
     return web.json_response({"ok": True})
 
+async def http_logs(request):
+    # последние события из кольцевого буфера; ?n=100&level=WARNING
+    if not _is_admin(request) or LOGQ is None:
+        raise web.HTTPNotFound()
+    try:
+        n = max(1, min(int(request.query.get("n", "100")), LOGQ.ring.records.maxlen))
+    except ValueError:
+        n = 100
+    level = logging.getLevelName(request.query.get("level", "NOTSET").upper())
+    return web.json_response({
+        "events": LOGQ.ring.recent(n, level if isinstance(level, int) else logging.NOTSET),
+        "log": LOGQ.stats(),
+    })
+
+async def http_metrics(request):
+    # та же защита, что у /status; без неё эндпоинта как будто нет
+    if not _is_admin(request):
+        raise web.HTTPNotFound()
+    return web.Response(body=METRICS.render().encode("utf-8"), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+# Security-заголовки и CSP собираются один раз, а не на каждый ответ
+CSP = (
+    "default-src 'self'; "
+    "script-src 'self'; "
+    "style-src 'self' 'unsafe-inline'; "
+    "img-src 'self' data:; "
+    "connect-src 'self' ws: wss:; "
+    "base-uri 'none'; frame-ancestors 'none'"
+)
+SECURITY_HEADERS = (
+    ("X-Content-Type-Options", "nosniff"),
+    ("X-Frame-Options", "DENY"),
+    ("Referrer-Policy", "no-referrer"),
+    ("Strict-Transport-Security", "max-age=15552000"),
+    ("Permissions-Policy", "camera=(self), microphone=(self), geolocation=()"),
+)
+
 @web.middleware
 async def security_headers_mw(request, handler):
     resp = await handler(request)
-    resp.headers.setdefault("X-Content-Type-Options", "nosniff")
-    resp.headers.setdefault("X-Frame-Options", "DENY")
-    resp.headers.setdefault("Referrer-Policy", "no-referrer")
-    resp.headers.setdefault("Strict-Transport-Security", "max-age=15552000")
-    resp.headers.setdefault("Permissions-Policy", "camera=(self), microphone=(self), geolocation=()")
-    csp = (
-        "default-src 'self'; "
-        "script-src 'self'; "
-        "style-src 'self' 'unsafe-inline'; "
-        "img-src 'self' data:; "
-        "connect-src 'self' ws: wss:; "
-        "base-uri 'none'; frame-ancestors 'none'"
-    )
-    if "Content-Security-Policy" in resp.headers:
-        resp.headers["Content-Security-Policy"] = resp.headers["Content-Security-Policy"] + "; " + csp
-    else:
-        resp.headers["Content-Security-Policy"] = csp
+    headers = resp.headers
+    for k, v in SECURITY_HEADERS:
+        headers.setdefault(k, v)
+    prev = headers.get("Content-Security-Policy")
+    headers["Content-Security-Policy"] = prev + "; " + CSP if prev else CSP
     return resp
 
 @web.middleware
 async def rate_limit_mw(request, handler):
     path = request.path
     # Ограничиваем только статусные эндпоинты
-    if path not in ("/status", "/healthz"):
+    if path not in ("/status", "/healthz", "/metrics", "/logs"):
         return await handler(request)
 
     ip = request.headers.get("X-Forwarded-For", request.remote or "unknown").split(",")[0].strip()
-    now = time.time()
-    dq = _http_rl[ip]
-
-    # выкидываем устаревшие метки
-    while dq and now - dq[0] > RL_WINDOW_SEC:
-        dq.popleft()
-
-    if len(dq) >= RL_MAX_REQ:
+    if not HTTP_LIMITER.allow(ip):
         return web.Response(status=429, text="Too Many Requests")
 
-    dq.append(now)
     return await handler(request)
 
 
 
-# ─── Комната и адресный WS-сигналинг ───────────────────────────────
-ROOM: Dict[str, Dict] = {"peers": {}, "names": {}}
+# ─── Сессии пиров и исходящие очереди ──────────────────────────────
+# Глобальные счётчики очередей (для /status)
+OUTBOX_STATS = {
+    "enqueued": 0, "coalesced": 0, "dropped_ice": 0, "dropped_new": 0, "disconnected": 0, "max_depth": 0,
+}
+ROSTER_FRAMES = frozenset(("roster", "roster-add", "roster-update", "roster-remove"))
 
-async def _broadcast(payload: dict, exclude: Optional[str] = None):
-    dead = []
-    for pid, ws in list(ROOM["peers"].items()):
-        if exclude and pid == exclude:
-            continue
+
+class PeerSession:
+    """
+    Сессия пира: WS + ограниченная исходящая очередь, которую разгребает
+    собственная задача-писатель. Отправитель только кладёт кадр в очередь
+    и не ждёт сетевой записи получателя.
+    """
+    __slots__ = (
+        "pid", "ws", "ip", "fmt", "ice", "room", "queue", "closed", "sent", "dropped", "max_depth",
+        "_wake", "_writer", "_heartbeat", "_ping_at",
+    )
+
+    def __init__(self, pid: str, ws: web.WebSocketResponse, ip: str, fmt: str = wire.JSON):
+        self.pid = pid
+        self.ws = ws
+        self.ip = ip
+        self.fmt = fmt               # wire.JSON (текст) или wire.MSGPACK (бинарь)
+        self.ice: Optional["IceCoalescer"] = None
+        self.room: Optional["Room"] = None  # для снимка ростера при склейке
+        self.queue: deque = deque()  # (type, кадр: str или bytes, t0 приёма для адресных | None)
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._wake = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._ping_at: Optional[float] = None
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._drain(), name=f"ws-writer-{self.pid[:6]}")
+        self._heartbeat = asyncio.create_task(self._ping_loop(), name=f"ws-ping-{self.pid[:6]}")
+
+    def send(self, typ: str, data, t0: Optional[float] = None) -> bool:
+        """
+        Кладёт готовый кадр в очередь (без ожидания). Возвращает False,
+        если сессия закрыта или отключена политикой переполнения; кадр,
+        отброшенный политикой без отключения, считается в dropped.
+        t0 — perf_counter() приёма исходного кадра (для forward latency).
+        """
+        if self.closed:
+            return False
+        q = self.queue
+        if typ in ROSTER_FRAMES and "coalesce-roster" in OUTBOX_POLICY and self._coalesce_roster():
+            return True
+        if len(q) >= OUTBOX_MAX and not self._make_room():
+            if self.closed:
+                return False
+            self.dropped += 1
+            OUTBOX_STATS["dropped_new"] += 1
+            return True
+        q.append((typ, data, t0))
+        OUTBOX_STATS["enqueued"] += 1
+        depth = len(q)
+        if depth > self.max_depth:
+            self.max_depth = depth
+            if depth > OUTBOX_STATS["max_depth"]:
+                OUTBOX_STATS["max_depth"] = depth
+        self._wake.set()
+        return True
+
+    def _coalesce_roster(self) -> bool:
+        """
+        Если в очереди уже ждут кадры ростера — заменяет их одним снимком
+        на месте первого. Состояние комнаты к этому моменту уже включает
+        новую дельту, так что и её кадр не нужен. False — склеивать нечего.
+        """
+        room = self.room
+        q = self.queue
+        if room is None:
+            return False
+        idx = [i for i, item in enumerate(q) if item[0] in ROSTER_FRAMES]
+        if not idx:
+            return False
+        for i in reversed(idx):
+            del q[i]
+        q.insert(idx[0], ("roster", wire.encode(room.snapshot(), self.fmt), None))
+        OUTBOX_STATS["coalesced"] += len(idx)
+        return True
+
+    def _make_room(self) -> bool:
+        """Шаги OUTBOX_POLICY по порядку; False — места нет (или пир отключён)."""
+        q = self.queue
+        for step in OUTBOX_POLICY:
+            if step == "drop-ice":
+                for i, item in enumerate(q):
+                    if item[0] == "ice":
+                        del q[i]
+                        self.dropped += 1
+                        OUTBOX_STATS["dropped_ice"] += 1
+                        return True
+            elif step == "disconnect":
+                log.warning("[WS] slow consumer %s (queue=%d), disconnecting", self.pid[:6], len(q))
+                OUTBOX_STATS["disconnected"] += 1
+                self.abort()
+                return False
+        return False
+
+    async def _drain(self) -> None:
+        q = self.queue
+        try:
+            while not self.closed:
+                if not q:
+                    self._wake.clear()
+                    await self._wake.wait()
+                    continue
+                typ, data, t0 = q.popleft()
+                if isinstance(data, str):
+                    await self.ws.send_str(data)
+                else:
+                    await self.ws.send_bytes(data)
+                self.sent += 1
+                M_WS_OUT.inc(typ)
+                if t0 is not None:
+                    M_FORWARD.observe(time.perf_counter() - t0)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.info("[WS] writer for %s stopped: %s", self.pid[:6], e)
+            self.abort()
+
+    async def _ping_loop(self) -> None:
         try:
-            await ws.send_json(payload)
+            while not self.closed:
+                await asyncio.sleep(HEARTBEAT_SEC)
+                if self._ping_at is not None:
+                    M_HEARTBEAT_TIMEOUTS.inc()
+                    log.info("[WS] no pong from %s, closing", self.pid[:6])
+                    self.abort()
+                    return
+                self._ping_at = time.perf_counter()
+                await self.ws.ping()
+        except asyncio.CancelledError:
+            raise
         except Exception:
-            dead.append(pid)
-    for pid in dead:
+            self.abort()
+
+    def on_pong(self) -> None:
+        if self._ping_at is not None:
+            M_HEARTBEAT.observe(time.perf_counter() - self._ping_at)
+            self._ping_at = None
+
+    def abort(self) -> None:
+        """Помечает сессию мёртвой и закрывает WS (приёмный цикл завершится сам)."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self._wake.set()
+        task = asyncio.ensure_future(self._close_ws())
+        _BACKGROUND.add(task)
+        task.add_done_callback(_BACKGROUND.discard)
+
+    async def _close_ws(self) -> None:
         try:
-            await ROOM["peers"][pid].close()
+            await self.ws.close()
         except Exception:
             pass
-        ROOM["peers"].pop(pid, None)
-        ROOM["names"].pop(pid, None)
+
+    async def close(self) -> None:
+        self.closed = True
+        self.queue.clear()
+        if self.ice is not None:
+            self.ice.cancel()
+        for t in (self._heartbeat, self._writer):
+            if t is not None and not t.done():
+                t.cancel()
+                try:
+                    await t
+                except BaseException:
+                    pass
+        await self._close_ws()
+
+
+# ─── Комнаты и адресный WS-сигналинг ──────────────────────────────
+class Room:
+    """
+    Одна комната звонка: свои пиры, имена и вместимость.
+    Ключ комнаты — токен (без префикса «token.»).
+    seq — версия ростера: растёт на каждое изменение, клиенты применяют
+    дельты roster-add/update/remove по порядку и при разрыве просят снимок.
+    remote — пиры этой комнаты на других воркерах (режим workers.py).
+    """
+    __slots__ = ("key", "capacity", "peers", "names", "created", "seq", "remote")
+
+    def __init__(self, key: str, capacity: int):
+        self.key = key
+        self.capacity = capacity
+        self.peers: Dict[str, PeerSession] = {}  # pid -> сессия
+        self.names: Dict[str, str] = {}                     # pid -> имя
+        self.created = time.time()
+        self.seq = 0
+        self.remote: set = set()
+
+    def next_seq(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def is_full(self) -> bool:
+        return len(self.peers) + len(self.remote) >= self.capacity
+
+    def roster(self) -> list:
+        roster = [{"id": p, "name": self.names.get(p, "")} for p in self.peers]
+        roster += [{"id": p, "name": self.names.get(p, "")} for p in self.remote]
+        return roster
+
+    def snapshot(self, typ: str = "roster") -> dict:
+        return {"type": typ, "roster": self.roster(), "seq": self.seq}
+
+
+class RoomRegistry:
+    """
+    Реестр комнат по токену. Все операции — O(1) по словарю;
+    пустые комнаты удаляются сразу после ухода последнего пира.
+    """
+
+    def __init__(self):
+        self._rooms: Dict[str, Room] = {}
+
+    def get(self, key: str) -> Optional[Room]:
+        return self._rooms.get(key)
+
+    def acquire(self, key: str) -> Room:
+        room = self._rooms.get(key)
+        if room is None:
+            room = self._rooms[key] = Room(key, MAX_PEERS)
+            _bus_send({"op": "sub", "room": key})
+        return room
+
+    def join(self, room: Room, session: PeerSession) -> None:
+        room.peers[session.pid] = session
+        # комната могла быть удалена, пока пир ждал prepare()
+        self._rooms.setdefault(room.key, room)
+
+    def leave(self, room: Room, pid: str) -> bool:
+        """Убирает пира; возвращает True, если он ещё был в комнате."""
+        present = room.peers.pop(pid, None) is not None
+        room.names.pop(pid, None)
+        if not room.peers and self._rooms.get(room.key) is room:
+            del self._rooms[room.key]
+            _bus_send({"op": "unsub", "room": room.key})
+        return present
+
+    def total_peers(self) -> int:
+        return sum(len(r.peers) for r in self._rooms.values())
+
+    def iter_sessions(self):
+        for room in self._rooms.values():
+            yield from room.peers.values()
+
+    def queued(self) -> int:
+        return sum(len(sess.queue) for sess in self.iter_sessions())
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def __iter__(self):
+        return iter(list(self._rooms.values()))
+
+
+ROOMS = RoomRegistry()
+
+
+class AdmissionController:
+    """
+    Допуск WS-подключений до апгрейда. Счётчики по IP и общий счётчик
+    поддерживаются при входе/выходе, проверка — O(1) без обхода комнат.
+    Отказ — дешёвый HTTP-ответ (429/503 + Retry-After) без prepare().
+
+    check() сразу резервирует слот (IP, общий счётчик и место в комнате),
+    чтобы параллельные апгрейды не переполнили комнату, пока идут claim()
+    и prepare(). Резерв комнаты снимается в joined() или cancel().
+    """
+
+    def __init__(self, max_per_ip: int, max_total: int):
+        self.max_per_ip = max_per_ip
+        self.max_total = max_total
+        self.per_ip: Dict[str, int] = {}
+        self.total = 0
+        self.pending: Dict[str, int] = {}  # room_key -> зарезервировано, ещё не в комнате
+        self.stats = {"admitted": 0, "rejected_ip": 0, "rejected_full": 0, "rejected_busy": 0}
+
+    def check(self, ip: str, room_key: str) -> Optional[web.Response]:
+        """None — слот зарезервирован; иначе готовый ответ-отказ."""
+        if self.total >= self.max_total:
+            self.stats["rejected_busy"] += 1
+            return self._reject(503, {"type": "busy"}, retry_after=10)
+        if self.per_ip.get(ip, 0) >= self.max_per_ip:
+            self.stats["rejected_ip"] += 1
+            log.warning("[WS] too many connections from %s", ip)
+            return self._reject(429, {"type": "too-many", "reason": "Too Many Connections from this IP"}, retry_after=5)
+        pending = self.pending.get(room_key, 0)
+        room = ROOMS.get(room_key)
+        capacity = room.capacity if room is not None else MAX_PEERS
+        occupied = pending + (len(room.peers) + len(room.remote) if room is not None else 0)
+        if occupied >= capacity:
+            self.stats["rejected_full"] += 1
+            return self._reject(503, {"type": "full", "capacity": capacity}, retry_after=30)
+        self.pending[room_key] = pending + 1
+        self.per_ip[ip] = self.per_ip.get(ip, 0) + 1
+        self.total += 1
+        self.stats["admitted"] += 1
+        return None
+
+    async def claim(self, room_key: str, pid: str) -> Optional[web.Response]:
+        """
+        Место в комнате на всех воркерах: счёт ведёт брокер шины, локальная
+        проверка в check() видит только свой процесс. None — место выдано.
+        """
+        if BUS is None or await BUS.claim(room_key, pid, MAX_PEERS):
+            return None
+        self.stats["rejected_full"] += 1
+        return self._reject(503, {"type": "full", "capacity": MAX_PEERS}, retry_after=30)
+
+    @staticmethod
+    def _reject(status: int, body: dict, retry_after: int) -> web.Response:
+        return web.json_response(body, status=status, headers={"Retry-After": str(retry_after)})
+
+    def joined(self, room_key: str) -> None:
+        """Пир вошёл в комнату — дальше его место считает сама комната."""
+        n = self.pending.get(room_key, 0) - 1
+        if n > 0:
+            self.pending[room_key] = n
+        else:
+            self.pending.pop(room_key, None)
+
+    def cancel(self, ip: str, room_key: str) -> None:
+        """Снять резерв из check(), если до входа в комнату дело не дошло."""
+        self.joined(room_key)
+        self.release(ip)
+
+    def release(self, ip: str) -> None:
+        n = self.per_ip.get(ip, 0) - 1
+        if n > 0:
+            self.per_ip[ip] = n
+        else:
+            self.per_ip.pop(ip, None)
+        self.total = max(0, self.total - 1)
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, active=self.total, ips=len(self.per_ip))
+
+
+ADMISSION = AdmissionController(MAX_WS_PER_IP, MAX_WS_TOTAL)
+
+
+# ─── Шина между воркерами (см. workers.py) ──────────────────────────
+# None — обычный однопроцессный режим; иначе workers.BusClient
+BUS = None
+
+
+def _bus_send(msg: dict) -> None:
+    if BUS is not None:
+        BUS.send(msg)
+
+
+async def _on_bus_event(msg: dict) -> None:
+    """
+    События от других воркеров: членство в комнатах, рассылки и адресные
+    кадры. Ростер для своих клиентов ведём сами (свой seq), поэтому
+    join/name/leave превращаются в локальные дельты.
+    """
+    op = msg.get("op")
+    room = ROOMS.get(msg.get("room", ""))
+    if room is None:
+        return
+
+    if op in ("join", "members"):
+        members = msg.get("members") if op == "members" else [msg]
+        for m in members:
+            rid = m.get("id")
+            if not rid or rid in room.peers or rid in room.remote:
+                continue
+            room.remote.add(rid)
+            name = m.get("name") or ""
+            room.names[rid] = name
+            await _broadcast(room, {"type": "roster-add", "id": rid, "name": name, "seq": room.next_seq()})
+    elif op == "name":
+        rid = msg.get("id")
+        if rid in room.remote:
+            name = msg.get("name") or ""
+            room.names[rid] = name
+            await _broadcast(room, {"type": "roster-update", "id": rid, "name": name, "seq": room.next_seq()})
+    elif op == "leave":
+        rid = msg.get("id")
+        if rid in room.remote:
+            room.remote.discard(rid)
+            room.names.pop(rid, None)
+            await _broadcast(room, {"type": "roster-remove", "id": rid, "seq": room.next_seq()})
+    elif op == "bcast":
+        await _broadcast(room, msg.get("data") or {})
+    elif op == "fwd":
+        sess = room.peers.get(msg.get("to", ""))
+        if sess is not None:
+            typ = msg.get("typ", "")
+            payload = msg.get("payload") or {}
+            if typ in ("offer", "answer") and sess.ice is not None:
+                sess.ice.reset(payload.get("from"))
+            sess.send(typ, wire.encode(payload, sess.fmt))
+
+
+def _room_key(token: Optional[str]) -> str:
+    """Нормализует токен («token.X» и «X» — одна комната)."""
+    tok = (token or "").strip()
+    if tok.startswith("token."):
+        tok = tok.split("token.", 1)[1]
+    return tok or "default"
+
+
+# Статистика рассылок: сколько, кому и за сколько миллисекунд
+BROADCAST_STATS = {"count": 0, "recipients": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+
+
+async def _broadcast(room: Room, payload: dict, exclude: Optional[str] = None) -> float:
+    """
+    Рассылка по комнате: payload сериализуется один раз на формат, готовый кадр
+    кладётся в исходящие очереди получателей, запись идёт параллельно
+    их писателями. Упавшие/отключённые пиры убираются из комнаты.
+    Возвращает длительность рассылки в мс.
+    """
+    t0 = time.perf_counter()
+    targets = [sess for pid, sess in room.peers.items() if pid != exclude]
+    if targets:
+        typ = payload.get("type", "")
+        frame = wire.Frame(payload)
+        for sess in targets:
+            if not sess.send(typ, frame.get(sess.fmt)):
+                # закрываем WS; из комнаты пира уберёт его собственный обработчик
+                sess.abort()
+
+    elapsed_ms = (time.perf_counter() - t0) * 1000.0
+    st = BROADCAST_STATS
+    st["count"] += 1
+    st["recipients"] += len(targets)
+    st["total_ms"] += elapsed_ms
+    st["last_ms"] = elapsed_ms
+    M_BROADCAST.observe(elapsed_ms / 1000.0)
+    if elapsed_ms > st["max_ms"]:
+        st["max_ms"] = elapsed_ms
+    if elapsed_ms > 50:
+        log.info("[WS] slow broadcast %s to %d peers: %.1f ms", payload.get("type"), len(targets), elapsed_ms)
+    return elapsed_ms
+
+
+async def announce_public_url(url: str) -> None:
+    """Публичная ссылка сменилась (туннель перезапущен) — сообщаем всем комнатам."""
+    payload = {"type": "public-url", "url": url}
+    for room in list(ROOMS):
+        await _broadcast(room, payload)
+
+# ─── Обработчики WS-сообщений ───────────────────────────────────────
+# Таблица type -> обработчик собирается один раз; сигнатура у всех одна:
+# (сессия отправителя, комната, разобранный кадр, исходный кадр).
+async def _ws_name(session: PeerSession, room: Room, data: dict, raw) -> None:
+    pid = session.pid
+    name = data.get("name") or ""
+    if not isinstance(name, str):
+        return
+    name = name[:MAX_NAME_LEN]
+    if room.names.get(pid, "") == name:
+        return
+    room.names[pid] = name
+    await _broadcast(room, {"type": "roster-update", "id": pid, "name": name, "seq": room.next_seq()})
+    _bus_send({"op": "name", "room": room.key, "id": pid, "name": name})
+
+
+async def _ws_roster_sync(session: PeerSession, room: Room, data: dict, raw) -> None:
+    # клиент заметил разрыв в seq — шлём полный снимок только ему
+    session.send("roster", wire.encode(room.snapshot(), session.fmt))
+
+
+async def _ws_chat(session: PeerSession, room: Room, data: dict, raw) -> None:
+    text = data.get("text") or ""
+    text = text.strip()[:MAX_CHAT_LEN] if isinstance(text, str) else ""
+    if not text:
+        return
+    payload = {
+        "type": "chat",
+        "from": session.pid,
+        "name": room.names.get(session.pid, ""),
+        "text": text,
+        "ts": int(time.time() * 1000),
+    }
+    await _broadcast(room, payload)
+    _bus_send({"op": "bcast", "room": room.key, "data": payload})
+
+
+def _route(room: Room, to_id: str, typ: str, payload: dict) -> bool:
+    """Адресная доставка собранного payload: своему пиру или через шину."""
+    target = room.peers.get(to_id)
+    if target is not None:
+        return target.send(typ, wire.encode(payload, target.fmt))
+    if to_id in room.remote:
+        _bus_send({"op": "fwd", "room": room.key, "to": to_id, "typ": typ, "payload": payload})
+        return True
+    return False
+
+
+# Счётчики склейки ICE (для /status)
+ICE_STATS = {"candidates": 0, "duplicates": 0, "frames": 0}
+
+
+class IceCoalescer:
+    """
+    Склейка исходящих ICE одного отправителя: кандидаты к одному
+    получателю копятся ICE_COALESCE_MS и уходят одним кадром
+    {type: "ice", candidates: [...]}. Точные дубликаты по паре
+    отбрасываются; null (end-of-candidates) закрывает пачку сразу.
+    Новый offer/answer в паре (в том числе ICE restart) сбрасывает
+    память дубликатов — кандидаты заново собранного ICE проходят.
+    """
+    __slots__ = ("session", "room", "pending", "seen", "timers")
+
+    SEEN_MAX = 256  # на пару; при переполнении начинаем заново
+
+    def __init__(self, session: PeerSession, room: Room):
+        self.session = session
+        self.room = room
+        self.pending: Dict[str, list] = {}
+        self.seen: Dict[str, set] = {}
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+
+    def add(self, to_id: str, candidates: list) -> None:
+        batch = self.pending.setdefault(to_id, [])
+        seen = self.seen.setdefault(to_id, set())
+        end = False
+        for c in candidates:
+            ICE_STATS["candidates"] += 1
+            if c is None:
+                end = True
+                continue
+            key = f"{c['candidate']}|{c.get('sdpMid')}|{c.get('sdpMLineIndex')}"
+            if key in seen:
+                ICE_STATS["duplicates"] += 1
+                continue
+            if len(seen) >= self.SEEN_MAX:
+                seen.clear()
+            seen.add(key)
+            batch.append(c)
+
+        if end:
+            batch.append(None)
+            self.flush(to_id)
+        elif not batch:
+            self.pending.pop(to_id, None)
+        elif ICE_COALESCE_MS <= 0:
+            self.flush(to_id)
+        elif to_id not in self.timers:
+            self.timers[to_id] = asyncio.get_running_loop().call_later(ICE_COALESCE_MS / 1000.0, self.flush, to_id)
+
+    def flush(self, to_id: str) -> None:
+        h = self.timers.pop(to_id, None)
+        if h is not None:
+            h.cancel()
+        batch = self.pending.pop(to_id, None)
+        if not batch or self.session.closed:
+            return
+        pid = self.session.pid
+        payload = {"type": "ice", "to": to_id, "from": pid, "candidates": batch, "ts": int(time.time() * 1000)}
+        ICE_STATS["frames"] += 1
+        if _route(self.room, to_id, "ice", payload) and _log_sampled("ice"):
+            log.info("[WS→%s] ice x%d (from=%s)", to_id[:6], len(batch), pid[:6])
+
+    def reset(self, to_id) -> None:
+        """Пара пересогласуется: дописываем старую пачку и забываем дубликаты."""
+        if to_id in self.pending:
+            self.flush(to_id)
+        self.seen.pop(to_id, None)
+
+    def cancel(self) -> None:
+        for h in self.timers.values():
+            h.cancel()
+        self.timers.clear()
+        self.pending.clear()
+        self.seen.clear()
+
+
+async def _ws_forward(session: PeerSession, room: Room, data: dict, raw) -> None:
+    """
+    Адресные сообщения: проверяем только конверт (to, ts) и пересылаем
+    исходный кадр с дописанным "from". Тело (SDP, шифротекст) не
+    копируется и не сериализуется заново; перекодируем только если у
+    получателя другой формат или он на другом воркере. ice — отдельно,
+    через склейку отправителя (IceCoalescer).
+    """
+    t0 = time.perf_counter()
+    pid = session.pid
+    typ = data["type"]
+    to_id = data.get("to")
+    target = room.peers.get(to_id) if isinstance(to_id, str) else None
+    if target is None and not (isinstance(to_id, str) and to_id in room.remote):
+        return
+
+    # 2.2: server-side anti-replay ts check для адресных сообщений
+    if not validate_ts(room.key, pid, data.get("ts", 0)):
+        return
+
+    if typ == "ice":
+        # одиночный {candidate} или пачка {candidates: [...]}; уходит через склейку
+        cands = data.get("candidates")
+        if cands is None:
+            cands = [data.get("candidate")]
+        if not isinstance(cands, list) or not cands or len(cands) > ICE_BATCH_MAX:
+            return
+        for c in cands:
+            if c is not None and not (isinstance(c, dict) and isinstance(c.get("candidate"), str)):
+                return
+        session.ice.add(to_id, cands)
+        return
+    if typ in ("offer", "answer"):
+        session.ice.reset(to_id)
+        if target is not None and target.ice is not None:
+            target.ice.reset(pid)
+
+    if target is None:
+        # получатель на другом воркере — кадр уходит через шину,
+        # кодирует его воркер получателя под формат его сессии
+        data["from"] = pid
+        _bus_send({"op": "fwd", "room": room.key, "to": to_id, "typ": typ, "payload": data})
+        return
+    if target.fmt == session.fmt:
+        frame = wire.with_field(raw, session.fmt, "from", pid)
+    else:
+        data["from"] = pid
+        frame = wire.encode(data, target.fmt)
+    if target.send(typ, frame, t0):
+        if _log_sampled("forward"):
+            log.info("[WS→%s] %s (from=%s)", to_id[:6], typ, pid[:6])
+    else:
+        log.warning("[WS] forward %s to %s dropped (peer closed)", typ, to_id[:6])
+
+
+def _e2e_blob(value, limit: int) -> bool:
+    return isinstance(value, (str, bytes)) and 0 < len(value) <= limit
+
+
+async def _ws_chat_multi(session: PeerSession, room: Room, data: dict, raw) -> None:
+    """
+    chat-e2e-multi: одна строка E2E-чата сразу всем — {items: [{to, iv, ct}], ts}.
+    Антифлуд и anti-replay — один раз на кадр; получателям уходят обычные
+    chat-e2e (клиентский приём не меняется). Элементы с iv/ct не того типа
+    или длины пропускаются.
+    """
+    items = data.get("items")
+    if not isinstance(items, list) or not items or len(items) > room.capacity:
+        return
+    pid = session.pid
+    ts = data.get("ts", 0)
+    if not validate_ts(room.key, pid, ts):
+        return
+
+    seen = set()
+    delivered = 0
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        to_id = item.get("to")
+        if not isinstance(to_id, str) or to_id == pid or to_id in seen:
+            continue
+        iv, ct = item.get("iv"), item.get("ct")
+        if not (_e2e_blob(iv, MAX_E2E_IV_LEN) and _e2e_blob(ct, MAX_E2E_CT_LEN)):
+            continue
+        seen.add(to_id)
+        payload = {"type": "chat-e2e", "to": to_id, "iv": iv, "ct": ct, "ts": ts, "from": pid}
+        if _route(room, to_id, "chat-e2e", payload):
+            delivered += 1
+    if _log_sampled("forward"):  # фан-аут — та же горячая категория, что и адресные кадры
+        log.info("[WS] chat-e2e-multi from %s to %d peers", pid[:6], delivered)
+
+
+WS_HANDLERS = {
+    "name": _ws_name,
+    "roster-sync": _ws_roster_sync,
+    "chat": _ws_chat,
+    "offer": _ws_forward,
+    "answer": _ws_forward,
+    "ice": _ws_forward,
+    "key": _ws_forward,
+    "chat-e2e": _ws_forward,
+    "chat-e2e-multi": _ws_chat_multi,
+    "safety-ok": _ws_forward,
+}
+
+
+async def _dispatch(session: PeerSession, room: Room, raw) -> bool:
+    """
+    Один входящий кадр: разбор, выбор обработчика по таблице, антифлуд
+    (полная стоимость типа списывается один раз), вызов.
+    False — кадр отброшен антифлудом.
+    """
+    # Безопасный парсинг (кадр должен соответствовать формату сессии)
+    data = wire.decode(raw, session.fmt)
+    typ = data.get("type") if data is not None else None
+    handler = WS_HANDLERS.get(typ) if isinstance(typ, str) else None
+    if handler is None:
+        if data is not None:
+            M_WS_IN.inc("other")
+        # мусорные и неизвестные кадры тоже стоят базовый токен
+        return WS_LIMITER.allow(session.pid)
+    M_WS_IN.inc(typ)
+
+    if not WS_LIMITER.allow(session.pid, WS_LIMITER.cost_of(typ)):
+        return False
+
+    await handler(session, room, data, raw)
+    return True
+
 
 def _is_browser(request) -> bool:
     """
@@ -278,7 +1100,6 @@ def _is_browser(request) -> bool:
 
 async def http_ws(request):
     # ── В продакшене принимаем апгрейд только по WSS/HTTPS ───────────
-    PROD = os.environ.get("PROD") == "1"
     is_secure = request.secure or (request.headers.get("X-Forwarded-Proto", "").lower() in ("https", "wss"))
     if PROD and not is_secure:
         log.warning("[WS] insecure WS in PROD from %s", request.remote)
@@ -291,25 +1112,32 @@ async def http_ws(request):
         return web.Response(status=403, text="Forbidden")
 
     # ── Token из subprotocol (основной способ) или query (?t=) для совместимости
+    # Префикс «mp.» у элемента — клиент умеет MessagePack (см. wire.py);
+    # элементы с форматом, который сервер не поддерживает, пропускаем.
     expected = ROOM_TOKEN  # может быть пустым
     offered = (request.headers.get("Sec-WebSocket-Protocol") or "")
-    offered_items = [x.strip() for x in offered.split(",") if x.strip()]
+    offered_items = [
+        x.strip() for x in offered.split(",")
+        if x.strip() and wire.split_protocol(x.strip())[0] in wire.FORMATS
+    ]
 
     proto_token = None
     matched_item = None
     for item in offered_items:
+        tok = wire.split_protocol(item)[1]
         if expected:
-            if item == expected or (item.startswith("token.") and item.split("token.", 1)[1] == expected):
+            if tok == expected or (tok.startswith("token.") and tok.split("token.", 1)[1] == expected):
                 proto_token = expected
                 matched_item = item
                 break
         else:
-            if item and item != "null":
-                proto_token = item
+            if tok and tok != "null":
+                proto_token = tok
                 matched_item = item
                 break
 
-    qtok = request.query.get("t", "")
+    # X-Room-Token — для fetch-проверки допуска из браузера (см. rtc.js)
+    qtok = request.query.get("t", "") or request.headers.get("X-Room-Token", "")
 
     authed = (proto_token == expected or qtok == expected) if expected else True
     if not authed:
@@ -324,157 +1152,141 @@ async def http_ws(request):
         await ws_tmp.close()
         return ws_tmp
 
-    # ── Лимит одновременных подключений с одного IP (базовая защита) ─
+    # ── Допуск: лимит по IP, общий лимит и вместимость комнаты ───────
     ip = (request.headers.get("X-Forwarded-For", request.remote or "unknown").split(",")[0].strip())
-    max_per_ip = int(os.environ.get("MAX_WS_PER_IP", "3"))
-    conns_from_ip = sum(1 for _pid, _ws in ROOM["peers"].items() if getattr(_ws, "_ip", "") == ip)
-    if conns_from_ip >= max_per_ip:
-        log.warning("[WS] too many connections from %s", ip)
-        return web.Response(status=429, text="Too Many Connections from this IP")
-
-    # ── Лимит вместимости комнаты ────────────────────────────────────
-    if len(ROOM["peers"]) >= MAX_PEERS:
-        ws_tmp = web.WebSocketResponse(heartbeat=20, max_msg_size=MAX_MSG_SIZE)
-        await ws_tmp.prepare(request)
-        await ws_tmp.send_json({"type": "full", "capacity": MAX_PEERS})
-        await ws_tmp.close()
-        return ws_tmp
+    room_key = _room_key(proto_token or qtok or ROOM_TOKEN)
+    rejected = ADMISSION.check(ip, room_key)
+    if rejected is not None:
+        return rejected
+    pid = uuid.uuid4().hex
+    try:
+        rejected = await ADMISSION.claim(room_key, pid)
+    except BaseException:
+        ADMISSION.cancel(ip, room_key)
+        raise
+    if rejected is not None:
+        ADMISSION.cancel(ip, room_key)
+        return rejected
 
     # ── Эхо выбора субпротокола (важно для Chrome) ───────────────────
-    if matched_item:
-        ws = web.WebSocketResponse(heartbeat=20, max_msg_size=MAX_MSG_SIZE, protocols=[matched_item])
-    elif offered_items:
-        ws = web.WebSocketResponse(heartbeat=20, max_msg_size=MAX_MSG_SIZE, protocols=[offered_items[0]])
+    echoed = matched_item or (offered_items[0] if offered_items else None)
+    # heartbeat и ответы на ping — сами (PeerSession._ping_loop), чтобы мерить RTT
+    if echoed:
+        ws = web.WebSocketResponse(autoping=False, max_msg_size=MAX_MSG_SIZE, protocols=[echoed])
     else:
-        ws = web.WebSocketResponse(heartbeat=20, max_msg_size=MAX_MSG_SIZE)
+        ws = web.WebSocketResponse(autoping=False, max_msg_size=MAX_MSG_SIZE)
+    fmt = wire.split_protocol(echoed)[0] if echoed else wire.JSON
 
-    await ws.prepare(request)
+    try:
+        await ws.prepare(request)
+    except BaseException:
+        ADMISSION.cancel(ip, room_key)
+        _bus_send({"op": "leave", "room": room_key, "id": pid})  # вернуть место брокеру
+        raise
 
     # 2.1: привязка «room» к WS-сессии + заготовка peer id
-    ws._room_token = matched_item or request.query.get("t", "") or ROOM_TOKEN or "default"
+    ws._room_token = room_key
     ws._peer_id = None
-    ws._ip = ip  # сохраняем IP для подсчёта активных коннектов с этого адреса
 
     # ── Регистрация пира ─────────────────────────────────────────────
-    pid = uuid.uuid4().hex
     ws._peer_id = pid  # для anti-replay/очистки
-    ROOM["peers"][pid] = ws
-    roster = [{"id": p, "name": ROOM["names"].get(p, "")} for p in ROOM["peers"].keys()]
-    await ws.send_json({"type": "hello", "id": pid, "roster": roster})
-    await _broadcast({"type": "peer-joined", "id": pid}, exclude=pid)
-    log.info("[WS] peer joined: %s (total=%d)", pid[:6], len(ROOM["peers"]))
-
-    # ── Антифлуд ─────────────────────────────────────────────────────
-    last_ts = 0
-    msg_count = 0
+    session = PeerSession(pid, ws, ip, fmt)
+    session.start()
+    room = ROOMS.acquire(room_key)
+    session.room = room
+    session.ice = IceCoalescer(session, room)
+    ROOMS.join(room, session)
+    ADMISSION.joined(room_key)
+    seq = room.next_seq()
+    hello = room.snapshot("hello")
+    hello["id"] = pid
+    session.send("hello", wire.encode(hello, fmt))
+    await _broadcast(room, {"type": "roster-add", "id": pid, "name": "", "seq": seq}, exclude=pid)
+    _bus_send({"op": "join", "room": room_key, "id": pid, "name": ""})
+    log.info("[WS] peer joined: %s (room=%d, rooms=%d)", pid[:6], len(room.peers), len(ROOMS))
+
+    # ── Антифлуд (token bucket, стоимость по типу — в _dispatch)
+    flood_logged = False
 
     try:
         async for msg in ws:
-            now_sec = int(time.time())
-            if now_sec != last_ts:
-                last_ts = now_sec
-                msg_count = 0
-            if msg_count >= MAX_MSGS_PER_SEC:
-                if msg_count == MAX_MSGS_PER_SEC:
-                    log.warning("[WS] rate limit exceeded for %s", pid[:6])
+            if msg.type == web.WSMsgType.PONG:
+                session.on_pong()
                 continue
-            msg_count += 1
 
-            if msg.type != web.WSMsgType.TEXT:
+            if msg.type not in (web.WSMsgType.TEXT, web.WSMsgType.BINARY):
                 if msg.type in (web.WSMsgType.ERROR, web.WSMsgType.CLOSE):
                     break
+                if msg.type == web.WSMsgType.PING and WS_LIMITER.allow(pid):
+                    await ws.pong(msg.data)
                 continue
 
-            # Безопасный парсинг
-            try:
-                data = json.loads(msg.data)
-            except Exception:
-                continue
-
-            typ = data.get("type")
-            # Разрешённые типы
-            if typ not in {"name", "chat", "offer", "answer", "ice", "key", "chat-e2e", "safety-ok"}:
-                continue
-
-            if typ == "name":
-                ROOM["names"][pid] = (data.get("name") or "")[:MAX_NAME_LEN]
-                await _broadcast({
-                    "type": "roster",
-                    "roster": [{"id": p, "name": ROOM["names"].get(p, "")} for p in ROOM["peers"].keys()],
-                })
-                continue
-
-            if typ == "chat":
-                text = (data.get("text") or "").strip()[:MAX_CHAT_LEN]
-                if not text:
-                    continue
-                payload = {
-                    "type": "chat",
-                    "from": pid,
-                    "name": ROOM["names"].get(pid, ""),
-                    "text": text,
-                    "ts": int(time.time() * 1000),
-                }
-                await _broadcast(payload)
-                continue
-
-            # Адресные сообщения
-            to_id = data.get("to")
-            if not to_id or to_id not in ROOM["peers"]:
-                continue
-
-            # 2.2: server-side anti-replay ts check для адресных сообщений
-            room = getattr(ws, "_room_token", "default")
-            sender_id = getattr(ws, "_peer_id", "")
-            ts_val = data.get("ts", 0)
-            if not validate_ts(room, sender_id, ts_val):
-                continue
-
-            if typ == "ice":
-                cand = data.get("candidate", None)
-                if cand is not None and not isinstance(cand, dict):
-                    continue
-                # candidate/sdp не логируем
-
-            payload = dict(data)
-            payload["from"] = pid
-            try:
-                await ROOM["peers"][to_id].send_json(payload)
-                log.info("[WS→%s] %s (from=%s)", to_id[:6], typ, pid[:6])
-            except Exception as e:
-                log.warning("[WS] forward %s to %s failed: %s", typ, to_id[:6], e)
+            if await _dispatch(session, room, msg.data):
+                flood_logged = False
+            elif not flood_logged:
+                flood_logged = True
+                log.warning("[WS] rate limit exceeded for %s", pid[:6])
 
     finally:
-        try:
-            await ws.close()
-        except Exception:
-            pass
-        ROOM["peers"].pop(pid, None)
-        ROOM["names"].pop(pid, None)
-        await _broadcast({"type": "peer-left", "id": pid})
-        log.info("[WS] peer left: %s (total=%d)", pid[:6], len(ROOM["peers"]))
+        await session.close()
+        ADMISSION.release(ip)
+        WS_LIMITER.forget(pid)
+        _bus_send({"op": "leave", "room": room_key, "id": pid})
+        if ROOMS.leave(room, pid):
+            await _broadcast(room, {"type": "roster-remove", "id": pid, "seq": room.next_seq()})
+        log.info("[WS] peer left: %s (room=%d, rooms=%d)", pid[:6], len(room.peers), len(ROOMS))
 
         # 2.3: очистка состояния anti-replay для этого пользователя
-        try:
-            room = getattr(ws, "_room_token", "default")
-            _ = replay_guard.get(room, None)
-            if _ is not None:
-                replay_guard[room].pop(pid, None)
-                if not replay_guard[room]:
-                    replay_guard.pop(room, None)
-        except Exception:
-            pass
+        REPLAY_GUARD.forget(room_key, pid)
 
     return ws
 
 
+# ─── Метрики: счётчики, которые уже ведут подсистемы ────────────────
+def _collect_metrics():
+    """Снимается при scrape: текущие значения без учёта на горячем пути."""
+    sizes: Dict[str, int] = {}
+    for room in ROOMS:
+        n = str(len(room.peers))
+        sizes[n] = sizes.get(n, 0) + 1
+    adm = ADMISSION.stats
+    return [
+        ("securecall_peers", "gauge", "Connected peers on this worker", [({}, ROOMS.total_peers())]),
+        ("securecall_rooms", "gauge", "Active rooms on this worker", [({}, len(ROOMS))]),
+        # комнаты по числу локальных пиров (ключ комнаты — токен, в метки его не выносим)
+        ("securecall_rooms_by_peers", "gauge", "Rooms by local peer count",
+         [({"peers": n}, c) for n, c in sorted(sizes.items(), key=lambda x: int(x[0]))]),
+        ("securecall_outbox_queued", "gauge", "Frames waiting in peer outboxes", [({}, ROOMS.queued())]),
+        ("securecall_ratelimit_rejected_total", "counter", "Rate limiter rejections",
+         [({"scope": "ws"}, WS_LIMITER.denied), ({"scope": "http"}, HTTP_LIMITER.denied)]),
+        ("securecall_replay_rejected_total", "counter", "Addressed messages rejected by the replay guard",
+         [({}, REPLAY_GUARD.rejected)]),
+        ("securecall_admission_rejected_total", "counter", "WS upgrades rejected before the handshake",
+         [({"reason": "ip"}, adm["rejected_ip"]), ({"reason": "full"}, adm["rejected_full"]),
+          ({"reason": "busy"}, adm["rejected_busy"])]),
+        ("securecall_outbox_disconnected_total", "counter", "Slow consumers disconnected by outbox policy",
+         [({}, OUTBOX_STATS["disconnected"])]),
+        ("securecall_outbox_dropped_total", "counter", "Frames dropped by outbox policy",
+         [({"reason": "ice"}, OUTBOX_STATS["dropped_ice"]), ({"reason": "new"}, OUTBOX_STATS["dropped_new"])]),
+        ("securecall_ice_duplicates_total", "counter", "Duplicate ICE candidates dropped by the relay",
+         [({}, ICE_STATS["duplicates"])]),
+    ]
+
+
+METRICS.add_collector(_collect_metrics)
+
+
 # ─── HTTP сервер ───────────────────────────────────────────────────
-async def start_http_server(max_peers: int = 2):
+def build_app(max_peers: int = 2) -> web.Application:
     """
-    Старт HTTP/WS сервера. Лимит участников задаётся параметром, по умолчанию 2.
+    Приложение aiohttp со всеми маршрутами и middleware (без сокета и
+    фоновых задач) — его же поднимают бенчмарки через TestServer.
     """
-    global MAX_PEERS
+    global MAX_PEERS, ASSETS
     MAX_PEERS = max(1, min(10, int(max_peers)))
+    WS_LIMITER.burst = _ws_burst(MAX_PEERS)
+    # DEBUG=1 — без бандла: index.html грузит исходные /app.js и /js/*
+    ASSETS = AssetCache(STATIC_DIR, bundle=os.environ.get("DEBUG") != "1").build()
 
     app = web.Application(middlewares=[security_headers_mw, rate_limit_mw])
     app.add_routes([
@@ -482,17 +1294,32 @@ async def start_http_server(max_peers: int = 2):
         web.get("/ws", http_ws),
         web.get("/healthz", http_healthz),
         web.get("/status", http_status),
+        web.get("/metrics", http_metrics),
+        web.get("/logs", http_logs),
         web.get("/app.js", http_app),           # опционально
         web.get("/style.css", http_style),
         web.get("/icon.svg", http_icon),
+        web.get("/js/{name}", http_js),
+        web.get("/bundle.{hash}.js", http_bundle),
     ])
-    app.router.add_static("/js/", path=str(STATIC_DIR / "js"), show_index=False)
+    return app
+
+
+async def start_http_server(max_peers: int = 2, reuse_port: bool = False):
+    """
+    Старт HTTP/WS сервера. Лимит участников задаётся параметром, по умолчанию 2.
+    reuse_port=True — SO_REUSEPORT, чтобы несколько воркеров слушали HTTP_PORT.
+    """
+    app = build_app(max_peers)
+
+    _BACKGROUND.add(asyncio.ensure_future(_replay_sweeper()))
+    sample_loop_lag(asyncio.get_running_loop()).subscribe(_on_loop_lag)
 
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, "0.0.0.0", HTTP_PORT)
+    site = web.TCPSite(runner, "0.0.0.0", HTTP_PORT, reuse_port=reuse_port or None)
     await site.start()
-    log.info("[HTTP] http://0.0.0.0:%d (/, /style.css, /app.js, /icon.svg, /ws, /healthz, /status) — capacity=%d",
+    log.info("[HTTP] http://0.0.0.0:%d (/, /style.css, /app.js, /icon.svg, /ws, /healthz, /status, /metrics, /logs) — capacity=%d",
              HTTP_PORT, MAX_PEERS)
 
 
@@ -500,8 +1327,11 @@ async def start_http_server(max_peers: int = 2):
 __all__ = [
     "HTTP_PORT",
     "get_local_ip",
+    "announce_public_url",
     "udp_discover",
+    "udp_discover_all",
     "wait_port",
+    "build_app",
     "start_http_server",
     "start_udp_responder",
     "log",
@@ -0,0 +1,261 @@
+# discovery.py
+# ────────────────────────────────────────────────────────────────────
+# UDP discovery хостов в локальной сети на asyncio (DatagramProtocol):
+# • ответчик — протокол в цикле событий, без отдельного потока;
+#   ответ закодирован заранее и перекодируется только при изменении
+# • поиск не блокирует цикл: одна точка, зонды уходят и на broadcast,
+#   и на multicast-группу; за окно собираются ВСЕ ответившие хосты
+#   (дубликаты по адресу схлопываются, у каждого RTT первого ответа)
+# • результат кэшируется на DISCOVERY_CACHE_TTL секунд (отдельно для
+#   каждых port/group/broadcast); параллельные
+#   вызовы ждут один и тот же поиск
+# • ответ может нести нагрузку хоста (peers/capacity/rooms/lag_ms);
+#   снимок берётся лениво — при зонде, не чаще DISCOVERY_REFRESH
+# • rank(): выбор наименее загруженного хоста или ближайшего по RTT
+# Настройки (env):
+#   DISCOVERY_GROUP ("239.255.37.20"; пусто — без multicast)
+#   DISCOVERY_CACHE_TTL (5)   DISCOVERY_REFRESH (1)
+#   DISCOVERY_PREFER ("load" | "rtt")
+# ────────────────────────────────────────────────────────────────────
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+DISCOVERY_PORT = 37020
+DISCOVERY_MSG = b"SECURECALL_WEBRTC_DISCOVER_V2"
+DISCOVERY_GROUP = os.environ.get("DISCOVERY_GROUP", "239.255.37.20")
+BROADCAST_ADDR = "255.255.255.255"
+DISCOVERY_PREFER = os.environ.get("DISCOVERY_PREFER", "load")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+CACHE_TTL = _env_float("DISCOVERY_CACHE_TTL", 5.0)
+REFRESH_SEC = _env_float("DISCOVERY_REFRESH", 1.0)
+
+# Ранжирование по нагрузке: score = занятость (peers/capacity) + лаг цикла
+# в долях LAG_BUDGET_MS (100 мс лага ≈ полностью занятый хост).
+# Хост без сведений о нагрузке (старый или супервизор воркеров) — UNKNOWN_LOAD.
+LAG_BUDGET_MS = 100.0
+UNKNOWN_LOAD = 0.5
+
+Reply = Union[dict, Callable[[], dict]]
+
+log = logging.getLogger("SecureCallWebRTC")
+
+
+# ─── Ответчик ───────────────────────────────────────────────────────
+class DiscoveryResponder(asyncio.DatagramProtocol):
+    """
+    Отвечает на DISCOVERY_MSG заранее закодированным JSON. reply —
+    словарь или функция-снимок; функцию зовём не чаще раза в refresh
+    секунд и только когда пришёл зонд.
+    """
+
+    def __init__(self, reply: Reply, refresh: float = REFRESH_SEC):
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.provider: Optional[Callable[[], dict]] = reply if callable(reply) else None
+        self.refresh = refresh
+        self._reply_obj: Optional[dict] = None
+        self._reply_at = 0.0
+        self.reply = b""
+        self.probes = 0
+        self.set_reply(self.provider() if self.provider else reply)
+
+    def set_reply(self, reply: dict) -> None:
+        self._reply_at = time.monotonic()
+        if reply != self._reply_obj:
+            self._reply_obj = dict(reply)
+            self.reply = json.dumps(reply, separators=(",", ":")).encode("utf-8")
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if data == DISCOVERY_MSG and self.transport is not None:
+            self.probes += 1
+            if self.provider is not None and time.monotonic() - self._reply_at >= self.refresh:
+                try:
+                    self.set_reply(self.provider())
+                except Exception as e:  # отвечаем прошлым снимком
+                    log.debug("[UDP] reply provider failed: %s", e)
+                    self._reply_at = time.monotonic()
+            self.transport.sendto(self.reply, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        log.debug("[UDP] responder error: %s", exc)
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+
+def _responder_socket(port: int, group: str) -> socket.socket:
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(("0.0.0.0", port))
+    if group:
+        try:
+            mreq = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton("0.0.0.0"))
+            s.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        except OSError as e:
+            log.info("[UDP] multicast group %s unavailable: %s", group, e)
+    s.setblocking(False)
+    return s
+
+
+async def start_responder(reply: Reply, port: int = DISCOVERY_PORT, group: str = DISCOVERY_GROUP,
+                          refresh: float = REFRESH_SEC) -> Optional[DiscoveryResponder]:
+    """Поднимает ответчик в текущем цикле; None, если порт занят."""
+    try:
+        sock = _responder_socket(port, group)
+    except OSError as e:
+        log.warning("[UDP] bind failed: %s", e)
+        return None
+    loop = asyncio.get_running_loop()
+    _, proto = await loop.create_datagram_endpoint(lambda: DiscoveryResponder(reply, refresh), sock=sock)
+    log.info("[UDP] discovery responder on %s%s", port, f" (+ multicast {group})" if group else "")
+    return proto
+
+
+# ─── Поиск ──────────────────────────────────────────────────────────
+class _Probe(asyncio.DatagramProtocol):
+    """Собирает ответы хостов; ключ — (адрес, порт HTTP)."""
+
+    def __init__(self):
+        self.sent_at = 0.0
+        self.hosts: Dict[Tuple[str, int], dict] = {}
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            info = json.loads(data.decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            return
+        if not isinstance(info, dict) or info.get("role") != "host":
+            return
+        try:
+            key = (addr[0], int(info.get("port") or 0))
+        except (TypeError, ValueError):
+            return
+        if key not in self.hosts:
+            info["host"] = addr[0]
+            info["rtt_ms"] = round((time.monotonic() - self.sent_at) * 1000, 2)
+            self.hosts[key] = info
+
+    def error_received(self, exc: Exception) -> None:
+        log.debug("[UDP] probe error: %s", exc)
+
+
+# Кэш и текущие поиски — по параметрам зонда (port, group, broadcast)
+ProbeKey = Tuple[int, str, bool]
+_CACHE: Dict[ProbeKey, Tuple[float, List[dict]]] = {}
+_INFLIGHT: Dict[ProbeKey, asyncio.Future] = {}
+
+
+async def _probe(timeout: float, attempts: int, port: int, group: str, broadcast: bool) -> List[dict]:
+    loop = asyncio.get_running_loop()
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        s.bind(("0.0.0.0", 0))
+        s.setblocking(False)
+        transport, proto = await loop.create_datagram_endpoint(_Probe, sock=s)
+    except BaseException:
+        s.close()  # транспорта ещё нет — сокет закрываем сами
+        raise
+    try:
+        targets = ([(BROADCAST_ADDR, port)] if broadcast else []) + ([(group, port)] if group else [])
+        # окно timeout делим на attempts повторов (UDP теряется); RTT
+        # считаем от первого зонда
+        step = timeout / max(1, attempts)
+        proto.sent_at = time.monotonic()
+        for _ in range(max(1, attempts)):
+            for dst in targets:
+                try:
+                    transport.sendto(DISCOVERY_MSG, dst)
+                except OSError as e:
+                    log.debug("[UDP] probe to %s failed: %s", dst[0], e)
+            await asyncio.sleep(step)
+    finally:
+        transport.close()
+    return sorted(proto.hosts.values(), key=lambda h: h["rtt_ms"])
+
+
+async def discover(timeout: float = 1.0, attempts: int = 3, *, port: int = DISCOVERY_PORT,
+                   group: str = DISCOVERY_GROUP, broadcast: bool = True,
+                   cache_ttl: float = CACHE_TTL, refresh: bool = False) -> List[dict]:
+    """
+    Все хосты, ответившие за окно timeout, по возрастанию RTT.
+    Каждый элемент — ответ хоста + "host" (адрес) и "rtt_ms".
+    """
+    key = (port, group, broadcast)
+    expires, hosts = _CACHE.get(key, (0.0, []))
+    if not refresh and cache_ttl > 0 and time.monotonic() < expires:
+        return [dict(h) for h in hosts]
+    inflight = _INFLIGHT.get(key)
+    if inflight is not None and not inflight.done():
+        return [dict(h) for h in await asyncio.shield(inflight)]
+
+    inflight = _INFLIGHT[key] = asyncio.ensure_future(_probe(timeout, attempts, port, group, broadcast))
+    try:
+        hosts = await asyncio.shield(inflight)
+    finally:
+        if inflight.done() and _INFLIGHT.get(key) is inflight:
+            del _INFLIGHT[key]
+    _CACHE[key] = (time.monotonic() + cache_ttl, hosts)
+    return [dict(h) for h in hosts]
+
+
+def clear_cache() -> None:
+    _CACHE.clear()
+
+
+# ─── Выбор хоста ────────────────────────────────────────────────────
+def load_score(host: dict) -> float:
+    """Чем меньше, тем свободнее хост; заполненный хост — не меньше 1."""
+    try:
+        capacity = float(host["capacity"])
+        util = float(host["peers"]) / capacity if capacity > 0 else 1.0
+    except (KeyError, TypeError, ValueError):
+        util = UNKNOWN_LOAD
+    try:
+        lag = float(host.get("lag_ms") or 0.0) / LAG_BUDGET_MS
+    except (TypeError, ValueError):
+        lag = 0.0
+    return util + lag
+
+
+def rank(hosts: List[dict], prefer: str = DISCOVERY_PREFER) -> List[dict]:
+    """
+    Хосты в порядке предпочтения: prefer="load" — по load_score, при
+    равенстве по RTT; prefer="rtt" — по RTT, но заполненные хосты в конце.
+    """
+    if prefer == "rtt":
+        return sorted(hosts, key=lambda h: (load_score(h) >= 1.0, h.get("rtt_ms", 0.0)))
+    return sorted(hosts, key=lambda h: (round(load_score(h), 3), h.get("rtt_ms", 0.0)))
+
+
+__all__ = [
+    "DISCOVERY_GROUP",
+    "DISCOVERY_MSG",
+    "DISCOVERY_PORT",
+    "DiscoveryResponder",
+    "clear_cache",
+    "discover",
+    "load_score",
+    "rank",
+    "start_responder",
+]
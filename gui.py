@@ -1,13 +1,14 @@
 """Neon/Glass GUI for Secure Call — refined to match index.html aesthetics."""
 
 import os
+import threading
 import tkinter as tk
 import tkinter.ttk as ttk
 import tkinter.font as tkfont
 import webbrowser
-import threading
 
 from async_runner import AsyncRunner
+from process_runner import ProcessRunner
 from core import HTTP_PORT, get_local_ip, log, start_http_server, start_udp_responder
 from tunnel import start_localhost_run_tunnel, stop_localhost_run_tunnel
 
@@ -89,10 +90,11 @@ def apply_theme(root: tk.Tk) -> ttk.Style:
 # App
 # ─────────────────────────────────────────────────────────────────────
 class App:
-    def __init__(self, root: tk.Tk, runner: AsyncRunner) -> None:
+    def __init__(self, root: tk.Tk, runner: "AsyncRunner | ProcessRunner") -> None:
         self.root = root
         self.runner = runner
         self.server_started = False
+        self.stopping = False
         self.public_url: str | None = None
 
         self.root.title("Secure Call — WebRTC")
@@ -172,6 +174,11 @@ class App:
         self.status = ttk.Label(card, text="Ready.", style="Status.TLabel")
         self.status.pack(pady=(2, 0))
 
+        # Loop health (read from the runner thread-safely)
+        self.loop_label = ttk.Label(card, text="", style="Status.TLabel")
+        self.loop_label.pack(pady=(2, 0))
+        self._refresh_loop_stats()
+
     # ── Actions ──────────────────────────────────────────────────────
     def _start(self, mode: str) -> None:
         if self.server_started:
@@ -193,9 +200,10 @@ class App:
         self.set_status(f"Starting hosting · mode={mode}, capacity={cap}…", "info")
         self.server_started = True
 
-        # Start HTTP/WS
+        # Start HTTP/WS (and everything server-side) on the runner: with
+        # ProcessRunner it lives in another process, away from Tk.
         self.runner.submit(start_http_server(max_peers=cap))
-        start_udp_responder()
+        self.runner.submit(start_udp_responder())
 
         # Start public tunnel in background
         def on_url(url: str) -> None:
@@ -207,33 +215,72 @@ class App:
                 self.btn_stop.state(["!disabled"])
             self.root.after(0, apply)
 
-        threading.Thread(
-            target=start_localhost_run_tunnel,
-            name="TunnelStarter",
-            kwargs={"local_port": HTTP_PORT, "on_url": on_url},
-            daemon=True,
-        ).start()
+        self.runner.submit(start_localhost_run_tunnel(local_port=HTTP_PORT, on_url=on_url))
 
-    def _stop(self) -> None:
+    def _stop(self, then=None) -> None:
         # Soft stop: close tunnel and unlock UI. (HTTP shutdown would need extra plumbing.)
+        # The tunnel stop runs on the runner; Tk only waits for its callback.
+        if self.stopping:
+            return
+        self.stopping = True
+        self.btn_stop.state(["disabled"])
+        self.set_status("Stopping…", "info")
+
+        def finish() -> None:
+            if not self.stopping:
+                return
+            self.stopping = False
+            self.btn_1x1.state(["!disabled"])
+            self.btn_grp.state(["!disabled"])
+            self.set_status("Hosting stopped. You can start again.", "info")
+            self.url_label.config(text="")
+            self.public_url = None
+            self.server_started = False
+            if then is not None:
+                then()
+
         try:
-            stop_localhost_run_tunnel()
+            fut = self.runner.submit(stop_localhost_run_tunnel())
+            fut.add_done_callback(lambda _f: self._post(finish))
         except Exception:
-            pass
-
-        self.btn_stop.state(["disabled"])
-        self.btn_1x1.state(["!disabled"])
-        self.btn_grp.state(["!disabled"])
-        self.set_status("Hosting stopped. You can start again.", "info")
-        self.url_label.config(text="")
-        self.public_url = None
-        self.server_started = False
+            finish()
+            return
+        self.root.after(5000, finish)  # give up waiting, as the old blocking call did
 
     def stop(self) -> None:
-        self._stop()
-        self.root.destroy()
+        self._stop(then=self.root.destroy)
 
     # ── UI helpers ───────────────────────────────────────────────────
+    def _post(self, fn) -> None:
+        """Run ``fn`` on the Tk thread; safe to call from worker threads."""
+        try:
+            self.root.after(0, fn)
+        except (RuntimeError, tk.TclError):
+            pass  # window already destroyed
+
+    def _refresh_loop_stats(self) -> None:
+        # With ProcessRunner stats() is a pipe round-trip: poll off the Tk thread.
+        def poll() -> None:
+            try:
+                st = self.runner.stats()
+            except Exception:
+                st = None
+            self._post(lambda: self._show_loop_stats(st))
+
+        threading.Thread(target=poll, name="gui-stats", daemon=True).start()
+
+    def _show_loop_stats(self, st) -> None:
+        try:
+            if st is not None:
+                text = (f"loop: {st['loop'] or '—'} · lag {st['lag_last_ms']:.1f} ms "
+                        f"(max {st['lag_max_ms']:.1f}) · stalls {st['stalls']}")
+                if st["debug"]:
+                    text += f" · slow callbacks {st['slow_callbacks']}"
+                self.loop_label.config(text=text)
+        except Exception:
+            pass
+        self.root.after(2000, self._refresh_loop_stats)
+
     def set_status(self, text: str, level: str = "info") -> None:
         colors = {"ok": OK, "info": MUTED, "warn": WARN, "error": DANGER}
         self.status.config(text=text, foreground=colors.get(level, MUTED))
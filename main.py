@@ -1,15 +1,21 @@
 """Entry point for the Secure Call application."""
 
-import threading
+import os
 import tkinter as tk
 from pathlib import Path
 
 from async_runner import AsyncRunner
 from core import log  # логгер берём из актуального модуля
 from gui import App
+from process_runner import ProcessRunner
 
 def main() -> None:
-    runner = AsyncRunner()
+    # RUNNER=process (по умолчанию): сигналинг в отдельном процессе, Tk не
+    # делит с ним GIL. RUNNER=thread — прежний режим, цикл в потоке.
+    if os.environ.get("RUNNER", "process").lower() == "thread":
+        runner = AsyncRunner()
+    else:
+        runner = ProcessRunner()
     runner.start()
 
     # ВНИМАНИЕ: сервер НЕ стартуем здесь.
@@ -25,7 +31,10 @@ def main() -> None:
 
     app = App(root, runner)
     root.protocol("WM_DELETE_WINDOW", app.stop)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        runner.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,160 @@
+# metrics.py
+# ────────────────────────────────────────────────────────────────────
+# Метрики в текстовом формате Prometheus (exposition format 0.0.4)
+# без внешних зависимостей.
+# • Counter / Gauge / Histogram с фиксированным набором меток;
+#   обновление — O(1) (словарь по кортежу значений меток)
+# • collector — функция, которую зовут при каждом scrape: так
+#   экспортируются уже существующие счётчики (ratelimit, replay,
+#   admission) без двойного учёта на горячем пути
+# ────────────────────────────────────────────────────────────────────
+
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Секунды: от 100 мкс до 10 с
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Sample = Tuple[str, Dict[str, str], float]  # (суффикс имени, метки, значение)
+
+
+def _esc(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in labels.items()) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, int) or float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, doc, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        for key, v in self._values.items():
+            yield "", self._labels(key), v
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, doc, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def samples(self) -> Iterable[Sample]:
+        for key, v in self._values.items():
+            yield "", self._labels(key), v
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, buckets: Sequence[float] = LATENCY_BUCKETS, labelnames: Sequence[str] = ()):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по корзинам (не накопительные) + «+Inf», сумма]
+        self._data: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        d = self._data.get(labels)
+        if d is None:
+            d = self._data[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        d[0][bisect_left(self.buckets, value)] += 1
+        d[1] += value
+
+    def samples(self) -> Iterable[Sample]:
+        for key, (counts, total) in self._data.items():
+            base = self._labels(key)
+            acc = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                acc += n
+                yield "_bucket", dict(base, le=_fmt_value(bound)), acc
+            yield "_sum", base, total
+            yield "_count", base, acc
+
+
+# collector() -> [(имя, тип, описание, [(метки, значение)])]
+Collector = Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, doc, labelnames))
+
+    def gauge(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, doc, labelnames))
+
+    def histogram(self, name: str, doc: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labelnames: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, doc, buckets, labelnames))
+
+    def add_collector(self, fn: Collector) -> None:
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        out: List[str] = []
+
+        def head(name: str, kind: str, doc: str) -> None:
+            out.append(f"# HELP {name} {doc}")
+            out.append(f"# TYPE {name} {kind}")
+
+        for m in self._metrics:
+            head(m.name, m.kind, m.doc)
+            for suffix, labels, v in m.samples():
+                out.append(f"{m.name}{suffix}{_fmt_labels(labels)} {_fmt_value(v)}")
+        for fn in self._collectors:
+            for name, kind, doc, samples in fn():
+                head(name, kind, doc)
+                for labels, v in samples:
+                    out.append(f"{name}{_fmt_labels(labels)} {_fmt_value(v)}")
+        out.append("")
+        return "\n".join(out)
+
+
+__all__ = ["CONTENT_TYPE", "Counter", "Gauge", "Histogram", "LATENCY_BUCKETS", "Registry"]
@@ -0,0 +1,371 @@
+"""Asyncio event loop hosted in a child process.
+
+``ProcessRunner`` mirrors the ``AsyncRunner`` API (``start``/``submit``/
+``run_coroutine``/``run_sync``/``call_soon``/``stats``/``stop``), but the loop
+runs in a separate interpreter, so the Tk main loop in the parent never holds
+the GIL the signaling server needs.
+
+Calls cross a ``multiprocessing`` pipe, so everything that is sent must be
+picklable:
+
+* coroutines are sent as a reference to a module-level coroutine function plus
+  its arguments. ``submit(start_http_server(max_peers=2))`` still works: the
+  unstarted coroutine is unpacked into ``(function, args, kwargs)`` and closed
+  in the parent, then re-created in the child;
+* callables among the top-level arguments (e.g. ``on_url`` for
+  ``start_localhost_run_tunnel``) are replaced by proxies; when the child calls
+  a proxy, the original callable runs in the parent on the IPC reader thread;
+* results and exceptions come back pickled. Unpicklable ones are replaced by a
+  ``RuntimeError`` with their repr.
+
+Usage:
+
+    runner = ProcessRunner()
+    runner.start()
+    runner.submit(start_http_server(max_peers=10))
+    runner.submit(start_localhost_run_tunnel(local_port=8080, on_url=print))
+    runner.stop()
+
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import importlib
+import inspect
+import itertools
+import multiprocessing
+import pickle
+import threading
+import traceback
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from async_runner import AsyncRunner
+
+Ref = Tuple[str, str]  # (module, qualname)
+
+
+# ----------------------------- helpers -----------------------------
+
+def _ref(fn: Callable[..., Any]) -> Ref:
+    """Importable reference to a module-level function."""
+    module = getattr(fn, "__module__", None)
+    qualname = getattr(fn, "__qualname__", "")
+    if not module or not qualname or "<locals>" in qualname or "<lambda>" in qualname:
+        raise TypeError(f"{fn!r} is not a module-level function and cannot be sent to the runner process")
+    return module, qualname
+
+
+def _resolve(ref: Ref) -> Callable[..., Any]:
+    module, qualname = ref
+    obj: Any = importlib.import_module(module)
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _unpack_coroutine(coro: Any) -> Tuple[Callable[..., Any], tuple, dict]:
+    """Turn an unstarted coroutine object back into ``(function, args, kwargs)``.
+
+    The coroutine is closed; it must not have been awaited yet.
+    """
+    if not inspect.iscoroutine(coro):
+        raise TypeError(f"expected a coroutine object, got {type(coro).__name__}")
+    try:
+        if inspect.getcoroutinestate(coro) != inspect.CORO_CREATED:
+            raise TypeError("coroutine has already been started")
+        frame = coro.cr_frame
+        fn = _resolve((frame.f_globals.get("__name__", ""), coro.__qualname__))
+        if getattr(fn, "__code__", None) is not coro.cr_code:
+            raise TypeError(f"cannot locate the function of {coro.__qualname__}")
+        args: list = []
+        kwargs: dict = {}
+        for name, p in inspect.signature(fn).parameters.items():
+            value = frame.f_locals[name]
+            if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD):
+                args.append(value)
+            elif p.kind is p.VAR_POSITIONAL:
+                args.extend(value)
+            elif p.kind is p.VAR_KEYWORD:
+                kwargs.update(value)
+            else:
+                kwargs[name] = value
+        return fn, tuple(args), kwargs
+    finally:
+        coro.close()
+
+
+def _picklable_exc(exc: BaseException) -> BaseException:
+    try:
+        pickle.dumps(exc)
+        return exc
+    except Exception:
+        return RuntimeError(f"{type(exc).__name__}: {exc}")
+
+
+class _Callback:
+    """Stand-in for a parent-side callable; becomes a pipe sender in the child."""
+
+    __slots__ = ("cb_id",)
+
+    def __init__(self, cb_id: int) -> None:
+        self.cb_id = cb_id
+
+    def __reduce__(self):
+        return (_Callback, (self.cb_id,))
+
+
+# ------------------------------ child ------------------------------
+
+def _child_main(conn: Any, loop_opts: Dict[str, Any]) -> None:
+    """Entry point of the runner process: an AsyncRunner driven by the pipe."""
+    runner = AsyncRunner(**loop_opts)
+    runner.start()
+    send_lock = threading.Lock()
+
+    def send(msg: tuple) -> None:
+        with send_lock:
+            try:
+                conn.send(msg)
+            except (EOFError, OSError, BrokenPipeError):
+                pass
+            except Exception as e:  # unpicklable result
+                if msg[0] == "result":
+                    conn.send(("result", msg[1], False, RuntimeError(f"unpicklable result: {e}")))
+
+    def bind(value: Any) -> Any:
+        if isinstance(value, _Callback):
+            cb_id = value.cb_id
+            return lambda *a, **kw: send(("cb", cb_id, a, kw))
+        return value
+
+    def reply(cid: int, fut: concurrent.futures.Future) -> None:
+        if fut.cancelled():
+            send(("result", cid, False, concurrent.futures.CancelledError()))
+        elif fut.exception() is not None:
+            send(("result", cid, False, _picklable_exc(fut.exception())))
+        else:
+            send(("result", cid, True, fut.result()))
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        op = msg[0]
+        if op == "stop":
+            break
+        if op == "stats":
+            send(("result", msg[1], True, runner.stats()))
+            continue
+
+        _, cid, kind, ref, args, kwargs = msg
+        try:
+            fn = _resolve(ref)
+            args = tuple(bind(a) for a in args)
+            kwargs = {k: bind(v) for k, v in kwargs.items()}
+            if kind == "soon":
+                runner.call_soon(lambda: fn(*args, **kwargs))
+                continue
+            fut = runner.submit(fn(*args, **kwargs)) if kind == "coro" else runner.run_sync(fn, *args, **kwargs)
+        except BaseException as e:
+            if cid is not None:
+                send(("result", cid, False, _picklable_exc(e)))
+            else:
+                traceback.print_exc()
+            continue
+        fut.add_done_callback(lambda f, cid=cid: reply(cid, f))
+
+    runner.stop()
+    conn.close()
+
+
+# ------------------------------ parent -----------------------------
+
+class ProcessRunner:
+    """Run an asyncio loop in a child process; same API as AsyncRunner."""
+
+    def __init__(self, start_timeout: float = 10.0, **loop_opts: Any) -> None:
+        """
+        Args:
+            start_timeout: seconds to wait for the child to come up.
+            **loop_opts: passed to the child's ``AsyncRunner`` (loop, lag_interval, ...).
+        """
+        self.start_timeout = start_timeout
+        self.loop_opts = loop_opts
+        self._ctx = multiprocessing.get_context("spawn")  # no fork with Tk/threads alive
+        self._proc: Optional[multiprocessing.process.BaseProcess] = None
+        self._conn: Any = None
+        self._reader: Optional[threading.Thread] = None
+        self._send_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, concurrent.futures.Future] = {}
+        self._callbacks: Dict[int, Callable[..., Any]] = {}
+
+    # --------------------------- lifecycle ---------------------------
+
+    def start(self) -> None:
+        """Spawn the runner process if not already running."""
+        with self._lock:
+            if self._proc and self._proc.is_alive():
+                return
+            parent, child = self._ctx.Pipe()
+            self._proc = self._ctx.Process(
+                target=_child_main, args=(child, self.loop_opts), name="AsyncLoopProcess", daemon=True
+            )
+            self._proc.start()
+            child.close()
+            self._conn = parent
+            self._reader = threading.Thread(target=self._read_loop, args=(parent,), name="RunnerIPC", daemon=True)
+            self._reader.start()
+
+        # round trip: the child is up and its loop is running
+        try:
+            self._request("stats").result(timeout=self.start_timeout)
+        except Exception as e:
+            self.stop()
+            raise RuntimeError("ProcessRunner failed to start") from e
+
+    def stop(self, join_timeout: float = 5.0) -> None:
+        """Ask the child to stop its loop; terminate it if it does not exit in time."""
+        with self._lock:
+            proc, conn = self._proc, self._conn
+            self._proc = self._conn = None
+        if conn is not None:
+            try:
+                with self._send_lock:
+                    conn.send(("stop",))
+            except (OSError, EOFError):
+                pass
+        if proc is not None:
+            proc.join(join_timeout)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join(1.0)
+        if conn is not None:
+            conn.close()
+        self._fail_pending(RuntimeError("ProcessRunner stopped"))
+
+    # ------------------------ scheduling API -------------------------
+
+    def submit(self, coro_or_fn: Any, *args: Any, **kwargs: Any) -> concurrent.futures.Future:
+        """Schedule a coroutine in the child (thread-safe).
+
+        Accepts an unstarted coroutine of a module-level function, or the
+        coroutine function itself followed by its arguments.
+        """
+        if inspect.iscoroutine(coro_or_fn):
+            fn, args, kwargs = _unpack_coroutine(coro_or_fn)
+        else:
+            fn = coro_or_fn
+        return self._call("coro", fn, args, kwargs)
+
+    def call_soon(self, callback: Callable[..., Any], *args: Any) -> None:
+        """Schedule a module-level callback on the child's loop (fire and forget)."""
+        self._call("soon", callback, args, {})
+
+    def run_sync(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> concurrent.futures.Future:
+        """Run a blocking module-level function in the child's default executor."""
+        return self._call("sync", func, args, kwargs)
+
+    def run_coroutine(self, coro: Any, timeout: Optional[float] = None) -> Any:
+        """Submit a coroutine and (optionally) wait for its result with a timeout."""
+        return self.submit(coro).result(timeout=timeout)
+
+    # ---------------------------- helpers ----------------------------
+
+    def is_running(self) -> bool:
+        """Return True if the runner process is alive."""
+        proc = self._proc
+        return bool(proc and proc.is_alive())
+
+    def stats(self, timeout: float = 1.0) -> Dict[str, Any]:
+        """Loop-health snapshot from the child (see ``AsyncRunner.stats``)."""
+        snap = dict(self._request("stats").result(timeout=timeout))
+        proc = self._proc
+        snap["pid"] = proc.pid if proc else None
+        return snap
+
+    def _call(self, kind: str, fn: Callable[..., Any], args: tuple, kwargs: dict) -> concurrent.futures.Future:
+        ref = _ref(fn)
+        args = tuple(self._wrap(a) for a in args)
+        kwargs = {k: self._wrap(v) for k, v in kwargs.items()}
+        if kind == "soon":
+            self._send(("call", None, kind, ref, args, kwargs))
+            fut: concurrent.futures.Future = concurrent.futures.Future()
+            fut.set_result(None)
+            return fut
+        return self._request("call", kind, ref, args, kwargs)
+
+    def _wrap(self, value: Any) -> Any:
+        # Module-level functions travel by reference; other callables (bound
+        # methods, closures) stay here and are called back over the pipe.
+        if callable(value) and not isinstance(value, type):
+            try:
+                _ref(value)
+                if inspect.isfunction(value):
+                    return value
+            except TypeError:
+                pass
+            cb_id = next(self._ids)
+            self._callbacks[cb_id] = value
+            return _Callback(cb_id)
+        return value
+
+    def _request(self, op: str, *rest: Any) -> concurrent.futures.Future:
+        cid = next(self._ids)
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        self._pending[cid] = fut
+        try:
+            self._send((op, cid) + rest)
+        except BaseException:
+            self._pending.pop(cid, None)
+            raise
+        return fut
+
+    def _send(self, msg: tuple) -> None:
+        conn = self._conn
+        if conn is None or not self.is_running():
+            raise RuntimeError("ProcessRunner is not running. Call start() first.")
+        with self._send_lock:
+            conn.send(msg)
+
+    def _read_loop(self, conn: Any) -> None:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            if msg[0] == "result":
+                _, cid, ok, value = msg
+                fut = self._pending.pop(cid, None)
+                if fut is not None and not fut.done():
+                    fut.set_result(value) if ok else fut.set_exception(value)
+            elif msg[0] == "cb":
+                _, cb_id, args, kwargs = msg
+                cb = self._callbacks.get(cb_id)
+                if cb is not None:
+                    try:
+                        cb(*args, **kwargs)
+                    except Exception:
+                        traceback.print_exc()
+        self._fail_pending(RuntimeError("runner process exited"))
+
+    def _fail_pending(self, exc: BaseException) -> None:
+        for cid in list(self._pending):
+            fut = self._pending.pop(cid, None)
+            if fut is not None and not fut.done():
+                fut.set_exception(exc)
+
+    # ---------------------- context manager API ----------------------
+
+    def __enter__(self) -> "ProcessRunner":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+
+__all__ = ["ProcessRunner"]
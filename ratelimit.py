@@ -0,0 +1,86 @@
+# ratelimit.py
+# ────────────────────────────────────────────────────────────────────
+# Общий ограничитель частоты для HTTP и WS сигналинга.
+# • token bucket на ключ (IP или peer id): плавный лимит без «двойных»
+#   всплесков на границе секунды, как у фиксированного окна
+# • стоимость по типу сообщения (offer дороже ice)
+# • жёсткий потолок числа ключей с LRU-вытеснением — память не растёт
+#   при сканировании с множества адресов
+# Все проверки — O(1).
+# ────────────────────────────────────────────────────────────────────
+
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class TokenBucketLimiter:
+    """
+    Набор token bucket'ов по ключу.
+
+    rate  — пополнение, токенов в секунду
+    burst — ёмкость ведра (максимальный всплеск)
+    max_keys — сколько ключей держим; самый давно неактивный вытесняется
+    costs — стоимость по типу запроса/сообщения (по умолчанию 1.0)
+    """
+
+    __slots__ = ("rate", "burst", "max_keys", "costs", "_buckets", "allowed", "denied", "evicted")
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10_000, costs: Optional[Dict[str, float]] = None):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = max(1, int(max_keys))
+        self.costs: Dict[str, float] = dict(costs or {})
+        # key -> [tokens, last_refill]; порядок = давность использования
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self.allowed = 0
+        self.denied = 0
+        self.evicted = 0
+
+    def cost_of(self, kind: Optional[str]) -> float:
+        return self.costs.get(kind, 1.0) if kind else 1.0
+
+    def allow(self, key: str, cost: float = 1.0, now: Optional[float] = None) -> bool:
+        """Списывает cost токенов у key; False — лимит исчерпан."""
+        if now is None:
+            now = time.monotonic()
+        buckets = self._buckets
+        b = buckets.get(key)
+        if b is None:
+            if len(buckets) >= self.max_keys:
+                buckets.popitem(last=False)
+                self.evicted += 1
+            b = buckets[key] = [self.burst, now]
+        else:
+            buckets.move_to_end(key)
+            tokens = b[0] + (now - b[1]) * self.rate
+            b[0] = tokens if tokens < self.burst else self.burst
+            b[1] = now
+
+        if b[0] >= cost:
+            b[0] -= cost
+            self.allowed += 1
+            return True
+        self.denied += 1
+        return False
+
+    def allow_kind(self, key: str, kind: Optional[str], now: Optional[float] = None) -> bool:
+        return self.allow(key, self.cost_of(kind), now)
+
+    def forget(self, key: str) -> None:
+        self._buckets.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._buckets),
+            "max_keys": self.max_keys,
+            "allowed": self.allowed,
+            "denied": self.denied,
+            "evicted": self.evicted,
+        }
+
+
+__all__ = ["TokenBucketLimiter"]
@@ -0,0 +1,131 @@
+# replay.py
+# ────────────────────────────────────────────────────────────────────
+# Anti-replay для адресных WS-сообщений.
+# • состояние на отправителя — объект со __slots__ (без вложенных
+#   defaultdict-лямбд, которые аллоцируют при каждом поиске)
+# • недавние ts — целые микросекунды в set + кольцо для вытеснения:
+#   проверка повтора O(1) вместо обхода окна
+# • периодическая зачистка «уснувших» отправителей и пустых комнат
+# ────────────────────────────────────────────────────────────────────
+
+import time
+from typing import Dict, Optional
+
+
+class SenderState:
+    __slots__ = ("last", "seen", "ring", "pos", "touched")
+
+    def __init__(self, window: int, now: float):
+        self.last = 0.0
+        self.seen: set = set()
+        self.ring: list = [None] * window  # кольцо последних ts (int мкс)
+        self.pos = 0
+        self.touched = now
+
+
+class ReplayGuard:
+    """
+    guard.check(room, sender, ts) -> bool
+
+    ts валиден, если:
+      - это конечное число, не bool (поддерживаем ms и sec)
+      - не выходит за допуск по сдвигу часов
+      - строго больше предыдущего для данного отправителя в комнате
+      - не встречался среди последних `window` значений
+    """
+
+    __slots__ = ("skew", "window", "idle_ttl", "_rooms", "rejected", "accepted", "swept")
+
+    def __init__(self, skew: float = 20.0, window: int = 64, idle_ttl: float = 300.0):
+        self.skew = float(skew)
+        self.window = max(1, int(window))
+        self.idle_ttl = float(idle_ttl)
+        self._rooms: Dict[str, Dict[str, SenderState]] = {}
+        self.rejected = 0
+        self.accepted = 0
+        self.swept = 0
+
+    def check(self, room: str, sender: str, ts, now: Optional[float] = None) -> bool:
+        # type(), а не isinstance: bool — подкласс int и должен отсекаться
+        if type(ts) is not int and type(ts) is not float:
+            self.rejected += 1
+            return False
+        try:
+            t_client = ts / 1000.0 if ts > 10_000_000_000 else float(ts)
+        except OverflowError:  # int больше любого float
+            self.rejected += 1
+            return False
+
+        if now is None:
+            now = time.time()
+        # not (<=): NaN и inf отсекаются этим же сравнением до int(t * 1e6)
+        if not abs(now - t_client) <= self.skew:
+            self.rejected += 1
+            return False
+
+        senders = self._rooms.get(room)
+        if senders is None:
+            senders = self._rooms[room] = {}
+        st = senders.get(sender)
+        if st is None:
+            st = senders[sender] = SenderState(self.window, now)
+
+        # жёсткая монотония: новый ts должен быть > последнего
+        if t_client <= st.last:
+            self.rejected += 1
+            return False
+
+        key = int(t_client * 1_000_000)
+        seen = st.seen
+        if key in seen:
+            self.rejected += 1
+            return False
+
+        ring = st.ring
+        old = ring[st.pos]
+        if old is not None:
+            seen.discard(old)
+        ring[st.pos] = key
+        st.pos = (st.pos + 1) % self.window
+        seen.add(key)
+
+        st.last = t_client
+        st.touched = now
+        self.accepted += 1
+        return True
+
+    def forget(self, room: str, sender: str) -> None:
+        senders = self._rooms.get(room)
+        if senders is None:
+            return
+        senders.pop(sender, None)
+        if not senders:
+            self._rooms.pop(room, None)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Удаляет отправителей без активности дольше idle_ttl; возвращает их число."""
+        if now is None:
+            now = time.time()
+        cutoff = now - self.idle_ttl
+        removed = 0
+        for room in list(self._rooms):
+            senders = self._rooms[room]
+            for sender in [s for s, st in senders.items() if st.touched < cutoff]:
+                del senders[sender]
+                removed += 1
+            if not senders:
+                del self._rooms[room]
+        self.swept += removed
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "senders": sum(len(s) for s in self._rooms.values()),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "swept": self.swept,
+        }
+
+
+__all__ = ["ReplayGuard", "SenderState"]
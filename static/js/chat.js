@@ -49,6 +49,19 @@ export function updateRoster(roster) {
   }
 }
 
+/** Применяет дельту ростера: op = "add" | "update" | "remove" */
+export function applyRosterDelta(op, { id, name } = {}) {
+  if (!id) return;
+  if (op === "remove") {
+    rosterById.delete(id);
+    return;
+  }
+  const nm = (name || "").trim();
+  rosterById.set(id, nm);
+  const label = document.getElementById("peer-" + id)?.querySelector(".peer__name");
+  if (label) label.textContent = nm || id.slice(0, 6);
+}
+
 export function appendChat({ from: fromId, name, text, ts }) {
   if (!chatLog) return;
   const mine = myId && fromId === myId;
@@ -2,7 +2,8 @@
 "use strict";
 
 import { $, $$, toast, showModal, showNet, hideNet } from "./ui.js";
-import { updateRoster, appendChat, setMyId, setSendChat, getRosterIds } from "./chat.js";
+import { updateRoster, applyRosterDelta, appendChat, setMyId, setSendChat, getRosterIds } from "./chat.js";
+import { protocolsFor, isBinary, encodeFor, decodeFrame } from "./wire.js";
 
 
 
@@ -33,6 +34,7 @@ const selfMuteRow = document.getElementById("self-mute-row");
 const pcs = new Map();           // id -> RTCPeerConnection
 const audios = new Map();        // id -> <audio>
 const pendingIce = new Map();    // id -> Array<candidate>
+const iceOut = new Map();        // id -> { list, timer } — исходящие ICE в пачке
 const senders = new Map();       // id -> RTCRtpSender
 const negotiating = new Map();   // id -> boolean
 const needRenego = new Map();    // id -> boolean
@@ -41,6 +43,7 @@ const speakingDetectionIntervals = new Map(); // id -> interval
 const trackClones = new Map();   // id -> MediaStreamTrack (clone per peer)
 
 let myId = null;
+let rosterSeq = 0;               // версия ростера с сервера (для дельт)
 let joined = false;
 let micStream = null;
 let ws = null;
@@ -163,7 +166,7 @@ async function renegotiate(remoteId, pc, opts = {}) {
 
       try {
         if (ws && ws.readyState === WebSocket.OPEN) {
-          ws.send(JSON.stringify({
+          ws.send(encodeFor(ws, {
             type: "offer",
             to: remoteId,
             sdp: pc.localDescription.sdp,
@@ -317,6 +320,27 @@ function queueIce(id, c) {
   pendingIce.get(id).push(c);
 }
 
+// Исходящие ICE копятся ICE_BATCH_MS и уходят одним кадром {candidates: [...]};
+// null (end-of-candidates) закрывает пачку сразу
+const ICE_BATCH_MS = 25;
+
+function sendIce(id, c) {
+  let b = iceOut.get(id);
+  if (!b) { b = { list: [], timer: null }; iceOut.set(id, b); }
+  b.list.push(c);
+  if (c === null) flushOutgoingIce(id);
+  else if (!b.timer) b.timer = setTimeout(() => flushOutgoingIce(id), ICE_BATCH_MS);
+}
+
+function flushOutgoingIce(id) {
+  const b = iceOut.get(id);
+  if (!b) return;
+  if (b.timer) clearTimeout(b.timer);
+  iceOut.delete(id);
+  if (!b.list.length || !ws || ws.readyState !== WebSocket.OPEN) return;
+  ws.send(encodeFor(ws, { type: "ice", to: id, candidates: b.list, ts: nextTs() }));
+}
+
 async function flushQueuedIce(id) {
   const pc = pcs.get(id);
   if (!pc || !pc.remoteDescription) return;
@@ -331,6 +355,31 @@ async function flushQueuedIce(id) {
   pendingIce.delete(id);
 }
 
+async function addRemoteIce(from, c) {
+  if (c === undefined) return;
+  const pc = pcs.get(from);
+  if (!pc) {
+    if (c) queueIce(from, c);
+    return;
+  }
+
+  if (c === null) {
+    try { await pc.addIceCandidate(null); } catch {}
+    return;
+  }
+  if (!c.candidate || c.candidate.includes(".local")) return;
+
+  if (!pc.remoteDescription) {
+    queueIce(from, c);
+    return;
+  }
+  try {
+    await pc.addIceCandidate(c);
+  } catch (e) {
+    console.warn("[ICE] add failed", e);
+  }
+}
+
 function closeAllPeers() {
   for (const [, pc] of pcs) {
     try { pc.getSenders().forEach((s) => s.track && s.track.stop()); } catch {}
@@ -347,14 +396,41 @@ function closeAllPeers() {
    ========================================================================= */
 let reconnectTimer = null;
 
-function scheduleReconnect() {
+function scheduleReconnect(delay = 800) {
   if (!joined) return;
   if (reconnectTimer) return;
   reconnectTimer = setTimeout(() => {
     reconnectTimer = null;
     initWS();
     waitWsOpen(6000).catch(() => {});
-  }, 800);
+  }, delay);
+}
+
+function showRoomFull(cap) {
+  const title = "Комната заполнена";
+  const text = cap ? `Достигнут лимит участников: ${cap}. Попробуйте позже.` : "Комната заполнена. Попробуйте позже.";
+  showModal(title, text);
+  setState("Комната заполнена", "warn");
+}
+
+// Сервер отказывает ещё до апгрейда (HTTP 429/503 + Retry-After), а браузер
+// не отдаёт статус рукопожатия WS — узнаём причину отдельным запросом.
+async function probeAdmission(token) {
+  let delay = 800;
+  try {
+    const r = await fetch("/ws", { headers: { "X-Room-Token": token }, cache: "no-store" });
+    const retry = parseInt(r.headers.get("Retry-After") || "0", 10);
+    if (retry > 0) delay = retry * 1000;
+    if (r.status === 429 || r.status === 503) {
+      const info = await r.json().catch(() => ({}));
+      if (info.type === "full") {
+        showRoomFull(typeof info.capacity === "number" ? info.capacity : undefined);
+        return;
+      }
+      setState("Сервер занят, повтор через " + Math.round(delay / 1000) + " с", "warn");
+    }
+  } catch {}
+  scheduleReconnect(delay);
 }
 
 function initWS() {
@@ -387,12 +463,19 @@ function initWS() {
 
   const scheme = (location.protocol === "https:") ? "wss://" : "ws://";
   const url = scheme + location.host + "/ws"; // без ?t= — токен только как subprotocol
-  ws = new WebSocket(url, ["token." + token]);
+  // сервер выберет MessagePack ("mp.token.X"), если умеет, иначе JSON
+  ws = new WebSocket(url, protocolsFor(token));
+  ws.binaryType = "arraybuffer";
+  let opened = false;
 
-  ws.onopen = () => setState("Соединение установлено", "ok");
+  ws.onopen = () => { opened = true; setState("Соединение установлено", "ok"); };
   ws.onclose = (e) => {
     console.warn("[WS close]", e.code, e.reason);
     setState("Соединение закрыто", "warn");
+    if (!opened) {
+      probeAdmission(token);
+      return;
+    }
     scheduleReconnect();
   };
   ws.onerror = (e) => {
@@ -590,24 +673,14 @@ function makePC(remoteId) {
     }
 
     if (e.candidate) {
-      ws.send(JSON.stringify({
-        type: "ice",
-        to: remoteId,
-        candidate: {
-          candidate: e.candidate.candidate,
-          sdpMid: e.candidate.sdpMid,
-          sdpMLineIndex: e.candidate.sdpMLineIndex,
-        },
-        ts: nextTs(),
-      }));
+      sendIce(remoteId, {
+        candidate: e.candidate.candidate,
+        sdpMid: e.candidate.sdpMid,
+        sdpMLineIndex: e.candidate.sdpMLineIndex,
+      });
     } else {
       // end-of-candidates → помогает третьим участникам/сложным NAT
-      ws.send(JSON.stringify({
-        type: "ice",
-        to: remoteId,
-        candidate: null,
-        ts: nextTs(),
-      }));
+      sendIce(remoteId, null);
     }
   };
 
@@ -740,13 +813,64 @@ function callAllKnownPeers() {
   }
 }
 
+/* =========================================================================
+   Ростер (снимок + дельты с сервера)
+   ========================================================================= */
+function onRosterChanged() {
+  for (const pid of getRosterIds()) {
+    if (pid !== myId && !document.getElementById("peer-" + pid)) {
+      addPeerUI(pid, null);
+    }
+  }
+  callAllKnownPeersDebounced(150);
+  Safety.onRosterChanged?.();
+  E2E.onRosterUpdate?.();
+  Safety.enforceMuteIfUnverified?.();
+}
+
+function requestRosterSync() {
+  if (ws && ws.readyState === WebSocket.OPEN) {
+    ws.send(encodeFor(ws, { type: "roster-sync" }));
+  }
+}
+
+function onPeerLeft(id) {
+  removePeerUI(id);
+  try {
+    const clone = trackClones.get(id);
+    if (clone) { try { clone.stop(); } catch {} trackClones.delete(id); }
+
+    const pc = pcs.get(id);
+    if (pc) {
+      try { pc.getSenders().forEach((s) => s.track && s.track.stop()); } catch {}
+      try { pc.close(); } catch {}
+      pcs.delete(id);
+    }
+
+    pendingIce.delete(id);
+    const b = iceOut.get(id);
+    if (b?.timer) clearTimeout(b.timer);
+    iceOut.delete(id);
+    senders.delete(id);
+    negotiating.delete(id);
+    needRenego.delete(id);
+    if (speakingDetectionIntervals.has(id)) stopSpeakingDetection(id);
+    analysers.delete(id);
+  } catch {}
+
+  queueMicrotask(() => callAllKnownPeersDebounced());
+  toast("Кто-то вышел", "warn");
+  Safety.onRosterChanged?.();
+  Safety.enforceMuteIfUnverified?.();
+}
+
 /* =========================================================================
    Обработка сигналинга
    ========================================================================= */
 async function onWSMessage(ev) {
   let m;
   try {
-    m = JSON.parse(ev.data);
+    m = decodeFrame(ev.data);
   } catch {
     return;
   }
@@ -754,6 +878,7 @@ async function onWSMessage(ev) {
   // hello: мой id, старт E2E, первичная отрисовка
   if (m.type === "hello") {
     updateRoster(m.roster || []);
+    rosterSeq = m.seq || 0;
     myId = m.id;
     setMyId(myId);
 
@@ -780,17 +905,37 @@ async function onWSMessage(ev) {
     return;
   }
 
+  // полный снимок: по запросу roster-sync (после разрыва seq) или вместо
+  // склеенных сервером дельт; кто пропал из снимка — тот вышел
   if (m.type === "roster") {
+    const before = new Set([...getRosterIds(), ...pcs.keys()]);
     updateRoster(m.roster || []);
-    for (const pid of getRosterIds()) {
-      if (pid !== myId && !document.getElementById("peer-" + pid)) {
-        addPeerUI(pid, null);
+    rosterSeq = m.seq || 0;
+    const now = new Set(getRosterIds());
+    for (const id of before) {
+      if (id !== myId && !now.has(id)) onPeerLeft(id);
+    }
+    onRosterChanged();
+    return;
+  }
+
+  // дельты ростера: применяем строго по порядку seq, иначе просим снимок
+  if (m.type === "roster-add" || m.type === "roster-update" || m.type === "roster-remove") {
+    if (typeof m.seq === "number") {
+      if (m.seq <= rosterSeq) return;           // устаревшая дельта
+      if (m.seq !== rosterSeq + 1) {
+        requestRosterSync();
+        return;
       }
+      rosterSeq = m.seq;
     }
-    callAllKnownPeersDebounced(150);
-    Safety.onRosterChanged?.();
-    E2E.onRosterUpdate?.();
-    Safety.enforceMuteIfUnverified?.();
+    const op = m.type.slice("roster-".length);
+    applyRosterDelta(op, m);
+    if (op === "remove") {
+      onPeerLeft(m.id);
+      return;
+    }
+    if (op === "add") onRosterChanged();   // update меняет только подпись
     return;
   }
 
@@ -818,6 +963,14 @@ async function onWSMessage(ev) {
       return;
     }
 
+  // хост перезапустил туннель: старая публичная ссылка больше не работает
+  if (m.type === "public-url") {
+    if (typeof m.url === "string" && /^https:\/\//.test(m.url)) {
+      toast("Публичная ссылка изменилась: " + m.url, "warn");
+    }
+    return;
+  }
+
   if (m.type === "offer") {
     const from = m.from;
     const pc = pcs.get(from) || makePC(from);
@@ -840,7 +993,7 @@ async function onWSMessage(ev) {
       await pc.setLocalDescription(ans);
 
       if (ws && ws.readyState === WebSocket.OPEN) {
-        ws.send(JSON.stringify({
+        ws.send(encodeFor(ws, {
           type: "answer",
           to: from,
           sdp: pc.localDescription.sdp,
@@ -874,69 +1027,15 @@ async function onWSMessage(ev) {
   }
 
   if (m.type === "ice") {
-    const c = m.candidate;
-    const from = m.from;
-
-    const pc = pcs.get(from);
-    if (!pc) {
-      if (c) queueIce(from, c);
-      return;
-    }
-
-    if (c === null) {
-      try { await pc.addIceCandidate(null); } catch {}
-      return;
-    }
-    if (!c.candidate || c.candidate.includes(".local")) return;
-
-    if (!pc.remoteDescription) {
-      queueIce(from, c);
-      return;
-    }
-    try {
-      await pc.addIceCandidate(c);
-    } catch (e) {
-      console.warn("[ICE] add failed", e);
-    }
-    return;
-  }
-
-  if (m.type === "peer-left") {
-    const id = m.id;
-    removePeerUI(id);
-    try {
-      const clone = trackClones.get(id);
-      if (clone) { try { clone.stop(); } catch {} trackClones.delete(id); }
-
-      const pc = pcs.get(id);
-      if (pc) {
-        try { pc.getSenders().forEach((s) => s.track && s.track.stop()); } catch {}
-        try { pc.close(); } catch {}
-        pcs.delete(id);
-      }
-
-      pendingIce.delete(id);
-      senders.delete(id);
-      negotiating.delete(id);
-      needRenego.delete(id);
-      if (speakingDetectionIntervals.has(id)) stopSpeakingDetection(id);
-      analysers.delete(id);
-    } catch {}
-
-    queueMicrotask(() => callAllKnownPeersDebounced());
-    toast("Кто-то вышел", "warn");
-    Safety.onRosterChanged?.();
-    Safety.enforceMuteIfUnverified?.();
+    // сервер присылает пачку {candidates: [...]}; одиночный {candidate} — тоже понимаем
+    const list = Array.isArray(m.candidates) ? m.candidates : [m.candidate];
+    for (const c of list) await addRemoteIce(m.from, c);
     return;
   }
 
   if (m.type === "full") {
-    const cap = typeof m.capacity === "number" ? m.capacity : undefined;
-    const title = "Комната заполнена";
-    const text = cap ? `Достигнут лимит участников: ${cap}. Попробуйте позже.` : "Комната заполнена. Попробуйте позже.";
-    showModal(title, text);
+    showRoomFull(typeof m.capacity === "number" ? m.capacity : undefined);
     try { ws?.close(4001, "room full"); } catch {}
-    setState("Комната заполнена", "warn");
     return;
   }
 
@@ -1081,6 +1180,9 @@ const E2E = (() => {
     for (let i = 0; i < s.length; i++) buf[i] = s.charCodeAt(i);
     return buf.buffer;
   };
+  // байтовые поля: в бинарном формате — как есть, в JSON — base64
+  const out = (buf) => (isBinary(wsRef) ? new Uint8Array(buf) : b64(buf));
+  const bytesIn = (v) => (typeof v === "string" ? unb64(v) : v);
 
   function hex(bytes) {
     return Array.from(bytes).map(b => b.toString(16).padStart(2, "0")).join(":");
@@ -1135,7 +1237,7 @@ const E2E = (() => {
 
   function wsSend(obj) {
     if (wsRef && wsRef.readyState === WebSocket.OPEN) {
-      wsRef.send(JSON.stringify(obj));
+      wsRef.send(encodeFor(wsRef, obj));
     }
   }
 
@@ -1159,7 +1261,7 @@ const E2E = (() => {
   function announceToAll() {
     const ids = (getIds() || []).filter((id) => id && id !== myIdRef);
     for (const pid of ids) {
-      wsSend({ type: "key", to: pid, pub: b64(myPubRaw), ts: nextTs() });
+      wsSend({ type: "key", to: pid, pub: out(myPubRaw), ts: nextTs() });
     }
   }
 
@@ -1168,7 +1270,7 @@ const E2E = (() => {
     const from = msg.from;
     if (!from || from === myIdRef) return;
     try {
-      const raw = unb64(msg.pub);
+      const raw = bytesIn(msg.pub);
 
       await derivePair(from, raw);
 
@@ -1177,7 +1279,7 @@ const E2E = (() => {
       if (typeof onPeerFp === "function") onPeerFp(from, fp);
 
       // ответим своим пабликом (на случай, если у него нас нет)
-      wsSend({ type: "key", to: from, pub: b64(myPubRaw), ts: nextTs() });
+      wsSend({ type: "key", to: from, pub: out(myPubRaw), ts: nextTs() });
 
       // ключ MAC готов → попросим Safety досвести отложенные подтверждения
       if (typeof Safety?.onMacReady === "function") {
@@ -1194,20 +1296,23 @@ const E2E = (() => {
     const ids = (getIds() || []).filter((id) => id && id !== myIdRef);
     const now = nextTs();
 
+    // один кадр chat-e2e-multi на всех: сервер проверит его один раз и разошлёт
+    const items = [];
     for (const pid of ids) {
       try {
         const key = aesForPeer.get(pid);
         if (!key) {
-          wsSend({ type: "key", to: pid, pub: b64(myPubRaw) });
+          wsSend({ type: "key", to: pid, pub: out(myPubRaw) });
           continue;
         }
         const iv = crypto.getRandomValues(new Uint8Array(12));
         const ctBuf = await crypto.subtle.encrypt({ name: "AES-GCM", iv }, key, enc.encode(msg));
-        wsSend({ type: "chat-e2e", to: pid, iv: b64(iv), ct: b64(ctBuf), ts: now });
+        items.push({ to: pid, iv: out(iv), ct: out(ctBuf) });
       } catch (e) {
-        console.warn("[E2E] encrypt/send failed for", pid, e);
+        console.warn("[E2E] encrypt failed for", pid, e);
       }
     }
+    if (items.length) wsSend({ type: "chat-e2e-multi", items, ts: now });
     appendFn({ from: myIdRef, text: msg, ts: now });
   }
 
@@ -1220,7 +1325,7 @@ const E2E = (() => {
       return;
     }
     try {
-      const pt = await crypto.subtle.decrypt({ name: "AES-GCM", iv: new Uint8Array(unb64(iv)) }, key, unb64(ct));
+      const pt = await crypto.subtle.decrypt({ name: "AES-GCM", iv: new Uint8Array(bytesIn(iv)) }, key, bytesIn(ct));
       const text = dec.decode(pt);
       appendFn({ from, text, ts: ts || Date.now() });
     } catch (e) {
@@ -1236,7 +1341,7 @@ const E2E = (() => {
   async function signSafety(payload, peerIdForMac) {
     const macKey = macForPeer.get(peerIdForMac);
     if (!macKey) {
-      wsSend({ type: "key", to: peerIdForMac, pub: b64(myPubRaw), ts: nextTs() });
+      wsSend({ type: "key", to: peerIdForMac, pub: out(myPubRaw), ts: nextTs() });
       throw new Error("no MAC key yet for peer " + peerIdForMac);
     }
     const sig = await crypto.subtle.sign("HMAC", macKey, enc.encode(payload));
@@ -1395,7 +1500,7 @@ async function startCall() {
     }
   }
 
-  ws?.send(JSON.stringify({
+  ws?.send(encodeFor(ws, {
     type: "name",
     name: (nameEl?.value || "User").slice(0, 32),
   }));
@@ -1451,6 +1556,8 @@ async function leaveCall() {
     }
     pcs.clear();
     pendingIce.clear();
+    for (const b of iceOut.values()) if (b.timer) clearTimeout(b.timer);
+    iceOut.clear();
     senders.clear();
     negotiating.clear();
     needRenego.clear();
@@ -0,0 +1,159 @@
+// /js/wire.js
+"use strict";
+
+/* =========================================================================
+   Формат кадров сигналинга: JSON (текст) или MessagePack (бинарь).
+   Сервер выбирает формат по subprotocol: "mp.token.X" → MessagePack,
+   "token.X" → JSON. Минимальный MessagePack: nil/bool/int/float/str/bin/
+   array/map; бинарные поля (pub/iv/ct) идут как bin ⇄ Uint8Array.
+   ========================================================================= */
+
+const te = new TextEncoder();
+const td = new TextDecoder();
+
+export const MP_PREFIX = "mp.";
+
+export function protocolsFor(token) {
+  return [MP_PREFIX + "token." + token, "token." + token];
+}
+
+export function isBinary(sock) {
+  return !!sock && typeof sock.protocol === "string" && sock.protocol.startsWith(MP_PREFIX);
+}
+
+// Кодирует объект под формат сокета
+export function encodeFor(sock, obj) {
+  return isBinary(sock) ? encode(obj) : JSON.stringify(obj);
+}
+
+// Разбирает входящий кадр (строка — JSON, ArrayBuffer — MessagePack)
+export function decodeFrame(data) {
+  return typeof data === "string" ? JSON.parse(data) : decode(new Uint8Array(data));
+}
+
+/* ─── MessagePack: кодирование ─────────────────────────────────────── */
+export function encode(value) {
+  let buf = new Uint8Array(256);
+  let view = new DataView(buf.buffer);
+  let pos = 0;
+
+  const ensure = (n) => {
+    if (pos + n <= buf.length) return;
+    let size = buf.length * 2;
+    while (size < pos + n) size *= 2;
+    const next = new Uint8Array(size);
+    next.set(buf);
+    buf = next;
+    view = new DataView(buf.buffer);
+  };
+  const u8 = (x) => { ensure(1); buf[pos++] = x; };
+  const u16 = (x) => { ensure(2); view.setUint16(pos, x); pos += 2; };
+  const u32 = (x) => { ensure(4); view.setUint32(pos, x); pos += 4; };
+  const raw = (bytes) => { ensure(bytes.length); buf.set(bytes, pos); pos += bytes.length; };
+
+  const head = (len, fix, fixMax, c8, c16, c32) => {
+    if (fix !== null && len <= fixMax) u8(fix | len);
+    else if (c8 !== null && len < 0x100) { u8(c8); u8(len); }
+    else if (len < 0x10000) { u8(c16); u16(len); }
+    else { u8(c32); u32(len); }
+  };
+
+  const put = (v) => {
+    if (v === null || v === undefined) { u8(0xc0); return; }
+    if (v === false) { u8(0xc2); return; }
+    if (v === true) { u8(0xc3); return; }
+    if (typeof v === "number") {
+      if (Number.isInteger(v) && Math.abs(v) <= Number.MAX_SAFE_INTEGER) {
+        if (v >= 0 && v < 0x80) u8(v);
+        else if (v < 0 && v >= -32) u8(v & 0xff);
+        else if (v >= 0 && v <= 0xffffffff) { u8(0xce); u32(v); }
+        else if (v < 0 && v >= -0x80000000) { u8(0xd2); ensure(4); view.setInt32(pos, v); pos += 4; }
+        else { u8(v < 0 ? 0xd3 : 0xcf); ensure(8); view.setBigInt64(pos, BigInt(v)); pos += 8; }
+      } else {
+        u8(0xcb); ensure(8); view.setFloat64(pos, v); pos += 8;
+      }
+      return;
+    }
+    if (typeof v === "string") {
+      const b = te.encode(v);
+      head(b.length, 0xa0, 31, 0xd9, 0xda, 0xdb);
+      raw(b);
+      return;
+    }
+    if (v instanceof Uint8Array || v instanceof ArrayBuffer) {
+      const b = v instanceof Uint8Array ? v : new Uint8Array(v);
+      head(b.length, null, 0, 0xc4, 0xc5, 0xc6);
+      raw(b);
+      return;
+    }
+    if (Array.isArray(v)) {
+      head(v.length, 0x90, 15, null, 0xdc, 0xdd);
+      for (const x of v) put(x);
+      return;
+    }
+    if (typeof v === "object") {
+      const keys = Object.keys(v).filter((k) => v[k] !== undefined);
+      head(keys.length, 0x80, 15, null, 0xde, 0xdf);
+      for (const k of keys) { put(k); put(v[k]); }
+      return;
+    }
+    throw new TypeError("msgpack: unsupported type " + typeof v);
+  };
+
+  put(value);
+  return buf.slice(0, pos);
+}
+
+/* ─── MessagePack: декодирование ───────────────────────────────────── */
+export function decode(bytes) {
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  let pos = 0;
+
+  const str = (n) => { const s = td.decode(bytes.subarray(pos, pos + n)); pos += n; return s; };
+  const bin = (n) => { const b = bytes.slice(pos, pos + n); pos += n; return b; };
+  const arr = (n) => { const a = new Array(n); for (let i = 0; i < n; i++) a[i] = get(); return a; };
+  const map = (n) => {
+    const o = {};
+    for (let i = 0; i < n; i++) { const k = get(); o[k] = get(); }
+    return o;
+  };
+  const rd = (fn, size) => { const v = view[fn](pos); pos += size; return v; };
+
+  function get() {
+    if (pos >= bytes.length) throw new RangeError("msgpack: truncated");
+    const c = bytes[pos++];
+    if (c < 0x80) return c;
+    if (c >= 0xe0) return c - 0x100;
+    if (c >= 0xa0 && c <= 0xbf) return str(c & 0x1f);
+    if (c >= 0x90 && c <= 0x9f) return arr(c & 0x0f);
+    if (c >= 0x80 && c <= 0x8f) return map(c & 0x0f);
+    switch (c) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: return bin(rd("getUint8", 1));
+      case 0xc5: return bin(rd("getUint16", 2));
+      case 0xc6: return bin(rd("getUint32", 4));
+      case 0xca: return rd("getFloat32", 4);
+      case 0xcb: return rd("getFloat64", 8);
+      case 0xcc: return rd("getUint8", 1);
+      case 0xcd: return rd("getUint16", 2);
+      case 0xce: return rd("getUint32", 4);
+      case 0xcf: return Number(rd("getBigUint64", 8));
+      case 0xd0: return rd("getInt8", 1);
+      case 0xd1: return rd("getInt16", 2);
+      case 0xd2: return rd("getInt32", 4);
+      case 0xd3: return Number(rd("getBigInt64", 8));
+      case 0xd9: return str(rd("getUint8", 1));
+      case 0xda: return str(rd("getUint16", 2));
+      case 0xdb: return str(rd("getUint32", 4));
+      case 0xdc: return arr(rd("getUint16", 2));
+      case 0xdd: return arr(rd("getUint32", 4));
+      case 0xde: return map(rd("getUint16", 2));
+      case 0xdf: return map(rd("getUint32", 4));
+      default: throw new TypeError("msgpack: unsupported byte 0x" + c.toString(16));
+    }
+  }
+
+  return get();
+}
@@ -1,5 +1,40 @@
-"""Utilities for managing the localhost.run SSH tunnel."""
-
+"""Public tunnels for the local signaling server.
+
+A tunnel exposes ``127.0.0.1:<HTTP_PORT>`` under a public URL. Backends share
+the ``TunnelBackend`` interface (start / wait_url / wait_exit / stop / stats)
+and keep all state on the instance, so any number can run at once:
+
+* ``localhost.run``  - ``ssh -R 80:...`` to localhost.run, URL parsed from its banner
+* ``ssh-relay``      - ``ssh -R`` to your own relay; the public URL is configured
+* ``local``          - built-in loopback reverse proxy, for tests and benchmarks
+
+Targets are ``kind`` or ``kind:target`` specs (``TUNNEL_TARGETS``, comma-
+separated; default: one ``localhost.run`` spec per ``LOCALHOST_RUN_HOST``).
+``TunnelSupervisor`` races them, keeps the one whose URL answers ``/healthz``
+fastest, probes it on a schedule and restarts with exponential backoff when
+the process exits, probes fail or latency stays too high. Every new URL is
+pushed to ``on_url`` (the GUI) and to connected clients. Each backend reports
+its startup time (to URL) and throughput (relayed bytes where visible, plus a
+periodic download through the public URL).
+
+``start_tunnel`` returns an independent supervisor; the module-level
+``start_localhost_run_tunnel`` / ``stop_localhost_run_tunnel`` /
+``get_tunnel_url`` / ``wait_for_tunnel_url`` / ``tunnel_stats`` drive one
+default instance (the tunnel the GUI shows).
+
+Settings (env):
+    TUNNEL_TARGETS         e.g. "localhost.run,ssh-relay:me@relay.example.com"
+    LOCALHOST_RUN_HOST     "nokey@localhost.run" (comma-separated to race)
+    TUNNEL_RELAY_URL       public URL of the relay, e.g. "https://call.example.com"
+    TUNNEL_RELAY_PORT      8080   port the relay's sshd listens on for us
+    TUNNEL_PROBE_SEC       15     interval of /healthz probes
+    TUNNEL_PROBE_TIMEOUT   5      probe timeout, seconds
+    TUNNEL_MAX_RTT_MS      2000   probe RTT counted as a failure
+    TUNNEL_MAX_FAILS       3      consecutive bad probes before a restart
+    TUNNEL_BACKOFF_MAX     60     cap of the restart backoff, seconds
+"""
+
+import asyncio
 import os
 import pathlib
 import re
@@ -7,24 +42,53 @@ import signal
 import subprocess
 import threading
 import time
-from typing import Callable, Optional
+from typing import Callable, Dict, List, Optional, Pattern
+
+import aiohttp
 
-from core import HTTP_PORT, log
+from core import HTTP_PORT, METRICS, announce_public_url, log
 
 # Hide sensitive data (public URL) in logs if PROD=1
 PROD = os.environ.get("PROD") == "1"
 
-# Allow overriding ssh target like "nokey@localhost.run"
+# Allow overriding ssh target like "nokey@localhost.run"; several targets
+# (comma-separated) are raced and the fastest is kept
 LOCALHOST_RUN_HOST = os.environ.get("LOCALHOST_RUN_HOST", "nokey@localhost.run")
+LOCALHOST_RUN_HOSTS = [h.strip() for h in LOCALHOST_RUN_HOST.split(",") if h.strip()]
+
+# Own relay for the ssh-relay backend
+RELAY_URL = os.environ.get("TUNNEL_RELAY_URL", "")
+RELAY_PORT = int(os.environ.get("TUNNEL_RELAY_PORT", "8080"))
+
+TUNNEL_TARGETS = [t.strip() for t in os.environ.get("TUNNEL_TARGETS", "").split(",") if t.strip()] or [
+    f"localhost.run:{h}" for h in LOCALHOST_RUN_HOSTS
+]
 
 # Optional host key pinning (e.g., "SHA256:xxxxxxxx..."); when set, we enforce StrictHostKeyChecking=yes
 PINNED_FINGERPRINT = os.environ.get("PINNED_FINGERPRINT") or ""
 
-# Internal state
-_TUNNEL_PROC: Optional[subprocess.Popen] = None
-_TUNNEL_URL: Optional[str] = None
-_TUNNEL_LOCK = threading.Lock()
-_TUNNEL_URL_EVENT = threading.Event()
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+PROBE_INTERVAL = _env_float("TUNNEL_PROBE_SEC", 15.0)
+PROBE_TIMEOUT = _env_float("TUNNEL_PROBE_TIMEOUT", 5.0)
+MAX_RTT_MS = _env_float("TUNNEL_MAX_RTT_MS", 2000.0)
+MAX_FAILS = int(_env_float("TUNNEL_MAX_FAILS", 3))
+BACKOFF_MAX = _env_float("TUNNEL_BACKOFF_MAX", 60.0)
+URL_TIMEOUT = 30.0   # start -> URL
+RACE_GRACE = 1.5     # after the first URL, wait this long for the other targets
+THROUGHPUT_EVERY = 8  # every N-th health probe also measures throughput
+THROUGHPUT_PATH = "/js/rtc.js"
+
+# Serialises start/stop of the default supervisor; created on first use
+# inside the running loop (an import-time Lock binds to the wrong loop on
+# Python < 3.10)
+_START_LOCK: Optional[asyncio.Lock] = None
 
 
 def _which(cmd: str) -> bool:
@@ -58,10 +122,14 @@ def ensure_ssh_key() -> pathlib.Path:
     return key_path
 
 
+# Precompiled: matched once per line / chunk tail, never over the whole output
+_LHR_RE = re.compile(rb"https://([a-z0-9\-]+\.lhr\.life)", re.I)
+
+
 def _extract_lhr_https(text: str) -> Optional[str]:
     """Extract the first https://<sub>.lhr.life link from text."""
-    m = re.search(r"https://([a-z0-9\-]+\.lhr\.life)(?:[^\s]*)?", (text or "").strip(), re.I)
-    return f"https://{m.group(1)}" if m else None
+    m = _LHR_RE.search((text or "").encode("utf-8", "replace"))
+    return f"https://{m.group(1).decode()}" if m else None
 
 
 def _check_pinned_fingerprint(host: str, expected: str) -> Optional[pathlib.Path]:
@@ -101,7 +169,8 @@ def _check_pinned_fingerprint(host: str, expected: str) -> Optional[pathlib.Path
             )
             return None
 
-        kh = pathlib.Path.home() / ".ssh" / "localhost_run_known_hosts"
+        # one file per host: several targets may be checked concurrently
+        kh = pathlib.Path.home() / ".ssh" / f"localhost_run_known_hosts.{host}"
         kh.parent.mkdir(parents=True, exist_ok=True)
         kh.write_text(scan.stdout)
         return kh
@@ -110,210 +179,746 @@ def _check_pinned_fingerprint(host: str, expected: str) -> Optional[pathlib.Path
         return None
 
 
-def _tunnel_reader(proc: subprocess.Popen, on_url: Callable[[str], None] | None = None) -> None:
+M_TIME_TO_URL = METRICS.histogram(
+    "securecall_tunnel_time_to_url_seconds", "Time from tunnel start to public URL, by backend",
+    buckets=(0.05, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 30.0, 60.0), labelnames=("backend",),
+)
+M_TUNNEL_BYTES = METRICS.counter(
+    "securecall_tunnel_bytes_total", "Bytes seen by a tunnel backend (process output or relayed traffic)", ("backend",)
+)
+M_THROUGHPUT = METRICS.gauge(
+    "securecall_tunnel_throughput_bytes_per_second", "Last download throughput through the public URL", ("backend",)
+)
+M_PROBE = METRICS.histogram("securecall_tunnel_probe_seconds", "RTT of /healthz probes through the public URL")
+M_PROBE_FAIL = METRICS.counter("securecall_tunnel_probe_failures_total", "Failed or too slow tunnel probes")
+M_RESTARTS = METRICS.counter("securecall_tunnel_restarts_total", "Tunnel restarts, by reason", ("reason",))
+
+
+class TunnelStats:
+    """Startup time and throughput of one backend instance."""
+
+    def __init__(self) -> None:
+        self.started_at = time.monotonic()
+        self.url_at = 0.0
+        self.bytes = 0
+        self.chunks = 0
+        self.lines = 0
+        self.throughput_bps: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        up = time.monotonic() - self.started_at
+        return {
+            "time_to_url_ms": round((self.url_at - self.started_at) * 1000, 1) if self.url_at else None,
+            "uptime_sec": round(up, 1),
+            "bytes": self.bytes,
+            "chunks": self.chunks,
+            "lines": self.lines,
+            "bytes_per_sec": round(self.bytes / up, 1) if up > 0 else 0.0,
+            "throughput_bps": self.throughput_bps,
+        }
+
+
+# ─── Backend interface ──────────────────────────────────────────────
+class TunnelBackend:
     """
-    Read tunnel process output and extract the public URL.
-    Runs in a background thread.
+    One tunnel instance. Subclasses implement ``start``, ``stop`` and
+    ``wait_exit`` and call ``_ready(url)`` once the public URL is known.
     """
-    global _TUNNEL_URL
 
-    buf = ""
-    # For some banners, we may need to send a newline to continue.
-    nudged = False
-    t0 = time.time()
+    kind = "base"
 
-    log.info("[TUNNEL] reader started, waiting for https://<sub>.lhr.life …")
-    while True:
-        ch = proc.stdout.read(1) if proc.stdout else None
-        if not ch:
-            break
+    def __init__(self, target: str, local_port: int) -> None:
+        self.target = target
+        self.local_port = local_port
+        self.url: Optional[str] = None
+        self.url_ready = asyncio.Event()
+        self.stats = TunnelStats()
 
-        buf += ch
+    @property
+    def name(self) -> str:
+        return f"{self.kind}:{self.target}" if self.target else self.kind
 
-        if ch == "\n":
-            line = buf.strip()
-            if line and not PROD:
-                log.info("[TUNNEL] %s", line)
+    @property
+    def alive(self) -> bool:
+        raise NotImplementedError
 
-            # Some variants print "your connection id is ..." and wait; nudge stdin
-            if (not nudged) and ("your connection id is" in line.lower()):
-                try:
-                    if proc.stdin:
-                        proc.stdin.write("\n")
-                        proc.stdin.flush()
-                        nudged = True
-                        log.info("[TUNNEL] nudged stdin with newline")
-                except Exception as e:
-                    log.info("[TUNNEL] nudge failed: %s", e)
+    async def start(self) -> bool:
+        """Start the tunnel; False if it cannot be started at all."""
+        raise NotImplementedError
 
-            url = _extract_lhr_https(line)
-            if url:
-                with _TUNNEL_LOCK:
-                    if _TUNNEL_URL is None:
-                        _TUNNEL_URL = url
-                        _TUNNEL_URL_EVENT.set()
-                        log.info("[TUNNEL] URL found: %s", url if not PROD else "<hidden>")
-                        if callable(on_url):
-                            try:
-                                on_url(url)
-                            except Exception as e:
-                                log.warning("[TUNNEL] on_url callback error: %s", e)
-            buf = ""
-
-        # Timed nudge in case the banner is waiting silently
-        if (not nudged) and (time.time() - t0 > 3.0):
-            try:
-                if proc.stdin:
-                    proc.stdin.write("\n")
-                    proc.stdin.flush()
-                    nudged = True
-                    log.info("[TUNNEL] timed nudge sent")
-            except Exception as e:
-                log.info("[TUNNEL] timed nudge failed: %s", e)
-
-        # Inline extraction (URL printed without newline yet)
-        if _TUNNEL_URL is None:
-            url_inline = _extract_lhr_https(buf)
-            if url_inline:
-                with _TUNNEL_LOCK:
-                    if _TUNNEL_URL is None:
-                        _TUNNEL_URL = url_inline
-                        _TUNNEL_URL_EVENT.set()
-                        log.info("[TUNNEL] URL found (inline): %s", url_inline if not PROD else "<hidden>")
-                        if callable(on_url):
-                            try:
-                                on_url(url_inline)
-                            except Exception as e:
-                                log.warning("[TUNNEL] on_url callback error: %s", e)
-
-    log.info("[TUNNEL] process output ended")
-
-
-def start_localhost_run_tunnel(local_port: int = HTTP_PORT, on_url: Callable[[str], None] | None = None) -> None:
-    """
-    Start localhost.run tunnel and capture its public URL.
+    async def stop(self) -> None:
+        raise NotImplementedError
 
-    Args:
-        local_port: local HTTP port to expose (default: core.HTTP_PORT)
-        on_url: optional callback called once with the public https URL
-    """
-    global _TUNNEL_PROC, _TUNNEL_URL
+    async def wait_exit(self) -> None:
+        """Return when the tunnel has gone down on its own."""
+        raise NotImplementedError
 
-    def _safe_call_cb(url: str) -> None:
-        if callable(on_url):
-            try:
-                on_url(url)
-            except Exception as e:
-                log.warning("[TUNNEL] on_url callback error: %s", e)
+    async def wait_url(self, timeout: float) -> Optional[str]:
+        try:
+            await asyncio.wait_for(self.url_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self.url
 
-    with _TUNNEL_LOCK:
-        # Already running
-        if _TUNNEL_PROC is not None and _TUNNEL_PROC.poll() is None:
-            log.info("[TUNNEL] already running at %s", _TUNNEL_URL or "<pending>")
-            if _TUNNEL_URL:
-                _safe_call_cb(_TUNNEL_URL)
-            return
+    def report(self) -> dict:
+        return {"backend": self.kind, "target": self.target, **self.stats.as_dict()}
 
-        # Check ssh binary
-        if not _which("ssh"):
-            log.warning(
-                "[TUNNEL] OpenSSH 'ssh' not found in PATH=%s — tunnel will not be started",
-                os.getenv("PATH"),
-            )
+    def _count(self, n: int) -> None:
+        self.stats.bytes += n
+        self.stats.chunks += 1
+        M_TUNNEL_BYTES.inc(self.kind, amount=n)
+
+    def _ready(self, url: str, how: str = "") -> None:
+        if self.url is not None:
             return
+        self.url = url
+        st = self.stats
+        st.url_at = time.monotonic()
+        M_TIME_TO_URL.observe(st.url_at - st.started_at, self.kind)
+        log.info("[TUNNEL] %s: URL found%s in %.2fs: %s", self.name, how, st.url_at - st.started_at,
+                 url if not PROD else "<hidden>")
+        self.url_ready.set()
 
-        # Prepare StrictHostKeyChecking mode and known_hosts (if pinning requested)
-        host = LOCALHOST_RUN_HOST
-        strict = "StrictHostKeyChecking=accept-new"
-        known_hosts_file = None
 
-        if PINNED_FINGERPRINT:
-            host_only = host.split("@")[-1]
-            kh = _check_pinned_fingerprint(host_only, PINNED_FINGERPRINT)
-            if not kh:
-                log.error("[TUNNEL] fingerprint verification failed, aborting tunnel start")
-                return
-            strict = "StrictHostKeyChecking=yes"
-            known_hosts_file = str(kh)
+# Read size for the tunnel output; a partial line longer than this is cut
+# (from the front) before the inline URL search.
+READ_CHUNK = 4096
+NUDGE_AFTER = 3.0
+
+
+class SshTunnel(TunnelBackend):
+    """
+    ``ssh -R`` process whose output is scanned for ``url_re``. Subclasses
+    provide the command line and turn a match into the public URL.
+    """
+
+    kind = "ssh"
+    url_re: Pattern[bytes] = _LHR_RE
+    nudge = False          # send newlines when the banner stalls
+    log_prefix = b""       # only output lines NOT starting with this are logged
+
+    def __init__(self, target: str, local_port: int) -> None:
+        super().__init__(target, local_port)
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.reader: Optional[asyncio.Future] = None
+
+    def command(self, known_hosts_file: Optional[str]) -> List[str]:
+        raise NotImplementedError
 
-        # Build command
+    def url_from(self, m: "re.Match[bytes]") -> str:
+        raise NotImplementedError
+
+    def _base_cmd(self, known_hosts_file: Optional[str]) -> List[str]:
+        strict = "StrictHostKeyChecking=yes" if known_hosts_file else "StrictHostKeyChecking=accept-new"
         cmd = [
             "ssh",
-            "-tt",
             "-o", strict,
             "-o", "ServerAliveInterval=30",
             "-o", "ExitOnForwardFailure=yes",
         ]
         if known_hosts_file:
             cmd += ["-o", f"UserKnownHostsFile={known_hosts_file}"]
-        # Reverse forward 80 -> 127.0.0.1:local_port
-        cmd += ["-R", f"80:127.0.0.1:{local_port}", host]
+        return cmd
 
-        # On Windows, no special flags required here; keep text I/O to parse banners
-        env = os.environ.copy()
-        env.setdefault("TERM", "xterm")
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
 
-        # Reset state
-        _TUNNEL_URL = None
-        _TUNNEL_URL_EVENT.clear()
+    async def start(self) -> bool:
+        if not _which("ssh"):
+            log.warning(
+                "[TUNNEL] OpenSSH 'ssh' not found in PATH=%s — %s will not be started",
+                os.getenv("PATH"), self.name,
+            )
+            return False
+        known_hosts_file = None
+        if PINNED_FINGERPRINT:
+            # ssh-keyscan may take seconds: keep it off the loop
+            host_only = self.target.split("@")[-1]
+            kh = await asyncio.to_thread(_check_pinned_fingerprint, host_only, PINNED_FINGERPRINT)
+            if not kh:
+                log.error("[TUNNEL] fingerprint verification failed for %s, skipping", self.target)
+                return False
+            known_hosts_file = str(kh)
 
-        log.info("[TUNNEL] Starting localhost.run tunnel (this may take a few seconds)…")
-        _TUNNEL_PROC = subprocess.Popen(
-            cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
+        env = os.environ.copy()
+        env.setdefault("TERM", "xterm")
+        self.stats = TunnelStats()
+        self.proc = await asyncio.create_subprocess_exec(
+            *self.command(known_hosts_file),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
             env=env,
         )
+        self.reader = asyncio.ensure_future(self._read())
+        return True
 
-        # Background reader
-        t = threading.Thread(
-            target=_tunnel_reader, args=(_TUNNEL_PROC, on_url), name="TunnelReader", daemon=True
-        )
-        t.start()
-
+    async def wait_exit(self) -> None:
+        if self.proc is not None:
+            await self.proc.wait()
 
-def stop_localhost_run_tunnel() -> None:
-    """Stop the SSH tunnel if it is running."""
-    global _TUNNEL_PROC, _TUNNEL_URL
-
-    with _TUNNEL_LOCK:
-        if _TUNNEL_PROC and _TUNNEL_PROC.poll() is None:
-            log.info("[TUNNEL] Stopping tunnel...")
+    async def stop(self) -> None:
+        proc = self.proc
+        if proc is not None and proc.returncode is None:
             try:
                 if os.name == "nt":
                     # CTRL_BREAK_EVENT works only for processes in the same console group.
                     # We try; if it fails, fall back to terminate/kill.
-                    _TUNNEL_PROC.send_signal(signal.CTRL_BREAK_EVENT)
+                    proc.send_signal(signal.CTRL_BREAK_EVENT)
                 else:
-                    _TUNNEL_PROC.terminate()
-
-                _TUNNEL_PROC.wait(timeout=3)
+                    proc.terminate()
+                await asyncio.wait_for(proc.wait(), timeout=3)
             except Exception as e:
                 log.warning("[TUNNEL] Error stopping tunnel: %s", e)
                 try:
-                    _TUNNEL_PROC.kill()
+                    proc.kill()
                 except Exception:
                     pass
+        if self.reader is not None:
+            self.reader.cancel()
+
+    async def _nudge(self, why: str) -> bool:
+        """Send a newline to ssh stdin (some banners wait for it)."""
+        try:
+            if self.proc and self.proc.stdin:
+                self.proc.stdin.write(b"\n")
+                await self.proc.stdin.drain()
+                log.info("[TUNNEL] %s", why)
+                return True
+        except Exception as e:
+            log.info("[TUNNEL] nudge failed: %s", e)
+        return False
+
+    async def _read(self) -> None:
+        """
+        Read the process output in chunks and extract the public URL.
+
+        Complete lines are logged and matched once; the unfinished tail is
+        searched only around the newly read bytes, so total work is linear in
+        the output size.
+        """
+        stdout = self.proc.stdout if self.proc else None
+        if stdout is None:
+            return
+        st = self.stats
+        nudged = not self.nudge
+        tail = b""
+
+        log.info("[TUNNEL] %s: reader started, waiting for the public URL …", self.name)
+        while True:
+            # Timed nudge in case the banner is waiting silently
+            wait = None if nudged else max(0.0, NUDGE_AFTER - (time.monotonic() - st.started_at))
+            try:
+                chunk = await asyncio.wait_for(stdout.read(READ_CHUNK), wait)
+            except asyncio.TimeoutError:
+                await self._nudge("timed nudge sent")
+                nudged = True  # once, whether or not it went through
+                continue
+            if not chunk:
+                break
+            self._count(len(chunk))
+
+            scan_from = max(0, len(tail) - 64)  # a URL may straddle the chunk border
+            tail += chunk
+            *lines, tail = tail.split(b"\n")
+            for raw in lines:
+                st.lines += 1
+                line = raw.decode("utf-8", "replace").strip()
+                if line and not PROD and not (self.log_prefix and raw.startswith(self.log_prefix)):
+                    log.info("[TUNNEL] %s", line)
+
+                # Some variants print "your connection id is ..." and wait; nudge stdin
+                if not nudged and "your connection id is" in line.lower():
+                    nudged = await self._nudge("nudged stdin with newline")
+
+                if self.url is None:
+                    m = self.url_re.search(raw)
+                    if m:
+                        self._ready(self.url_from(m))
+                scan_from = 0
+
+            if len(tail) > READ_CHUNK:
+                tail = tail[-READ_CHUNK:]
+                scan_from = 0
+            # Inline extraction (URL printed without newline yet)
+            if self.url is None and tail:
+                m = self.url_re.search(tail, scan_from)
+                if m:
+                    self._ready(self.url_from(m), " (inline)")
+
+        log.info("[TUNNEL] %s: process output ended (%s)", self.name, st.as_dict())
+
+
+class LocalhostRunTunnel(SshTunnel):
+    """localhost.run: anonymous ``nokey@`` flow, URL from the banner."""
+
+    kind = "localhost.run"
+    url_re = _LHR_RE
+    nudge = True
+
+    def __init__(self, target: str, local_port: int) -> None:
+        super().__init__(target or "nokey@localhost.run", local_port)
+
+    def command(self, known_hosts_file: Optional[str]) -> List[str]:
+        cmd = self._base_cmd(known_hosts_file)
+        # Reverse forward 80 -> 127.0.0.1:local_port
+        return cmd[:1] + ["-tt"] + cmd[1:] + ["-R", f"80:127.0.0.1:{self.local_port}", self.target]
 
-        _TUNNEL_PROC = None
-        _TUNNEL_URL = None
-        _TUNNEL_URL_EVENT.clear()
+    def url_from(self, m: "re.Match[bytes]") -> str:
+        return f"https://{m.group(1).decode()}"
+
+
+class SshRelayTunnel(SshTunnel):
+    """
+    ``ssh -R`` to your own relay (sshd with GatewayPorts or a reverse proxy
+    in front of RELAY_PORT). The URL is fixed (TUNNEL_RELAY_URL) and becomes
+    ready when ssh reports the remote forward as established.
+    """
+
+    kind = "ssh-relay"
+    url_re = re.compile(rb"remote forward success", re.I)
+    log_prefix = b"debug"
+
+    def __init__(self, target: str, local_port: int, public_url: str = "", remote_port: int = 0) -> None:
+        super().__init__(target, local_port)
+        self.public_url = (public_url or RELAY_URL).rstrip("/")
+        self.remote_port = remote_port or RELAY_PORT
+
+    async def start(self) -> bool:
+        if not self.target or not self.public_url:
+            log.warning("[TUNNEL] ssh-relay needs a target (user@host) and TUNNEL_RELAY_URL")
+            return False
+        return await super().start()
+
+    def command(self, known_hosts_file: Optional[str]) -> List[str]:
+        # -v: "remote forward success" is only printed at debug level
+        return self._base_cmd(known_hosts_file) + [
+            "-v", "-N", "-R", f"{self.remote_port}:127.0.0.1:{self.local_port}", self.target,
+        ]
+
+    def url_from(self, m: "re.Match[bytes]") -> str:
+        return self.public_url
+
+
+class LocalProxyTunnel(TunnelBackend):
+    """
+    Loopback reverse proxy: 127.0.0.1:<ephemeral> -> 127.0.0.1:local_port.
+    No external service; used to test the supervisor and as a baseline when
+    comparing backends. Counts every relayed byte.
+    """
+
+    kind = "local"
+
+    def __init__(self, target: str, local_port: int) -> None:
+        super().__init__(target, local_port)
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._closed: Optional[asyncio.Future] = None
+        self._pipes: set = set()
+
+    @property
+    def alive(self) -> bool:
+        return self.server is not None and self.server.is_serving()
+
+    async def start(self) -> bool:
+        self.stats = TunnelStats()
+        self._closed = asyncio.get_running_loop().create_future()
+        self.server = await asyncio.start_server(self._client, "127.0.0.1", int(self.target or 0))
+        port = self.server.sockets[0].getsockname()[1]
+        self._ready(f"http://127.0.0.1:{port}")
+        return True
+
+    async def _client(self, c_reader: asyncio.StreamReader, c_writer: asyncio.StreamWriter) -> None:
+        try:
+            u_reader, u_writer = await asyncio.open_connection("127.0.0.1", self.local_port)
+        except OSError:
+            c_writer.close()
+            return
+        pipes = [asyncio.ensure_future(self._pipe(c_reader, u_writer)),
+                 asyncio.ensure_future(self._pipe(u_reader, c_writer))]
+        self._pipes.update(pipes)
+        try:
+            await asyncio.gather(*pipes, return_exceptions=True)
+        finally:
+            self._pipes.difference_update(pipes)
+            for w in (u_writer, c_writer):
+                w.close()
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                self._count(len(data))
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if writer.can_write_eof():
+                try:
+                    writer.write_eof()
+                except OSError:
+                    pass
+
+    async def wait_exit(self) -> None:
+        if self._closed is not None:
+            await asyncio.shield(self._closed)
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            for t in list(self._pipes):
+                t.cancel()
+            await self.server.wait_closed()
+            self.server = None
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+
+BACKENDS: Dict[str, type] = {
+    LocalhostRunTunnel.kind: LocalhostRunTunnel,
+    SshRelayTunnel.kind: SshRelayTunnel,
+    LocalProxyTunnel.kind: LocalProxyTunnel,
+}
+
+
+def make_backend(spec: str, local_port: int) -> TunnelBackend:
+    """"localhost.run:nokey@localhost.run" / "ssh-relay:me@relay" / "local" -> backend."""
+    kind, _, target = spec.partition(":")
+    cls = BACKENDS.get(kind.strip())
+    if cls is None:
+        raise ValueError(f"unknown tunnel backend {kind!r} (known: {', '.join(BACKENDS)})")
+    return cls(target.strip(), local_port)
+
+
+# ─── Probes ─────────────────────────────────────────────────────────
+async def probe_healthz(session: aiohttp.ClientSession, url: str, timeout: float = PROBE_TIMEOUT) -> Optional[float]:
+    """RTT (ms) of GET <url>/healthz through the tunnel, or None on failure."""
+    t0 = time.perf_counter()
+    try:
+        async with session.get(url + "/healthz", timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            await resp.read()
+            if resp.status != 200:
+                return None
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+        return None
+    rtt = time.perf_counter() - t0
+    M_PROBE.observe(rtt)
+    return rtt * 1000.0
+
+
+async def probe_throughput(session: aiohttp.ClientSession, url: str, path: str = THROUGHPUT_PATH,
+                           timeout: float = PROBE_TIMEOUT) -> Optional[float]:
+    """Download rate (bytes/s) of an uncompressed static file through the tunnel."""
+    t0 = time.perf_counter()
+    size = 0
+    try:
+        async with session.get(url + path, headers={"Accept-Encoding": "identity"},
+                               timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status != 200:
+                return None
+            async for chunk in resp.content.iter_chunked(65536):
+                size += len(chunk)
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+        return None
+    dt = time.perf_counter() - t0
+    return size / dt if dt > 0 and size else None
+
+
+# ─── Supervisor ─────────────────────────────────────────────────────
+class TunnelSupervisor:
+    """
+    Keeps one healthy tunnel up: race targets, probe, restart with backoff.
+
+    URL changes go to ``on_url`` and, via ``core.announce_public_url``, to
+    connected clients. The supervisor lives on the server's event loop; its
+    URL is also read from other threads (``get_url`` / ``wait_for_url``).
+    """
+
+    def __init__(self, local_port: int = HTTP_PORT, targets: Optional[List[str]] = None,
+                 on_url: Callable[[str], None] | None = None) -> None:
+        self.local_port = local_port
+        self.targets = targets or TUNNEL_TARGETS
+        self.on_url = on_url
+        self.url: Optional[str] = None
+        self._url_lock = threading.Lock()
+        self._url_event = threading.Event()
+        self.tunnel: Optional[TunnelBackend] = None
+        self._racing: List[TunnelBackend] = []  # started by _race, not yet decided
+        self.task: Optional[asyncio.Future] = None
+        self._announce: Optional[asyncio.Future] = None  # core.announce_public_url in flight
+        self.restarts = 0
+        self.backoff = 1.0
+        self.last_rtt_ms: Optional[float] = None
+        self.probes_ok = 0
+        self.probes_failed = 0
+        self.last_reason = ""
+        self.race: Dict[str, dict] = {}
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            log.info("[TUNNEL] Starting tunnel via %s (this may take a few seconds)…", ", ".join(self.targets))
+            self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self.task = None
+        if self._announce is not None:
+            self._announce.cancel()
+            self._announce = None
+        # whatever a cancelled race left running (normally _race stops it itself)
+        racing, self._racing = self._racing, []
+        await asyncio.gather(*(t.stop() for t in racing), return_exceptions=True)
+        if self.tunnel is not None:
+            await self.tunnel.stop()
+            self.tunnel = None
+        self._publish(None)
+
+    def get_url(self) -> Optional[str]:
+        """Thread-safe: the current public URL (None while reconnecting)."""
+        with self._url_lock:
+            return self.url
+
+    def wait_for_url(self, timeout: float = 30.0) -> Optional[str]:
+        """Block (in another thread) until a URL is up; None on timeout."""
+        if self._url_event.wait(timeout):
+            return self.get_url()
+        return None
+
+    def _publish(self, url: Optional[str]) -> None:
+        """Set the current URL (None while reconnecting) and push a new one out."""
+        with self._url_lock:
+            self.url = url
+            if url:
+                self._url_event.set()
+            else:
+                self._url_event.clear()
+        if not url:
+            return
+        if callable(self.on_url):
+            try:
+                self.on_url(url)
+            except Exception as e:
+                log.warning("[TUNNEL] on_url callback error: %s", e)
+        if self._announce is not None:
+            self._announce.cancel()  # a newer URL supersedes the pending announce
+        self._announce = asyncio.ensure_future(announce_public_url(url))
+
+    def stats(self) -> dict:
+        if self.task is None:
+            return {"up": False}
+        t = self.tunnel
+        return {
+            "current": t.name if t else None,
+            "up": bool(t and t.alive and t.url),
+            "restarts": self.restarts,
+            "last_reason": self.last_reason,
+            "backoff_sec": self.backoff,
+            "last_rtt_ms": self.last_rtt_ms,
+            "probes_ok": self.probes_ok,
+            "probes_failed": self.probes_failed,
+            "race": dict(self.race),
+            **(t.report() if t else {}),
+        }
+
+    async def _run(self) -> None:
+        async with aiohttp.ClientSession() as http:
+            while True:
+                self.tunnel = await self._race(http)
+                if self.tunnel is not None:
+                    self._publish(self.tunnel.url)
+                    self.last_reason = await self._watch(http, self.tunnel)
+                    await self.tunnel.stop()
+                    self.tunnel = None
+                    self._publish(None)
+                else:
+                    self.last_reason = "no-url"
+                self.restarts += 1
+                M_RESTARTS.inc(self.last_reason)
+
+                # a successful probe resets the backoff (see _watch)
+                log.warning("[TUNNEL] restarting in %.0fs (%s)", self.backoff, self.last_reason)
+                await asyncio.sleep(self.backoff)
+                self.backoff = min(BACKOFF_MAX, self.backoff * 2)
+
+    async def _race(self, http: aiohttp.ClientSession) -> Optional[TunnelBackend]:
+        """Start every target; keep the one whose URL answers fastest."""
+        tunnels: List[TunnelBackend] = []
+        for spec in self.targets:
+            try:
+                tunnels.append(make_backend(spec, self.local_port))
+            except ValueError as e:
+                log.error("[TUNNEL] %s", e)
+        self._racing = tunnels
+        best: Optional[TunnelBackend] = None
+        try:
+            best = await self._pick(http, tunnels)
+        finally:
+            # losers, and everyone if the race was cancelled (Stop) or failed
+            self._racing = []
+            await asyncio.gather(*(t.stop() for t in tunnels if t is not best), return_exceptions=True)
+        return best
+
+    async def _pick(self, http: aiohttp.ClientSession, tunnels: List[TunnelBackend]) -> Optional[TunnelBackend]:
+        started = await asyncio.gather(*(t.start() for t in tunnels), return_exceptions=True)
+        live = [t for t, ok in zip(tunnels, started) if ok is True]
+        for t, ok in zip(tunnels, started):
+            if isinstance(ok, BaseException):
+                log.warning("[TUNNEL] %s: start failed: %s", t.name, ok)
+        self.race = {}
+        if not live:
+            return None
+
+        waits = {asyncio.ensure_future(t.wait_url(URL_TIMEOUT)): t for t in live}
+        try:
+            done, pending = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            if pending and len(live) > 1:
+                more, pending = await asyncio.wait(pending, timeout=RACE_GRACE)
+                done |= more
+        finally:
+            for f in waits:
+                if not f.done():
+                    f.cancel()
+
+        with_url = [waits[f] for f in done if not f.cancelled() and f.result()]
+        best: Optional[TunnelBackend] = None
+        if len(with_url) == 1:
+            best = with_url[0]
+        elif with_url:
+            rtts = await asyncio.gather(*(probe_healthz(http, t.url) for t in with_url))
+            for i, (t, r) in enumerate(zip(with_url, rtts)):
+                key = t.name if t.name not in self.race else f"{t.name}#{i}"
+                self.race[key] = {"rtt_ms": round(r, 1) if r is not None else None,
+                                  "time_to_url_ms": t.stats.as_dict()["time_to_url_ms"]}
+            ranked = sorted((r, i) for i, r in enumerate(rtts) if r is not None)
+            # nobody answered yet: fall back to whoever reported a URL first
+            best = with_url[ranked[0][1]] if ranked else with_url[0]
+            log.info("[TUNNEL] race: %s -> %s", self.race, best.name)
+        return best
+
+    async def _measure_throughput(self, http: aiohttp.ClientSession, tunnel: TunnelBackend) -> None:
+        bps = await probe_throughput(http, tunnel.url)
+        if bps is not None:
+            tunnel.stats.throughput_bps = round(bps, 1)
+            M_THROUGHPUT.set(bps, tunnel.kind)
+
+    async def _watch(self, http: aiohttp.ClientSession, tunnel: TunnelBackend) -> str:
+        """Probe until the tunnel must be replaced; returns the reason."""
+        fails = 0
+        probes = 0
+        exited = asyncio.ensure_future(tunnel.wait_exit())
+        try:
+            await self._measure_throughput(http, tunnel)
+            while True:
+                await asyncio.wait([exited], timeout=PROBE_INTERVAL)
+                if exited.done():
+                    return "exited"
+                rtt = await probe_healthz(http, tunnel.url)
+                self.last_rtt_ms = round(rtt, 1) if rtt is not None else None
+                if rtt is None or rtt > MAX_RTT_MS:
+                    fails += 1
+                    self.probes_failed += 1
+                    M_PROBE_FAIL.inc()
+                    log.warning("[TUNNEL] probe %s (%d/%d)", "failed" if rtt is None else f"slow: {rtt:.0f} ms",
+                                fails, MAX_FAILS)
+                    if fails >= MAX_FAILS:
+                        return "unhealthy" if rtt is None else "slow"
+                else:
+                    fails = 0
+                    self.probes_ok += 1
+                    self.backoff = 1.0
+                    probes += 1
+                    if probes % THROUGHPUT_EVERY == 0:
+                        await self._measure_throughput(http, tunnel)
+        finally:
+            exited.cancel()
+
+
+# Default instance behind the module-level API (the GUI's tunnel)
+_DEFAULT = TunnelSupervisor()
+
+
+def _start_lock() -> asyncio.Lock:
+    global _START_LOCK
+    if _START_LOCK is None:
+        _START_LOCK = asyncio.Lock()
+    return _START_LOCK
+
+
+async def start_tunnel(local_port: int = HTTP_PORT, on_url: Callable[[str], None] | None = None,
+                       targets: Optional[List[str]] = None) -> TunnelSupervisor:
+    """Start a new, independent supervised tunnel; stop it with ``await sup.stop()``."""
+    sup = TunnelSupervisor(local_port, targets, on_url)
+    sup.start()
+    return sup
+
+
+async def start_localhost_run_tunnel(local_port: int = HTTP_PORT, on_url: Callable[[str], None] | None = None,
+                                     targets: Optional[List[str]] = None) -> TunnelSupervisor:
+    """
+    Start the default supervised public tunnel and return its supervisor.
+
+    Runs on the server's event loop: ssh is an asyncio subprocess and its
+    output is read by a task, so no thread is kept per tunnel.
+
+    Args:
+        local_port: local HTTP port to expose (default: core.HTTP_PORT)
+        on_url: optional callback, called with the public URL and again
+            whenever a restart brings up a new one
+        targets: backend specs to race (default: TUNNEL_TARGETS)
+    """
+    async with _start_lock():
+        sup = _DEFAULT
+        if sup.running:
+            url = sup.get_url()
+            log.info("[TUNNEL] already running at %s", url or "<pending>")
+            sup.on_url = on_url or sup.on_url
+            if url and callable(on_url):
+                try:
+                    on_url(url)
+                except Exception as e:
+                    log.warning("[TUNNEL] on_url callback error: %s", e)
+            return sup
+
+        sup.local_port = local_port
+        sup.targets = targets or TUNNEL_TARGETS
+        sup.on_url = on_url
+        sup.start()
+        return sup
+
+
+async def stop_localhost_run_tunnel() -> None:
+    """Stop the default tunnel (and its supervisor) if it is running."""
+    async with _start_lock():
+        if _DEFAULT.task is not None:
+            log.info("[TUNNEL] Stopping tunnel...")
+            await _DEFAULT.stop()
 
 
 def wait_for_tunnel_url(timeout: float = 30.0) -> Optional[str]:
     """
-    Wait for the tunnel URL to appear.
+    Wait for the default tunnel URL to appear (from another thread).
     Returns the URL string on success, or None on timeout.
     """
-    if _TUNNEL_URL_EVENT.wait(timeout):
-        return _TUNNEL_URL
-    return None
+    return _DEFAULT.wait_for_url(timeout)
 
 
 def get_tunnel_url() -> Optional[str]:
-    """Thread-safe getter for the current tunnel URL (if already detected)."""
-    with _TUNNEL_LOCK:
-        return _TUNNEL_URL
+    """Thread-safe getter for the default tunnel URL (None while reconnecting)."""
+    return _DEFAULT.get_url()
+
+
+def tunnel_stats() -> dict:
+    """Default supervisor state, probe RTT, race results and the current backend's report."""
+    return _DEFAULT.stats()
@@ -0,0 +1,155 @@
+# wire.py
+# ────────────────────────────────────────────────────────────────────
+# Формат кадров WS-сигналинга.
+# • json    — текстовые кадры (всегда доступен, fallback)
+# • msgpack — бинарные кадры; ct/iv/pub идут сырыми байтами вместо
+#   base64, SDP — строкой MessagePack без JSON-экранирования \r\n.
+#   Нужен необязательный модуль msgpack.
+# Формат выбирается через Sec-WebSocket-Protocol: клиент предлагает
+# "mp.token.<T>" и "token.<T>", сервер выбирает первый, который умеет.
+# Адресные кадры между сессиями одного формата пересылаются как есть:
+# with_field() дописывает "from" в конец исходного кадра, тело (SDP,
+# шифротекст) не пересобирается.
+# ────────────────────────────────────────────────────────────────────
+
+import base64
+import binascii
+import json
+from typing import Callable, Dict, Optional, Union
+
+try:  # необязательная зависимость
+    import msgpack  # type: ignore
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+FORMATS = (MSGPACK, JSON) if msgpack is not None else (JSON,)
+
+# Префикс субпротокола для бинарного формата
+PROTO_PREFIX = {MSGPACK: "mp."}
+
+# Поля, которые в бинарном формате — байты, а в JSON — base64
+BINARY_FIELDS = ("ct", "iv", "pub")
+
+Frame_t = Union[str, bytes]
+
+# Счётчики по формату: кадры/байты на входе и закодированные кадры на выходе
+STATS: Dict[str, Dict[str, int]] = {
+    f: {"in_frames": 0, "in_bytes": 0, "out_frames": 0, "out_bytes": 0, "passthrough": 0} for f in (JSON, MSGPACK)
+}
+
+
+def split_protocol(item: str):
+    """'mp.token.X' -> ('msgpack', 'token.X'); 'token.X' -> ('json', 'token.X')."""
+    for fmt, prefix in PROTO_PREFIX.items():
+        if item.startswith(prefix):
+            return fmt, item[len(prefix):]
+    return JSON, item
+
+
+def _map_binary(payload: dict, fn: Callable) -> dict:
+    """Применяет fn к BINARY_FIELDS верхнего уровня и к словарям внутри списков."""
+    out = None
+    for k, v in payload.items():
+        if k in BINARY_FIELDS:
+            nv = fn(v)
+        elif isinstance(v, list) and v and isinstance(v[0], dict):
+            nv = [_map_binary(x, fn) if isinstance(x, dict) else x for x in v]
+        else:
+            continue
+        if nv is not v:
+            if out is None:
+                out = dict(payload)
+            out[k] = nv
+    return payload if out is None else out
+
+
+def json_default(o):
+    """default= для json.dumps: байты (из бинарных клиентов) → base64."""
+    if isinstance(o, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(o)).decode("ascii")
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+
+def _from_b64(v):
+    if isinstance(v, str):
+        try:
+            return base64.b64decode(v.replace("-", "+").replace("_", "/"), validate=True)
+        except (binascii.Error, ValueError):
+            return v
+    return v
+
+
+def decode(data: Frame_t, fmt: str) -> Optional[dict]:
+    """Разбирает входящий кадр; None — мусор или не тот тип кадра."""
+    try:
+        if fmt == MSGPACK:
+            if not isinstance(data, (bytes, bytearray)):
+                return None
+            obj = msgpack.unpackb(data, raw=False)
+        else:
+            if not isinstance(data, str):
+                return None
+            obj = json.loads(data)
+    except Exception:
+        return None
+    st = STATS[fmt]
+    st["in_frames"] += 1
+    st["in_bytes"] += len(data)
+    return obj if isinstance(obj, dict) else None
+
+
+def encode(payload: dict, fmt: str) -> Frame_t:
+    if fmt == MSGPACK:
+        data = msgpack.packb(_map_binary(payload, _from_b64), use_bin_type=True)
+    else:
+        data = json.dumps(payload, default=json_default)
+    st = STATS[fmt]
+    st["out_frames"] += 1
+    st["out_bytes"] += len(data)
+    return data
+
+
+def with_field(frame: Frame_t, fmt: str, key: str, value: str) -> Frame_t:
+    """
+    Дописывает key=value в конец исходного кадра-объекта без разбора тела.
+    Кадр уже прошёл decode() (валидный объект без хвоста). Одноимённое
+    поле клиента перекрывается: и JSON.parse, и MessagePack-декодеры
+    берут последнее значение ключа.
+    """
+    STATS[fmt]["passthrough"] += 1
+    if fmt == MSGPACK:
+        c = frame[0]
+        if 0x80 <= c < 0x8F:            # fixmap
+            head, rest = bytes((c + 1,)), frame[1:]
+        elif c == 0x8F:                 # fixmap(15) → map16
+            head, rest = b"\xde\x00\x10", frame[1:]
+        elif c == 0xDE:
+            n = int.from_bytes(frame[1:3], "big") + 1
+            head = b"\xde" + n.to_bytes(2, "big") if n <= 0xFFFF else b"\xdf" + n.to_bytes(4, "big")
+            rest = frame[3:]
+        else:                           # 0xDF
+            head, rest = b"\xdf" + (int.from_bytes(frame[1:5], "big") + 1).to_bytes(4, "big"), frame[5:]
+        return b"".join((head, rest, msgpack.packb(key), msgpack.packb(value)))
+    body = frame.rstrip()
+    return f"{body[:-1]},{json.dumps(key)}:{json.dumps(value)}}}"
+
+
+class Frame:
+    """Исходящий payload, закодированный не более одного раза на формат."""
+
+    __slots__ = ("payload", "_cache")
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+        self._cache: Dict[str, Frame_t] = {}
+
+    def get(self, fmt: str) -> Frame_t:
+        data = self._cache.get(fmt)
+        if data is None:
+            data = self._cache[fmt] = encode(self.payload, fmt)
+        return data
+
+
+__all__ = ["JSON", "MSGPACK", "FORMATS", "Frame", "decode", "encode", "json_default", "split_protocol", "with_field", "STATS"]
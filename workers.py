@@ -0,0 +1,338 @@
+# workers.py
+# ────────────────────────────────────────────────────────────────────
+# Многопроцессный сигналинг: N воркеров слушают один HTTP_PORT через
+# SO_REUSEPORT (ядро раздаёт соединения), а членство в комнатах и
+# адресные кадры согласуются через локальную шину — брокер на
+# Unix-domain сокете в процессе-супервизоре.
+#
+# Протокол шины: одна JSON-строка на сообщение, поле "op":
+#   sub/unsub {room}              — воркер держит/отпустил комнату
+#   claim     {room, id, cap, req} — место в комнате до апгрейда WS;
+#             брокер отвечает claimed {req, ok} (счёт мест — у брокера)
+#   members   {room, members}     — снимок чужих пиров (ответ на sub)
+#   join/name/leave {room, id, name?}
+#   bcast     {room, data}        — рассылка по комнате (чат)
+#   fwd       {room, to, typ, payload} — адресный кадр владельцу пира
+#             (кодируется в формат сессии получателя на его воркере)
+#
+# Запуск:  python workers.py --workers 4 --max-peers 10
+# (только Linux/BSD; на других ОС — один процесс без шины)
+# ────────────────────────────────────────────────────────────────────
+
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import signal
+import socket
+import tempfile
+from typing import Dict, Optional, Set, Tuple
+
+import core
+import wire
+from core import log
+
+
+def reuseport_supported() -> bool:
+    return hasattr(socket, "SO_REUSEPORT") and hasattr(socket, "AF_UNIX")
+
+
+# Кадр на шине = WS-кадр (до MAX_MSG_SIZE) + конверт; с запасом
+BUS_LINE_LIMIT = 4 * core.MAX_MSG_SIZE
+
+
+def _encode(msg: dict) -> bytes:
+    return json.dumps(msg, separators=(",", ":"), default=wire.json_default).encode("utf-8") + b"\n"
+
+
+# ─── Брокер (процесс-супервизор) ────────────────────────────────────
+class BusBroker:
+    """
+    Хранит членство (room -> pid -> (воркер, имя)) и подписки воркеров
+    на комнаты; раздаёт события только подписчикам комнаты. Места в
+    комнате выдаёт он же (claim): участники + выданные, но ещё не
+    вошедшие места не превышают cap на всех воркерах вместе.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._subs: Dict[str, Set[asyncio.StreamWriter]] = {}
+        self._members: Dict[str, Dict[str, Tuple[asyncio.StreamWriter, str]]] = {}
+        self._claims: Dict[str, Dict[str, asyncio.StreamWriter]] = {}  # room -> pid -> воркер
+        self.relayed = 0
+        self.denied = 0
+
+    async def start(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path, limit=BUS_LINE_LIMIT)
+        log.info("[BUS] broker on %s", self.path)
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _fanout(self, room: str, msg: dict, origin: Optional[asyncio.StreamWriter]) -> None:
+        subs = self._subs.get(room)
+        if not subs:
+            return
+        data = _encode(msg)
+        for w in subs:
+            if w is not origin:
+                w.write(data)
+                self.relayed += 1
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        rooms: Set[str] = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except Exception:
+                    continue
+                op = msg.get("op")
+                room = msg.get("room", "")
+
+                if op == "sub":
+                    rooms.add(room)
+                    self._subs.setdefault(room, set()).add(writer)
+                    members = [
+                        {"id": pid, "name": name}
+                        for pid, (owner, name) in self._members.get(room, {}).items()
+                        if owner is not writer
+                    ]
+                    if members:
+                        writer.write(_encode({"op": "members", "room": room, "members": members}))
+                elif op == "unsub":
+                    rooms.discard(room)
+                    self._unsub(room, writer)
+                elif op == "claim":
+                    writer.write(_encode(self._claim(room, msg, writer)))
+                elif op == "join":
+                    self._drop_claim(room, msg["id"])
+                    self._members.setdefault(room, {})[msg["id"]] = (writer, msg.get("name") or "")
+                    self._fanout(room, msg, writer)
+                elif op == "name":
+                    m = self._members.get(room, {})
+                    if msg.get("id") in m:
+                        m[msg["id"]] = (writer, msg.get("name") or "")
+                    self._fanout(room, msg, writer)
+                elif op == "leave":
+                    self._drop_claim(room, msg.get("id", ""))
+                    self._drop_member(room, msg.get("id", ""))
+                    self._fanout(room, msg, writer)
+                elif op == "bcast":
+                    self._fanout(room, msg, writer)
+                elif op == "fwd":
+                    owner = self._members.get(room, {}).get(msg.get("to", ""))
+                    if owner is not None:
+                        owner[0].write(_encode(msg))
+                        self.relayed += 1
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            log.warning("[BUS] worker connection dropped: %s", e)
+        finally:
+            # воркер умер: его пиры и выданные ему места уходят из всех комнат
+            for room, c in list(self._claims.items()):
+                for pid in [p for p, owner in c.items() if owner is writer]:
+                    self._drop_claim(room, pid)
+            for room, m in list(self._members.items()):
+                for pid in [p for p, (owner, _n) in m.items() if owner is writer]:
+                    self._drop_member(room, pid)
+                    self._fanout(room, {"op": "leave", "room": room, "id": pid}, writer)
+            for room in rooms:
+                self._unsub(room, writer)
+            writer.close()
+
+    def _claim(self, room: str, msg: dict, writer: asyncio.StreamWriter) -> dict:
+        pid = msg.get("id", "")
+        claims = self._claims.setdefault(room, {})
+        taken = len(self._members.get(room, {})) + len(claims)
+        ok = bool(pid) and taken < int(msg.get("cap") or 0)
+        if ok:
+            claims[pid] = writer
+        else:
+            self.denied += 1
+            if not claims:
+                del self._claims[room]
+        return {"op": "claimed", "room": room, "req": msg.get("req"), "ok": ok}
+
+    def _drop_claim(self, room: str, pid: str) -> None:
+        c = self._claims.get(room)
+        if c is not None:
+            c.pop(pid, None)
+            if not c:
+                del self._claims[room]
+
+    def _unsub(self, room: str, writer: asyncio.StreamWriter) -> None:
+        subs = self._subs.get(room)
+        if subs is not None:
+            subs.discard(writer)
+            if not subs:
+                del self._subs[room]
+
+    def _drop_member(self, room: str, pid: str) -> None:
+        m = self._members.get(room)
+        if m is not None:
+            m.pop(pid, None)
+            if not m:
+                del self._members[room]
+
+
+# ─── Клиент шины (процесс-воркер) ───────────────────────────────────
+class BusClient:
+    """Подключение воркера к брокеру; входящие события уходят в core._on_bus_event."""
+
+    def __init__(self, path: str, worker_id: int):
+        self.path = path
+        self.worker_id = worker_id
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._requests: Dict[int, asyncio.Future] = {}
+        self._next_req = 0
+        self.sent = 0
+        self.received = 0
+
+    async def connect(self) -> None:
+        reader, writer = await asyncio.open_unix_connection(self.path, limit=BUS_LINE_LIMIT)
+        self._writer = writer
+        self._reader_task = asyncio.create_task(self._read(reader), name="bus-reader")
+
+    def send(self, msg: dict) -> None:
+        w = self._writer
+        if w is None or w.is_closing():
+            return
+        w.write(_encode(msg))
+        self.sent += 1
+
+    async def claim(self, room: str, pid: str, cap: int, timeout: float = 2.0) -> bool:
+        """Просит у брокера место в комнате; нет ответа за timeout — отказ."""
+        w = self._writer
+        if w is None or w.is_closing():
+            return False
+        self._next_req += 1
+        req = self._next_req
+        fut = self._requests[req] = asyncio.get_running_loop().create_future()
+        self.send({"op": "claim", "room": room, "id": pid, "cap": cap, "req": req})
+        try:
+            return bool(await asyncio.wait_for(fut, timeout))
+        except asyncio.TimeoutError:
+            log.warning("[BUS] claim for room timed out (worker %d)", self.worker_id)
+            # место могло быть выдано после таймаута — вернём его
+            self.send({"op": "leave", "room": room, "id": pid})
+            return False
+        finally:
+            self._requests.pop(req, None)
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            line = await reader.readline()
+            if not line:
+                log.warning("[BUS] worker %d lost broker connection", self.worker_id)
+                for fut in self._requests.values():
+                    if not fut.done():
+                        fut.set_result(False)
+                return
+            try:
+                msg = json.loads(line)
+            except Exception:
+                continue
+            self.received += 1
+            if msg.get("op") == "claimed":
+                fut = self._requests.get(msg.get("req"))
+                if fut is not None and not fut.done():
+                    fut.set_result(msg.get("ok"))
+                continue
+            try:
+                await core._on_bus_event(msg)
+            except Exception as e:
+                log.warning("[BUS] event %s failed: %s", msg.get("op"), e)
+
+
+# ─── Процессы ───────────────────────────────────────────────────────
+async def _worker(worker_id: int, max_peers: int, bus_path: str) -> None:
+    bus = BusClient(bus_path, worker_id)
+    await bus.connect()
+    core.BUS = bus
+    await core.start_http_server(max_peers=max_peers, reuse_port=True)
+    log.info("[WORKERS] worker %d (pid=%d) ready", worker_id, os.getpid())
+    await asyncio.Event().wait()
+
+
+def _worker_main(worker_id: int, max_peers: int, bus_path: str) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # останавливает супервизор
+    try:
+        asyncio.run(_worker(worker_id, max_peers, bus_path))
+    except KeyboardInterrupt:
+        pass
+
+
+async def serve(workers: int, max_peers: int = 10) -> None:
+    """Поднимает брокер и `workers` процессов-воркеров; ждёт до отмены."""
+    if workers <= 1 or not reuseport_supported():
+        if workers > 1:
+            log.warning("[WORKERS] SO_REUSEPORT/AF_UNIX unavailable, running single process")
+        await core.start_udp_responder()
+        await core.start_http_server(max_peers=max_peers)
+        await asyncio.Event().wait()
+        return
+
+    bus_path = os.path.join(tempfile.gettempdir(), f"securecall-bus-{os.getpid()}.sock")
+    broker = BusBroker(bus_path)
+    await broker.start()
+    # комнаты живут в воркерах, у супервизора их нет: отвечаем без нагрузки
+    await core.start_udp_responder(load=False)
+
+    ctx = mp.get_context("spawn")
+    procs = []
+    for i in range(workers):
+        p = ctx.Process(target=_worker_main, args=(i, max_peers, bus_path), name=f"SignalWorker-{i}", daemon=True)
+        p.start()
+        procs.append(p)
+    log.info("[WORKERS] %d workers on port %d", workers, core.HTTP_PORT)
+
+    try:
+        while True:
+            await asyncio.sleep(1.0)
+            for i, p in enumerate(procs):
+                if not p.is_alive():
+                    log.warning("[WORKERS] worker %d exited (%s), restarting", i, p.exitcode)
+                    procs[i] = ctx.Process(
+                        target=_worker_main, args=(i, max_peers, bus_path), name=f"SignalWorker-{i}", daemon=True
+                    )
+                    procs[i].start()
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join(timeout=3)
+        await broker.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="SecureCall multi-process signaling server")
+    ap.add_argument("--workers", "-n", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--max-peers", type=int, default=10)
+    args = ap.parse_args()
+    try:
+        asyncio.run(serve(args.workers, args.max_peers))
+    except KeyboardInterrupt:
+        pass
+
+
+__all__ = ["BusBroker", "BusClient", "serve", "reuseport_supported"]
+
+
+if __name__ == "__main__":
+    main()